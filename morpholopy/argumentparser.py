@@ -25,6 +25,33 @@ class ArgumentParser(object):
     number_of_galaxies: int
     # Minimum stellar mass. Haloes with smaller stellar masses won't be processed
     min_stellar_mass: unyt.array.unyt_quantity
+    # Whether to match all catalogue particles to the snapshot in one pass
+    bulk_id_matching: bool
+    # Whether to save and reuse the halo index from the bulk id matching
+    cache_halo_index: bool
+    # Whether to read only the snapshot cells around the selected haloes
+    region_restricted_reads: bool
+    # Number of processes computing the properties of the galaxies
+    number_of_workers: int
+    # Whether to distribute the haloes over MPI ranks
+    use_mpi: bool
+
+    # Number of processes drawing the galaxy images
+    number_of_render_workers: int
+    # Directory where the data for combined plots is spilled; None keeps it in memory
+    combined_data_spill_directory: Optional[str]
+    # Whether to aggregate the data for combined plots into 2D histograms
+    combined_histograms: bool
+    # Whether to store the particle data of the haloes in single precision
+    single_precision: bool
+
+    # Whether to measure the galaxy shapes with the iterative reduced inertia tensor
+    iterative_shapes: bool
+
+    # Directory with the galaxy cutout files; None reads the particles from the snapshots
+    cutout_directory: Optional[str]
+    # Whether to only extract the particles of the selected haloes into cutout files
+    extract_cutouts: bool
 
     def __init__(self):
 
@@ -98,8 +125,110 @@ class ArgumentParser(object):
             default=10,
         )
 
+        parser.add_argument(
+            "-b",
+            "--bulk-id-matching",
+            help="Match all particles from the halo catalogue to the snapshot in one "
+            "pass before the loop over haloes. Faster when most haloes are analysed.",
+            action="store_true",
+        )
+
+        parser.add_argument(
+            "--no-halo-index-cache",
+            help="Do not save the halo index from the bulk id matching next to the "
+            "catalogue, and do not reuse the one saved by a previous run.",
+            action="store_true",
+        )
+
+        parser.add_argument(
+            "-r",
+            "--region-restricted-reads",
+            help="Read only the snapshot cells within 30 kpc of the centres of the "
+            "selected haloes. Reduces memory and I/O for large boxes.",
+            action="store_true",
+        )
+
+        parser.add_argument(
+            "-w",
+            "--workers",
+            help="Number of processes computing the properties of the galaxies. "
+            "Default: 1",
+            required=False,
+            type=int,
+            default=1,
+        )
+
+        parser.add_argument(
+            "--render-workers",
+            help="Number of processes drawing the images of the individual galaxies "
+            "while the galaxies are analysed. With 0, the images are drawn in the "
+            "analysis loop, as always with --mpi or more than one worker. Default: 0",
+            required=False,
+            type=int,
+            default=0,
+        )
+
+        parser.add_argument(
+            "--mpi",
+            help="Distribute the haloes over MPI ranks (requires mpi4py). Run the "
+            "script with mpirun; rank 0 collects the results and makes the plots.",
+            action="store_true",
+        )
+
+        parser.add_argument(
+            "--spill-combined-data",
+            help="Directory where the spatially resolved data of all galaxies for "
+            "the combined plots is written instead of being kept in memory.",
+            required=False,
+            type=str,
+            default=None,
+        )
+
+        parser.add_argument(
+            "--combined-histograms",
+            help="Aggregate the spatially resolved data for the combined plots into "
+            "2D histograms as each galaxy is finished, instead of keeping every pixel. "
+            "Uses constant memory; the combined plots show binned data.",
+            action="store_true",
+        )
+
+        parser.add_argument(
+            "--single-precision",
+            help="Store the particle data of the haloes in single precision. Halves "
+            "the memory traffic of the per-galaxy computations.",
+            action="store_true",
+        )
+
+        parser.add_argument(
+            "--iterative-shapes",
+            help="Measure the axis ratios of the galaxies with the iterative reduced "
+            "inertia tensor (Dubinski & Carlberg 1991) instead of the one-pass tensor.",
+            action="store_true",
+        )
+
+        parser.add_argument(
+            "--cutouts",
+            help="Directory with the galaxy cutout files. The particles of the "
+            "selected haloes are read from the cutout file of each run instead of "
+            "the snapshot.",
+            required=False,
+            type=str,
+            default=None,
+        )
+
+        parser.add_argument(
+            "--extract-cutouts",
+            help="Only write the gas and stellar particles of the selected haloes of "
+            "each run into a cutout file in the --cutouts directory, then stop. "
+            "Later runs with --cutouts do not read the snapshots.",
+            action="store_true",
+        )
+
         args = parser.parse_args()
 
+        if args.extract_cutouts and args.cutouts is None:
+            parser.error("--extract-cutouts requires --cutouts")
+
         self.snapshot_list = args.snapshots
         self.catalogue_list = args.catalogues
         self.directory_list = args.input_directories
@@ -114,6 +243,18 @@ class ArgumentParser(object):
         self.number_of_inputs = len(args.snapshots)
         self.number_of_galaxies = args.galaxy_number
         self.min_stellar_mass = unyt.unyt_quantity(args.min_stellar_mass, "Msun")
+        self.bulk_id_matching = args.bulk_id_matching
+        self.cache_halo_index = not args.no_halo_index_cache
+        self.region_restricted_reads = args.region_restricted_reads
+        self.number_of_workers = args.workers
+        self.number_of_render_workers = args.render_workers
+        self.use_mpi = args.mpi
+        self.combined_data_spill_directory = args.spill_combined_data
+        self.combined_histograms = args.combined_histograms
+        self.single_precision = args.single_precision
+        self.iterative_shapes = args.iterative_shapes
+        self.cutout_directory = args.cutouts
+        self.extract_cutouts = args.extract_cutouts
 
         print("Parsed arguments:")
         print("---------------------\n")
@@ -127,4 +268,16 @@ class ArgumentParser(object):
         print(
             f"Log10 of Minimum stellar mass: {log10(self.min_stellar_mass.value)} Msun"
         )
+        print(f"Bulk id matching: {self.bulk_id_matching}")
+        print(f"Cache halo index: {self.cache_halo_index}")
+        print(f"Region-restricted reads: {self.region_restricted_reads}")
+        print(f"Number of workers: {self.number_of_workers}")
+        print(f"Number of render workers: {self.number_of_render_workers}")
+        print(f"MPI mode: {self.use_mpi}")
+        print(f"Combined data spill directory: {self.combined_data_spill_directory}")
+        print(f"Combined histograms: {self.combined_histograms}")
+        print(f"Single precision: {self.single_precision}")
+        print(f"Iterative shapes: {self.iterative_shapes}")
+        print(f"Cutout directory: {self.cutout_directory}")
+        print(f"Extract cutouts: {self.extract_cutouts}")
         print("")
@@ -4,16 +4,27 @@ Description here
 
 from argumentparser import ArgumentParser
 
-from plotter.plot_galaxy import visualize_galaxy
+from plotter.plot_galaxy import visualize_galaxy, ImageRenderer
 from plotter.KS_relation import make_KS_plots, calculate_surface_densities
 from plotter.KS_comparison import make_comparison_plots
 from plotter.plot_morphology import write_morphology_data_to_file, plot_morphology
 from plotter.plot_surface_densities import plot_surface_densities
 from object import simulation_data
+from object.galaxy_cutouts import GalaxyCutouts
+from object.results_store import ResultsStore
+from object.unitilies.helper_functions import partition_by_cost
 from plotter.loadplots import loadGalaxyPlots
 from plotter import html
+import numpy as np
 from time import time
 from tqdm import tqdm
+from multiprocessing import get_context
+from typing import Dict, Tuple
+
+# Arguments of the halo loop inherited by the worker processes. The workers are
+# forked, so the large read-only arrays held by SimInfo (the halo index and the
+# snapshot fields) are shared with the parent process instead of being pickled
+_worker_arguments: Dict = {}
 
 
 def compute_galaxy_morpholopy(
@@ -21,6 +32,8 @@ def compute_galaxy_morpholopy(
     halo_counter: int,
     num_galaxies: int,
     output_path: str,
+    results_store: ResultsStore,
+    renderer: ImageRenderer,
 ) -> None:
     """
     Computes morphological properties of galaxies from halo catalogue
@@ -37,6 +50,12 @@ def compute_galaxy_morpholopy(
 
     output_path: str
     Path to the output directory
+
+    results_store: ResultsStore
+    Store receiving the tables of the galaxy
+
+    renderer: ImageRenderer
+    Renderer drawing the images of the galaxy
     """
 
     # Read particle data for a specific halo
@@ -57,9 +76,6 @@ def compute_galaxy_morpholopy(
         gas_data, halo_counter, 0
     )
 
-    # Calculate stellar luminosities
-    star_abmags = sim_info.calculate_luminosities(stars_data)
-
     # Calculate surface densities for HI+H2 gas ..
     calculate_surface_densities(
         gas_data, gas_ang_momentum, sim_info.halo_data, halo_counter
@@ -67,30 +83,272 @@ def compute_galaxy_morpholopy(
 
     # Make plots for individual galaxies, perhaps.. only first 10
     if halo_counter < num_galaxies:
-        visualize_galaxy(
-            stars_data,
-            gas_data,
-            star_abmags,
-            stars_ang_momentum,
-            gas_ang_momentum,
-            sim_info.halo_data,
-            halo_counter,
-            output_path,
-            sim_info.simulation_name,
+
+        # Stellar luminosities are only used by the galaxy images, so the other
+        # haloes skip the photometry (and reading the fields it needs)
+        star_abmags = sim_info.calculate_luminosities(stars_data)
+
+        renderer.submit(
+            visualize_galaxy(
+                stars_data,
+                gas_data,
+                star_abmags,
+                stars_ang_momentum,
+                gas_ang_momentum,
+                sim_info.halo_data,
+                halo_counter,
+                output_path,
+                sim_info.simulation_name,
+            )
         )
 
         make_KS_plots(
             gas_data,
             stars_ang_momentum,
             halo_counter,
-            output_path,
-            sim_info.simulation_name,
+            results_store,
             sim_info.combined_data,
         )
 
     return
 
 
+def compute_galaxy_results(
+    sim_info: simulation_data.SimInfo,
+    halo_counter: int,
+    num_galaxies: int,
+    output_path: str,
+    results_store: ResultsStore,
+    renderer: ImageRenderer,
+) -> Tuple[
+    int,
+    Tuple[np.ndarray, np.ndarray, np.ndarray],
+    simulation_data.CombinedData,
+    Dict,
+]:
+    """
+    Computes morphological properties of a galaxy and returns the results that
+    need to be merged into the halo catalogue and the results store of the process
+    collecting them
+
+    Parameters
+    ----------
+    sim_info: simulation_data.SimInfo
+    Container with all simulation data
+
+    halo_counter: int
+    Index of the halo in the halo catalogue
+
+    num_galaxies: int
+    Number of galaxies to visualise
+
+    output_path: str
+    Path to the output directory
+
+    results_store: ResultsStore
+    Store collecting the tables of the galaxy until they are returned
+
+    renderer: ImageRenderer
+    Renderer drawing the images of the galaxy
+
+    Returns
+    -------
+    Output: Tuple[int, Tuple[np.ndarray, np.ndarray, np.ndarray], CombinedData, Dict]
+    Index of the halo, its morphology and surface density data, its spatially
+    resolved data for combined plots, and its tables for the results store
+    """
+
+    # Collect the spatially resolved data of this galaxy only
+    run_combined_data = sim_info.combined_data
+    sim_info.combined_data = simulation_data.CombinedData()
+
+    compute_galaxy_morpholopy(
+        sim_info=sim_info,
+        num_galaxies=num_galaxies,
+        output_path=output_path,
+        results_store=results_store,
+        renderer=renderer,
+        halo_counter=halo_counter,
+    )
+
+    combined_data, sim_info.combined_data = sim_info.combined_data, run_combined_data
+
+    return (
+        halo_counter,
+        sim_info.halo_data.get_galaxy_results(halo_counter),
+        combined_data,
+        results_store.take_pending(),
+    )
+
+
+def compute_galaxy_morpholopy_in_worker(
+    halo_counter: int,
+) -> Tuple[
+    int,
+    Tuple[np.ndarray, np.ndarray, np.ndarray],
+    simulation_data.CombinedData,
+    Dict,
+]:
+    """
+    Computes morphological properties of a galaxy in a worker process
+
+    Parameters
+    ----------
+    halo_counter: int
+    Index of the halo in the halo catalogue
+
+    Returns
+    -------
+    Output: Tuple[int, Tuple[np.ndarray, np.ndarray, np.ndarray], CombinedData, Dict]
+    Output of compute_galaxy_results
+    """
+
+    return compute_galaxy_results(halo_counter=halo_counter, **_worker_arguments)
+
+
+def compute_galaxies_in_pool(
+    sim_info: simulation_data.SimInfo,
+    num_galaxies: int,
+    output_path: str,
+    results_store: ResultsStore,
+    number_of_workers: int,
+) -> None:
+    """
+    Computes morphological properties of all galaxies using a pool of processes.
+    The results are merged in the order of the haloes in the halo catalogue, so
+    they do not depend on the number of workers. Only the parent process writes
+    to the results store
+
+    Parameters
+    ----------
+    sim_info: simulation_data.SimInfo
+    Container with all simulation data
+
+    num_galaxies: int
+    Number of galaxies to visualise
+
+    output_path: str
+    Path to the output directory
+
+    results_store: ResultsStore
+    Store with the results of the run
+
+    number_of_workers: int
+    Number of worker processes
+    """
+
+    # Read the snapshot fields before forking so that the workers share them
+    sim_info.preload_particle_fields()
+
+    # Morphology of all haloes is computed in batches before forking
+    sim_info.calculate_morphology_of_haloes()
+
+    # The workers analyse the galaxies in parallel, so each draws its images itself
+    _worker_arguments.update(
+        sim_info=sim_info,
+        num_galaxies=num_galaxies,
+        output_path=output_path,
+        results_store=results_store,
+        renderer=ImageRenderer(0),
+    )
+
+    number_of_haloes = sim_info.halo_data.number_of_haloes
+
+    with get_context("fork").Pool(number_of_workers) as pool:
+        for halo_counter, galaxy_results, combined_data, tables in tqdm(
+            pool.imap(compute_galaxy_morpholopy_in_worker, range(number_of_haloes)),
+            total=number_of_haloes,
+        ):
+            sim_info.halo_data.add_galaxy_results(galaxy_results, halo_counter)
+            sim_info.combined_data.extend(combined_data)
+            results_store.add_pending(tables)
+            results_store.flush()
+
+    _worker_arguments.clear()
+
+    return
+
+
+def compute_galaxies_with_mpi(
+    sim_info: simulation_data.SimInfo,
+    num_galaxies: int,
+    output_path: str,
+    results_store: ResultsStore,
+    renderer: ImageRenderer,
+    comm,
+) -> bool:
+    """
+    Computes morphological properties of all galaxies distributed over MPI ranks.
+    The haloes are assigned to the ranks based on their particle counts. Each rank
+    reads only the snapshot cells around its haloes, and the results are gathered
+    and merged in the order of the haloes on rank 0, which also writes the results
+    store
+
+    Parameters
+    ----------
+    sim_info: simulation_data.SimInfo
+    Container with all simulation data
+
+    num_galaxies: int
+    Number of galaxies to visualise
+
+    output_path: str
+    Path to the output directory
+
+    results_store: ResultsStore
+    Store with the results of the run
+
+    renderer: ImageRenderer
+    Renderer drawing the images of the galaxies of this rank
+
+    comm: mpi4py.MPI.Comm
+    MPI communicator
+
+    Returns
+    -------
+    Output: bool
+    True on rank 0, which holds the merged results
+    """
+
+    rank = comm.Get_rank()
+
+    costs = sim_info.number_of_particles_in_haloes(sim_info.halo_data.halo_ids)
+    halo_counters = partition_by_cost(costs, comm.Get_size())[rank]
+
+    if len(halo_counters) > 0:
+        sim_info.restrict_snapshot_to_haloes(halo_counters)
+        sim_info.calculate_morphology_of_haloes(halo_counters)
+
+    results = [
+        compute_galaxy_results(
+            sim_info=sim_info,
+            halo_counter=halo_counter,
+            num_galaxies=num_galaxies,
+            output_path=output_path,
+            results_store=results_store,
+            renderer=renderer,
+        )
+        for halo_counter in tqdm(halo_counters, disable=rank > 0)
+    ]
+
+    results = comm.gather(results, root=0)
+
+    if rank > 0:
+        return False
+
+    for halo_counter, galaxy_results, combined_data, tables in sorted(
+        [result for rank_results in results for result in rank_results],
+        key=lambda result: result[0],
+    ):
+        sim_info.halo_data.add_galaxy_results(galaxy_results, halo_counter)
+        sim_info.combined_data.extend(combined_data)
+        results_store.add_pending(tables)
+
+    results_store.flush()
+
+    return True
+
+
 def main(config: ArgumentParser):
 
     time_start = time()
@@ -98,6 +356,28 @@ def main(config: ArgumentParser):
     output_number_of_galaxies_list = []
     web = None
 
+    comm = None
+    if config.use_mpi:
+        from mpi4py import MPI
+
+        comm = MPI.COMM_WORLD
+
+        # Extract mode: rank 0 writes the cutout files on its own, and the other
+        # ranks do not load the data at all
+        if config.extract_cutouts:
+            if comm.Get_rank() > 0:
+                return
+            comm = None
+
+    # Processes drawing the galaxy images, started before any data is loaded. In
+    # the pool mode, the workers draw the images of their galaxies themselves.
+    # Under MPI, every rank draws its images itself rather than forking a pool
+    # next to the other ranks
+    number_of_render_workers = config.number_of_render_workers
+    if comm is not None or config.number_of_workers > 1:
+        number_of_render_workers = 0
+    renderer = ImageRenderer(number_of_render_workers)
+
     # Loop over simulation list
     for sim in range(config.number_of_inputs):
 
@@ -107,6 +387,18 @@ def main(config: ArgumentParser):
         catalogue = config.catalogue_list[sim]
         sim_name = config.name_list[sim]
 
+        # Cutout file of the run, written in the extract mode and read otherwise
+        cutout_file = None
+        if config.cutout_directory is not None:
+            cutout_file = GalaxyCutouts.path_to_cutouts(
+                config.cutout_directory, directory, snapshot, catalogue
+            )
+
+        # In the MPI mode, rank 0 loads the data first so that the other ranks can
+        # reuse the halo index it has saved
+        if comm is not None and comm.Get_rank() > 0:
+            comm.Barrier()
+
         # Load all data and save it in SimInfo class
         sim_info = simulation_data.SimInfo(
             directory=directory,
@@ -114,10 +406,31 @@ def main(config: ArgumentParser):
             catalogue=catalogue,
             name=sim_name,
             galaxy_min_stellar_mass=config.min_stellar_mass,
+            bulk_id_matching=config.bulk_id_matching,
+            cache_halo_index=config.cache_halo_index,
+            region_restricted_reads=config.region_restricted_reads and comm is None,
+            combined_data_spill_directory=config.combined_data_spill_directory,
+            single_precision=config.single_precision,
+            iterative_shapes=config.iterative_shapes,
+            combined_histograms=config.combined_histograms,
+            cutout_file=None if config.extract_cutouts else cutout_file,
         )
 
+        if comm is not None and comm.Get_rank() == 0:
+            comm.Barrier()
+
+        # Extract mode: only the cutout file is written, nothing is analysed
+        if config.extract_cutouts:
+            sim_info.extract_cutouts(cutout_file)
+            continue
+
         output_name_list.append(sim_info.simulation_name)
 
+        # Binary store with all tables of the run, written by rank 0 only
+        results_store = ResultsStore(config.output_directory, sim_info.simulation_name)
+        if comm is None or comm.Get_rank() == 0:
+            results_store.create()
+
         # Make initial part of the webpage
         if sim == 0:
             web = html.make_web(sim_info.snapshot)
@@ -139,19 +452,40 @@ def main(config: ArgumentParser):
         # Compute morphological properties (loop over haloes)
         print("Computing morphological properties...")
 
-        for i in tqdm(range(sim_info.halo_data.number_of_haloes)):
-            compute_galaxy_morpholopy(
+        if comm is not None:
+            if not compute_galaxies_with_mpi(
                 sim_info=sim_info,
                 num_galaxies=config.number_of_galaxies,
                 output_path=config.output_directory,
-                halo_counter=i,
+                results_store=results_store,
+                renderer=renderer,
+                comm=comm,
+            ):
+                sim_info.combined_data.close()
+                continue
+        elif config.number_of_workers > 1:
+            compute_galaxies_in_pool(
+                sim_info=sim_info,
+                num_galaxies=config.number_of_galaxies,
+                output_path=config.output_directory,
+                results_store=results_store,
+                number_of_workers=config.number_of_workers,
             )
+        else:
+            sim_info.calculate_morphology_of_haloes()
+            for i in tqdm(range(sim_info.halo_data.number_of_haloes)):
+                compute_galaxy_morpholopy(
+                    sim_info=sim_info,
+                    num_galaxies=config.number_of_galaxies,
+                    output_path=config.output_directory,
+                    results_store=results_store,
+                    renderer=renderer,
+                    halo_counter=i,
+                )
+                results_store.flush()
 
         write_morphology_data_to_file(
-            sim_info.halo_data,
-            sim_info.combined_data,
-            config.output_directory,
-            sim_info.simulation_name,
+            sim_info.halo_data, sim_info.combined_data, results_store
         )
         plot_surface_densities(
             sim_info.halo_data,
@@ -159,7 +493,22 @@ def main(config: ArgumentParser):
             config.output_directory,
             sim_info.simulation_name,
         )
-        sim_info.write_galaxy_data_to_file(output_path=config.output_directory)
+        sim_info.write_galaxy_data_to_file(results_store)
+        results_store.flush()
+
+        # Remove the spilled data of the run, if any
+        sim_info.combined_data.close()
+
+    # Wait for the galaxy images
+    renderer.close()
+
+    # Nothing has been analysed in the extract mode
+    if config.extract_cutouts:
+        return
+
+    # Plots are made by rank 0 only
+    if comm is not None and comm.Get_rank() > 0:
+        return
 
     num_galaxies_to_show = min(output_number_of_galaxies_list)
 
@@ -184,6 +533,9 @@ def main(config: ArgumentParser):
     # Finish and output html file
     html.render_web(web, config.output_directory)
 
+    # Close the results files read by the plots
+    ResultsStore.close_files()
+
     # Compute how much time it took to run the script
     time_end = time()
     script_runtime = time_end - time_start
@@ -0,0 +1,243 @@
+import numpy as np
+import h5py
+import os
+from typing import Callable, Dict, List, Tuple
+
+
+class GalaxyCutouts:
+    """
+    Gas and stellar particles of the selected haloes extracted from a snapshot
+    into one HDF5 file. The particles of each halo occupy a contiguous range of
+    rows: the gas (stellar) particles of the i-th halo in 'halo_ids' are the rows
+    gas_offsets[i]:gas_offsets[i+1] (star_offsets) of the datasets in the group
+    'gas' ('stars'). Only the fields read by SimInfo.make_particle_data are
+    stored, in the internal units of the snapshot. The file also records the
+    path, modification time and size of the snapshot and catalogue files it was
+    extracted from, so that it is not used after they change
+    """
+
+    # Version of the file layout, increased when the layout changes
+    version = 2
+
+    def __init__(self, path: str):
+        """
+        Parameters
+        ----------
+        path: str
+        Path to the cutout file
+        """
+
+        self.path = path
+
+        with h5py.File(path, "r") as cutout_file:
+            if cutout_file.attrs.get("version") != self.version:
+                raise IOError(
+                    f"Cutout file {path} has an unsupported layout; extract it again"
+                )
+            self.halo_ids = cutout_file["halo_ids"][:]
+            self.offsets = {
+                "gas": cutout_file["gas_offsets"][:],
+                "stars": cutout_file["star_offsets"][:],
+            }
+            self.sources = [str(key) for key in cutout_file.attrs["sources"]]
+
+        # Fields read from the file so far, by particle type and name
+        self.fields: Dict[Tuple[str, str], np.ndarray] = {}
+
+    @staticmethod
+    def source_key(path: str) -> str:
+        """
+        Returns the key identifying a version of a file: its absolute path,
+        modification time and size
+
+        Parameters
+        ----------
+        path: str
+        Path to the file
+
+        Returns
+        -------
+        Output: str
+        Key of the file
+        """
+
+        stat = os.stat(path)
+        return f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}"
+
+    @staticmethod
+    def path_to_cutouts(
+        cutout_directory: str, directory: str, snapshot: str, catalogue: str
+    ) -> str:
+        """
+        Returns the path to the cutout file of a run
+
+        Parameters
+        ----------
+        cutout_directory: str
+        Directory with the cutout files
+
+        directory: str
+        Run directory
+
+        snapshot: str
+        Name of the snapshot file
+
+        catalogue: str
+        Name of the catalogue file
+
+        Returns
+        -------
+        Output: str
+        Path to the HDF5 file
+        """
+
+        run = os.path.basename(os.path.normpath(directory))
+        snapshot = os.path.splitext(snapshot)[0]
+        catalogue = os.path.splitext(catalogue)[0]
+
+        return f"{cutout_directory}/cutouts_{run}_{snapshot}_{catalogue}.hdf5"
+
+    @classmethod
+    def write(
+        cls,
+        path: str,
+        halo_ids: np.ndarray,
+        rows: Dict[str, List[np.ndarray]],
+        fields: Dict[str, Tuple[str, ...]],
+        read_field: Callable[[str, str], np.ndarray],
+        sources: List[str],
+    ) -> None:
+        """
+        Writes a cutout file. The snapshot fields are read and written one at a
+        time
+
+        Parameters
+        ----------
+        path: str
+        Path to the cutout file
+
+        halo_ids: np.ndarray
+        Sorted halo ids from the catalogue
+
+        rows: Dict[str, List[np.ndarray]]
+        Rows of the gas and stellar particles of each halo in the snapshot data
+
+        fields: Dict[str, Tuple[str, ...]]
+        Names of the fields of the gas and stellar particles
+
+        read_field: Callable[[str, str], np.ndarray]
+        Function returning a field of the snapshot from the particle type and the
+        name of the field
+
+        sources: List[str]
+        Paths to the snapshot and catalogue files the particles are extracted
+        from
+        """
+
+        # Write to a temporary file first so that an interrupted extraction does
+        # not leave a truncated cutout file behind
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        with h5py.File(temporary_path, "w") as cutout_file:
+            cutout_file.attrs["version"] = cls.version
+            cutout_file.attrs["sources"] = [cls.source_key(path) for path in sources]
+            cutout_file.create_dataset("halo_ids", data=np.asarray(halo_ids))
+
+            for particle_type, offsets_name in [
+                ("gas", "gas_offsets"),
+                ("stars", "star_offsets"),
+            ]:
+                offsets = np.zeros(len(halo_ids) + 1, dtype=np.int64)
+                np.cumsum([len(r) for r in rows[particle_type]], out=offsets[1:])
+                cutout_file.create_dataset(offsets_name, data=offsets)
+
+                all_rows = np.concatenate(
+                    [np.array([], dtype=np.int64)] + rows[particle_type]
+                ).astype(np.int64)
+
+                for name in fields[particle_type]:
+                    cutout_file.create_dataset(
+                        f"{particle_type}/{name.replace('.', '/')}",
+                        data=np.asarray(read_field(particle_type, name)[all_rows]),
+                    )
+
+        os.replace(temporary_path, path)
+
+        return
+
+    def check_sources(self, sources: List[str]) -> None:
+        """
+        Checks that the snapshot and catalogue files are the ones the cutout file
+        was extracted from
+
+        Parameters
+        ----------
+        sources: List[str]
+        Paths to the snapshot and catalogue files, in the order passed to write
+        """
+
+        if [self.source_key(path) for path in sources] != self.sources:
+            raise IOError(
+                f"Cutout file {self.path} was extracted from other versions of the "
+                "snapshot and catalogue files; extract it again"
+            )
+
+        return
+
+    def halo_rows(self, halo_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the rows of the gas and stellar particles of a halo
+
+        Parameters
+        ----------
+        halo_id: int
+        Halo id from the catalogue
+
+        Returns
+        -------
+        Output: Tuple[np.ndarray, np.ndarray]
+        Rows of the gas and stellar particles in the cutout file
+        """
+
+        index = np.searchsorted(self.halo_ids, halo_id)
+        if index == len(self.halo_ids) or self.halo_ids[index] != halo_id:
+            raise IOError(
+                f"Halo {halo_id} is not in the cutout file {self.path}; extract it "
+                "again with the same catalogue and minimum stellar mass"
+            )
+
+        return tuple(
+            np.arange(
+                self.offsets[particle_type][index],
+                self.offsets[particle_type][index + 1],
+            )
+            for particle_type in ("gas", "stars")
+        )
+
+    def field(self, particle_type: str, name: str) -> np.ndarray:
+        """
+        Returns a field of all particles of a type, reading it on first access
+
+        Parameters
+        ----------
+        particle_type: str
+        Particle type: "gas" or "stars"
+
+        name: str
+        Name of the field, as in SimInfo.particle_fields
+
+        Returns
+        -------
+        Output: np.ndarray
+        Data of the field
+        """
+
+        key = (particle_type, name)
+        if key not in self.fields:
+            with h5py.File(self.path, "r") as cutout_file:
+                self.fields[key] = cutout_file[
+                    f"{particle_type}/{name.replace('.', '/')}"
+                ][:]
+
+        return self.fields[key]
@@ -1,5 +1,6 @@
 import numpy as np
 import unyt
+from typing import Tuple
 from velociraptor import load
 
 
@@ -126,6 +127,71 @@ class HaloCatalogue:
 
         return
 
+    def get_galaxy_results(
+        self, index: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the stellar morphology, gas morphology and surface density data of
+        a galaxy in the same format as they are added
+
+        Parameters
+        ----------
+        index: int
+        Index of the galaxy in the catalogue
+
+        Returns
+        -------
+        Output: Tuple[np.ndarray, np.ndarray, np.ndarray]
+        Stellar morphology, gas morphology and surface densities
+        """
+
+        stellar_morphology = np.array(
+            [
+                self.kappa_co[index],
+                self.momentum[index],
+                self.axis_ca[index],
+                self.axis_cb[index],
+                self.axis_ba[index],
+            ]
+        )
+        gas_morphology = np.array(
+            [
+                self.gas_kappa_co[index],
+                self.gas_momentum[index],
+                self.gas_axis_ca[index],
+                self.gas_axis_cb[index],
+                self.gas_axis_ba[index],
+            ]
+        )
+        surface_density = np.array(
+            [self.sigma_H2[index], self.sigma_gas[index], self.sigma_SFR[index]]
+        )
+
+        return stellar_morphology, gas_morphology, surface_density
+
+    def add_galaxy_results(
+        self, data: Tuple[np.ndarray, np.ndarray, np.ndarray], index: int
+    ) -> None:
+        """
+        Add stellar morphology, gas morphology and surface density data of a galaxy
+
+        Parameters
+        ----------
+        data: Tuple[np.ndarray, np.ndarray, np.ndarray]
+        Output of get_galaxy_results
+
+        index: int
+        Index of the galaxy in the catalogue
+        """
+
+        stellar_morphology, gas_morphology, surface_density = data
+
+        self.add_stellar_morphology(stellar_morphology, index)
+        self.add_gas_morphology(gas_morphology, index)
+        self.add_surface_density(surface_density, index)
+
+        return
+
     def add_surface_density(self, data, index):
         """
         Add surface density data
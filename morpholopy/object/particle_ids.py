@@ -1,5 +1,8 @@
 import numpy as np
 import h5py
+import hashlib
+import os
+import glob
 from typing import Tuple
 
 
@@ -9,31 +12,333 @@ class ParticleIds:
     particle ids and halo ids
     """
 
+    # Arrays forming the halo index in the bulk mode
+    halo_index_arrays = (
+        "gas_rows_in_haloes",
+        "gas_offsets",
+        "star_rows_in_haloes",
+        "star_offsets",
+    )
+
     def __init__(
         self,
         path_to_groups_file: str,
         path_to_particles_file: str,
         path_to_snapshot_file: str,
+        bulk_id_matching: bool = False,
+        cache_halo_index: bool = True,
+        match_ids: bool = True,
     ):
+        """
+        Parameters
+        ----------
+        path_to_groups_file: str
+        Path to the catalogue_groups file
 
-        # Fetch ids
+        path_to_particles_file: str
+        Path to the catalogue_particles file
+
+        path_to_snapshot_file: str
+        Path to the snapshot file
+
+        bulk_id_matching: bool
+        If True, all catalogue particles are matched to the snapshot at once and
+        the particles of every halo are later fetched as plain slices
+
+        cache_halo_index: bool
+        If True (and in the bulk mode), the halo index is saved next to the
+        catalogue_particles file and reused by subsequent runs on the same data
+
+        match_ids: bool
+        If False, the particle ids are not read and make_masks_gas_and_stars
+        cannot be used, e.g. when the particles of the haloes are read from a
+        cutout file
+        """
+
+        # Halo ids from group catalogue
         group_file = h5py.File(path_to_groups_file, "r")
+        self.halo_ids = group_file["Offset"][:]
+        group_file.close()
+
+        # Total number of particles in the halo catalogue
+        particles_file = h5py.File(path_to_particles_file, "r")
+        self.number_of_particles_in_catalogue = particles_file["Particle_IDs"].shape[0]
+        particles_file.close()
+
+        # Snapshot rows of gas and stellar particles grouped by halo (CSR format)
+        self.gas_rows_in_haloes = None
+        self.gas_offsets = None
+        self.star_rows_in_haloes = None
+        self.star_offsets = None
+
+        # Arrays for the per-halo lookup
+        self.particle_ids_in_haloes = None
+        self.star_ids_order = None
+        self.star_ids_sorted = None
+        self.gas_ids_order = None
+        self.gas_ids_sorted = None
+
+        if not match_ids:
+            return
+
+        # Try to reuse the halo index saved by a previous run
+        cache_prefix = None
+        if bulk_id_matching and cache_halo_index:
+            cache_prefix = self.__halo_index_cache_prefix(
+                path_to_groups_file, path_to_particles_file, path_to_snapshot_file
+            )
+            if self.__load_halo_index(cache_prefix):
+                print(f"Halo index has been loaded from {cache_prefix}*.npy")
+                return
+
+        # Fetch ids
         particles_file = h5py.File(path_to_particles_file, "r")
         snapshot_file = h5py.File(path_to_snapshot_file, "r")
 
         # Ids of stellar particles from snapshot
-        self.star_ids = snapshot_file["/PartType4/ParticleIDs"][:]
+        star_ids = snapshot_file["/PartType4/ParticleIDs"][:]
         # Ids of gas particles from snapshot
-        self.gas_ids = snapshot_file["/PartType0/ParticleIDs"][:]
+        gas_ids = snapshot_file["/PartType0/ParticleIDs"][:]
         # Particle ids from halo catalogue
         self.particle_ids_in_haloes = particles_file["Particle_IDs"][:]
-        # Halo ids from group catalogue
-        self.halo_ids = group_file["Offset"][:]
 
-        group_file.close()
         particles_file.close()
         snapshot_file.close()
 
+        # Sort the snapshot ids once so that the particles of every halo can be
+        # found with a binary search instead of sorting the full arrays per halo
+        self.star_ids_order = np.argsort(star_ids, kind="stable")
+        self.star_ids_sorted = star_ids[self.star_ids_order]
+        self.gas_ids_order = np.argsort(gas_ids, kind="stable")
+        self.gas_ids_sorted = gas_ids[self.gas_ids_order]
+
+        if bulk_id_matching:
+            self.make_halo_index()
+
+            # The per-halo lookup arrays are no longer needed
+            self.star_ids_order = None
+            self.star_ids_sorted = None
+            self.gas_ids_order = None
+            self.gas_ids_sorted = None
+            self.particle_ids_in_haloes = None
+
+            if cache_prefix is not None:
+                self.__save_halo_index(cache_prefix)
+
+    @staticmethod
+    def __halo_index_cache_prefix(*paths: str) -> str:
+        """
+        Returns the path prefix of the halo index cache files. The cache key
+        combines the paths, modification times and sizes of the provided files
+
+        Parameters
+        ----------
+        paths: str
+        Paths to the catalogue_groups, catalogue_particles and snapshot files
+
+        Returns
+        -------
+        Output: str
+        Path prefix of the cache files, placed next to the catalogue_particles file
+        """
+
+        key = hashlib.sha1()
+        for path in paths:
+            stat = os.stat(path)
+            key.update(
+                f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size};".encode()
+            )
+
+        return f"{paths[1]}.halo_index_{key.hexdigest()[:16]}."
+
+    def __load_halo_index(self, cache_prefix: str) -> bool:
+        """
+        Memory-maps the halo index from the cache files, if they exist
+
+        Parameters
+        ----------
+        cache_prefix: str
+        Path prefix of the cache files
+
+        Returns
+        -------
+        Output: bool
+        True if the halo index has been loaded
+        """
+
+        arrays = {}
+        for name in self.halo_index_arrays:
+            path = f"{cache_prefix}{name}.npy"
+            if not os.path.isfile(path):
+                return False
+            arrays[name] = np.load(path, mmap_mode="r")
+
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+        return True
+
+    def __save_halo_index(self, cache_prefix: str) -> None:
+        """
+        Saves the halo index to the cache files and removes the cache files that
+        were made for other versions of the snapshot or catalogue
+
+        Parameters
+        ----------
+        cache_prefix: str
+        Path prefix of the cache files
+        """
+
+        stale_prefix = cache_prefix[: cache_prefix.rindex(".halo_index_")]
+
+        try:
+            for path in glob.glob(f"{stale_prefix}.halo_index_*.npy"):
+                if not path.startswith(cache_prefix):
+                    os.remove(path)
+
+            for name in self.halo_index_arrays:
+                path = f"{cache_prefix}{name}.npy"
+
+                # Write to a temporary file first so that an interrupted run does
+                # not leave a truncated cache behind
+                temporary_path = f"{path}.{os.getpid()}.tmp"
+                with open(temporary_path, "wb") as cache_file:
+                    np.save(cache_file, getattr(self, name))
+                os.replace(temporary_path, path)
+
+        except OSError as error:
+            print(f"Could not save the halo index to {cache_prefix}*.npy: {error}")
+
+        return
+
+    @staticmethod
+    def find_rows(
+        sorted_ids: np.ndarray, order: np.ndarray, ids: np.ndarray
+    ) -> np.ndarray:
+        """
+        Finds the snapshot rows of the particles with the provided ids
+
+        Parameters
+        ----------
+        sorted_ids: np.ndarray
+        Sorted particle ids from the snapshot
+
+        order: np.ndarray
+        Indices that sort the snapshot particle ids
+
+        ids: np.ndarray
+        Particle ids to look for
+
+        Returns
+        -------
+        Output: np.ndarray
+        Sorted snapshot rows of the particles that are present in the snapshot
+        """
+
+        if sorted_ids.size == 0 or ids.size == 0:
+            return np.array([], dtype=np.int64)
+
+        positions = np.searchsorted(sorted_ids, ids)
+        positions[positions == sorted_ids.size] = 0
+        found = sorted_ids[positions] == ids
+
+        return np.sort(order[positions[found]])
+
+    def __match_all_particles(
+        self, sorted_ids: np.ndarray, order: np.ndarray, halo_offsets: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the snapshot rows of all catalogue particles of one particle type
+
+        Parameters
+        ----------
+        sorted_ids: np.ndarray
+        Sorted particle ids from the snapshot
+
+        order: np.ndarray
+        Indices that sort the snapshot particle ids
+
+        halo_offsets: np.ndarray
+        Positions of the first particle of each halo in the catalogue, followed by
+        the total number of particles in the catalogue
+
+        Returns
+        -------
+        Output: Tuple[np.ndarray, np.ndarray]
+        Snapshot rows sorted within each halo, and the offsets of each halo in the
+        array of rows
+        """
+
+        number_of_haloes = len(halo_offsets) - 1
+
+        if sorted_ids.size == 0:
+            return (
+                np.array([], dtype=np.int64),
+                np.zeros(number_of_haloes + 1, dtype=np.int64),
+            )
+
+        positions = np.searchsorted(sorted_ids, self.particle_ids_in_haloes)
+        positions[positions == sorted_ids.size] = 0
+        found = sorted_ids[positions] == self.particle_ids_in_haloes
+
+        rows = order[positions[found]]
+        halo_of_row = (
+            np.searchsorted(halo_offsets, np.flatnonzero(found), side="right") - 1
+        )
+
+        # Sort the rows within each halo
+        rows = rows[np.lexsort((rows, halo_of_row))]
+
+        # Number of matched particles preceding the first particle of each halo
+        offsets = np.zeros(len(found) + 1, dtype=np.int64)
+        np.cumsum(found, out=offsets[1:])
+
+        return rows, offsets[halo_offsets]
+
+    def make_halo_index(self) -> None:
+        """
+        Assigns every particle from the catalogue to its particle type and snapshot
+        row in a single vectorized pass. The rows are stored in the CSR format: the
+        gas (stellar) particles of halo i occupy the slice
+        gas_offsets[i]:gas_offsets[i+1] of gas_rows_in_haloes (star_rows_in_haloes)
+        """
+
+        halo_offsets = np.append(
+            self.halo_ids.astype(np.int64), self.number_of_particles_in_catalogue
+        )
+
+        self.gas_rows_in_haloes, self.gas_offsets = self.__match_all_particles(
+            self.gas_ids_sorted, self.gas_ids_order, halo_offsets
+        )
+        self.star_rows_in_haloes, self.star_offsets = self.__match_all_particles(
+            self.star_ids_sorted, self.star_ids_order, halo_offsets
+        )
+
+        return
+
+    def number_of_particles_in_haloes(self, halo_ids: np.ndarray) -> np.ndarray:
+        """
+        Returns the number of particles of the haloes with the provided ids, as
+        given by the Offset array of the groups file
+
+        Parameters
+        ----------
+        halo_ids: np.ndarray
+        Halo ids from the catalogue
+
+        Returns
+        -------
+        Output: np.ndarray
+        Number of particles in each halo
+        """
+
+        halo_offsets = np.append(
+            self.halo_ids.astype(np.int64), self.number_of_particles_in_catalogue
+        )
+        halo_ids = np.asarray(halo_ids)
+
+        return (halo_offsets[halo_ids + 1] - halo_offsets[halo_ids]).astype(np.int64)
+
     def make_masks_gas_and_stars(self, halo_id: int) -> Tuple[np.ndarray, np.ndarray]:
         """
         Find gas and stellar particle ids that belong to a halo with the provided id
@@ -49,28 +354,30 @@ class ParticleIds:
         A tuple containing ids of the stellar particles and gas particles
         """
 
+        # Bulk mode: the rows of each halo are stored contiguously
+        if self.gas_offsets is not None:
+            mask_gas = self.gas_rows_in_haloes[
+                self.gas_offsets[halo_id] : self.gas_offsets[halo_id + 1]
+            ]
+            mask_stars = self.star_rows_in_haloes[
+                self.star_offsets[halo_id] : self.star_offsets[halo_id + 1]
+            ]
+            return mask_gas, mask_stars
+
         halo_start_position = self.halo_ids[halo_id]
-        halo_end_position = self.halo_ids[halo_id + 1]
+        if halo_id + 1 < len(self.halo_ids):
+            halo_end_position = self.halo_ids[halo_id + 1]
+        else:
+            halo_end_position = self.number_of_particles_in_catalogue
         particle_ids_in_halo = self.particle_ids_in_haloes[
             halo_start_position:halo_end_position
         ]
 
-        _, _, mask_stars = np.intersect1d(
-            particle_ids_in_halo,
-            self.star_ids,
-            assume_unique=True,
-            return_indices=True,
+        mask_stars = self.find_rows(
+            self.star_ids_sorted, self.star_ids_order, particle_ids_in_halo
         )
-
-        _, _, mask_gas = np.intersect1d(
-            particle_ids_in_halo,
-            self.gas_ids,
-            assume_unique=True,
-            return_indices=True,
+        mask_gas = self.find_rows(
+            self.gas_ids_sorted, self.gas_ids_order, particle_ids_in_halo
         )
 
-        # Ensure that there are no negative indices
-        mask_gas = mask_gas[mask_gas > 0]
-        mask_stars = mask_stars[mask_stars > 0]
-
         return mask_gas, mask_stars
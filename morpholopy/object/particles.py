@@ -0,0 +1,213 @@
+import numpy as np
+from functools import partial
+from typing import Callable, Dict, Tuple, Union
+
+
+class Particles:
+    """
+    Base container with the properties of the gas or stellar particles of a
+    galaxy. Every property is stored in its own contiguous array. A property can
+    also be given as a function returning the array, in which case it is read and
+    converted only when it is first accessed
+    """
+
+    __slots__ = (
+        "coordinates",
+        "masses",
+        "velocities",
+        "smoothing_lengths",
+        "_dtype",
+        "_loaders",
+    )
+
+    # Per-particle fields of the container, extended by the subclasses
+    fields: Tuple[str, ...] = (
+        "coordinates",
+        "masses",
+        "velocities",
+        "smoothing_lengths",
+    )
+
+    # Fields computed from the other fields on first access, set by the subclasses
+    derived_fields: Tuple[str, ...] = ()
+
+    def __init__(
+        self,
+        dtype: type = np.float64,
+        **fields: Union[np.ndarray, Callable[[], np.ndarray]],
+    ):
+        """
+        Parameters
+        ----------
+        dtype: type
+        Floating-point type of the stored arrays, np.float64 or np.float32
+
+        fields: Union[np.ndarray, Callable[[], np.ndarray]]
+        Arrays with the particle properties, or functions returning them, one for
+        each name in fields
+        """
+
+        self._dtype = np.dtype(dtype)
+        self._loaders: Dict[str, Callable[[], np.ndarray]] = {}
+
+        for name in self.fields:
+            if callable(fields[name]):
+                self._loaders[name] = fields[name]
+            else:
+                setattr(self, name, np.ascontiguousarray(fields[name], dtype=dtype))
+
+        for name in self.derived_fields:
+            setattr(self, f"_{name}", None)
+
+    def __getattr__(self, name: str) -> np.ndarray:
+        """
+        Loads a field that has not been accessed yet
+
+        Parameters
+        ----------
+        name: str
+        Name of the field
+
+        Returns
+        -------
+        Output: np.ndarray
+        Data of the field
+        """
+
+        if name.startswith("_") or name not in self._loaders:
+            raise AttributeError(name)
+
+        value = np.ascontiguousarray(self._loaders.pop(name)(), dtype=self._dtype)
+        setattr(self, name, value)
+        return value
+
+    def __len__(self) -> int:
+        return len(self.masses)
+
+    @property
+    def dtype(self) -> np.dtype:
+        """
+        Floating-point type of the stored arrays
+        """
+        return self._dtype
+
+    def select(self, rows: np.ndarray, **replacements: np.ndarray) -> "Particles":
+        """
+        Returns a new container with a subset of the particles. Fields that have
+        not been loaded yet stay unloaded in the new container
+
+        Parameters
+        ----------
+        rows: np.ndarray
+        Boolean mask or indices of the particles to keep
+
+        replacements: np.ndarray
+        Arrays (for all particles) replacing the stored fields with the same names,
+        e.g. re-centred coordinates
+
+        Returns
+        -------
+        Output: Particles
+        Container of the same type with the selected particles
+        """
+
+        fields = {}
+        for name in self.fields:
+            if name in replacements:
+                fields[name] = replacements[name][rows]
+            elif name in self._loaders:
+                fields[name] = partial(_load_rows, self._loaders[name], rows)
+            else:
+                fields[name] = getattr(self, name)[rows]
+
+        return type(self)(dtype=self.dtype, **fields)
+
+
+def _load_rows(loader: Callable[[], np.ndarray], rows: np.ndarray) -> np.ndarray:
+    """
+    Loads a field and returns a subset of its rows
+
+    Parameters
+    ----------
+    loader: Callable[[], np.ndarray]
+    Function returning the field
+
+    rows: np.ndarray
+    Boolean mask or indices of the rows to return
+
+    Returns
+    -------
+    Output: np.ndarray
+    Selected rows of the field
+    """
+
+    return loader()[rows]
+
+
+class GasParticles(Particles):
+    """
+    Container with the properties of gas particles:
+
+    coordinates [kpc], masses [Msun], velocities [km/s], smoothing_lengths [kpc],
+    HI_masses [Msun], H2_masses [Msun], star_formation_rates [Msun/yr],
+    densities [Msun/kpc^3], metallicities [Zsun]
+
+    Derived: neutral_masses (HI + H2) [Msun]
+    """
+
+    __slots__ = (
+        "HI_masses",
+        "H2_masses",
+        "star_formation_rates",
+        "densities",
+        "metallicities",
+        "_neutral_masses",
+    )
+
+    fields = Particles.fields + (
+        "HI_masses",
+        "H2_masses",
+        "star_formation_rates",
+        "densities",
+        "metallicities",
+    )
+
+    derived_fields = ("neutral_masses",)
+
+    @property
+    def neutral_masses(self) -> np.ndarray:
+        """
+        Masses of neutral (HI + H2) hydrogen
+        """
+
+        if self._neutral_masses is None:
+            self._neutral_masses = self.H2_masses + self.HI_masses
+        return self._neutral_masses
+
+
+class StarParticles(Particles):
+    """
+    Container with the properties of stellar particles:
+
+    coordinates [kpc], masses [Msun], velocities [km/s], smoothing_lengths
+    (softenings) [kpc], ages [Gyr], metallicities (metal mass fractions),
+    initial_masses [Msun]
+
+    Derived: densities (mass over softening cubed) [Msun/kpc^3]
+    """
+
+    __slots__ = ("ages", "metallicities", "initial_masses", "_densities")
+
+    fields = Particles.fields + ("ages", "metallicities", "initial_masses")
+
+    derived_fields = ("densities",)
+
+    @property
+    def densities(self) -> np.ndarray:
+        """
+        Density proxy: particle mass over the softening length cubed
+        """
+
+        if self._densities is None:
+            self._densities = self.masses * (1.2348 / self.smoothing_lengths) ** 3
+        return self._densities
@@ -0,0 +1,221 @@
+import numpy as np
+import h5py
+from typing import Dict, Optional, Tuple
+
+
+class ResultsStore:
+    """
+    Binary store with the results of a run. All tables of a run are kept in one
+    HDF5 file: per-galaxy tables in the group 'galaxies/<index>' and tables
+    describing the whole run in the group 'run'
+    """
+
+    # Results files opened by read, keyed by path. They are kept open so that the
+    # tables of many galaxies are read without reopening the file
+    open_files: Dict[str, h5py.File] = {}
+
+    def __init__(self, output_path: str, simulation_name: str):
+        """
+        Parameters
+        ----------
+        output_path: str
+        Path to the output directory
+
+        simulation_name: str
+        Name of the run
+        """
+
+        self.path = self.path_to_store(output_path, simulation_name)
+
+        # Tables waiting to be written, keyed by (galaxy index, table name).
+        # Galaxy index is None for the tables describing the whole run
+        self.pending: Dict[Tuple[Optional[int], str], np.ndarray] = {}
+
+    @staticmethod
+    def path_to_store(output_path: str, simulation_name: str) -> str:
+        """
+        Returns the path to the results file of a run
+
+        Parameters
+        ----------
+        output_path: str
+        Path to the output directory
+
+        simulation_name: str
+        Name of the run
+
+        Returns
+        -------
+        Output: str
+        Path to the HDF5 file
+        """
+
+        return f"{output_path}/morpholopy_results_{simulation_name}.hdf5"
+
+    @staticmethod
+    def group_name(index: Optional[int]) -> str:
+        """
+        Returns the name of the group holding the tables of a galaxy
+
+        Parameters
+        ----------
+        index: Optional[int]
+        Galaxy index, or None for the tables describing the whole run
+
+        Returns
+        -------
+        Output: str
+        Name of the HDF5 group
+        """
+
+        if index is None:
+            return "run"
+        return f"galaxies/{index:d}"
+
+    def create(self) -> None:
+        """
+        Creates an empty results file, removing the results of a previous run
+        """
+
+        self.close_files(self.path)
+        results_file = h5py.File(self.path, "w")
+        results_file.close()
+
+        return
+
+    def add(self, name: str, data: np.ndarray, index: Optional[int] = None) -> None:
+        """
+        Adds a table to the store. The table is written on the next call to flush
+
+        Parameters
+        ----------
+        name: str
+        Name of the table
+
+        data: np.ndarray
+        Table data
+
+        index: Optional[int]
+        Galaxy index, or None for a table describing the whole run
+        """
+
+        self.pending[(index, name)] = np.asarray(data, dtype=np.float64)
+
+        return
+
+    def take_pending(self) -> Dict[Tuple[Optional[int], str], np.ndarray]:
+        """
+        Removes and returns the tables that have not been written yet, e.g. to send
+        them from a worker process to the process writing the file
+
+        Returns
+        -------
+        Output: Dict[Tuple[Optional[int], str], np.ndarray]
+        Tables keyed by (galaxy index, table name)
+        """
+
+        pending, self.pending = self.pending, {}
+        return pending
+
+    def add_pending(self, pending: Dict[Tuple[Optional[int], str], np.ndarray]) -> None:
+        """
+        Adds tables returned by take_pending of another store
+
+        Parameters
+        ----------
+        pending: Dict[Tuple[Optional[int], str], np.ndarray]
+        Tables keyed by (galaxy index, table name)
+        """
+
+        self.pending.update(pending)
+
+        return
+
+    def flush(self) -> None:
+        """
+        Writes the pending tables to the results file
+        """
+
+        if not self.pending:
+            return
+
+        self.close_files(self.path)
+        results_file = h5py.File(self.path, "a")
+
+        for (index, name), data in self.pending.items():
+            group = results_file.require_group(self.group_name(index))
+            if name in group:
+                del group[name]
+
+            # Chunked and compressed unless the table is empty
+            if data.size > 0:
+                group.create_dataset(
+                    name, data=data, chunks=True, compression="gzip", shuffle=True
+                )
+            else:
+                group.create_dataset(name, data=data)
+
+        results_file.close()
+        self.pending = {}
+
+        return
+
+    @classmethod
+    def read(
+        cls,
+        output_path: str,
+        simulation_name: str,
+        name: str,
+        index: Optional[int] = None,
+    ) -> np.ndarray:
+        """
+        Reads a table from the results file of a run. The file is opened on the
+        first read and kept open for the following ones (see close_files)
+
+        Parameters
+        ----------
+        output_path: str
+        Path to the output directory
+
+        simulation_name: str
+        Name of the run
+
+        name: str
+        Name of the table
+
+        index: Optional[int]
+        Galaxy index, or None for a table describing the whole run
+
+        Returns
+        -------
+        Output: np.ndarray
+        Table data
+        """
+
+        path = cls.path_to_store(output_path, simulation_name)
+
+        results_file = cls.open_files.get(path)
+        if results_file is None or not results_file.id.valid:
+            results_file = h5py.File(path, "r")
+            cls.open_files[path] = results_file
+
+        return results_file[f"{cls.group_name(index)}/{name}"][...]
+
+    @classmethod
+    def close_files(cls, path: Optional[str] = None) -> None:
+        """
+        Closes the results files opened by read
+
+        Parameters
+        ----------
+        path: Optional[str]
+        Path to the results file to close. By default, all files are closed
+        """
+
+        paths = list(cls.open_files) if path is None else [path]
+        for path in paths:
+            results_file = cls.open_files.pop(path, None)
+            if results_file is not None and results_file.id.valid:
+                results_file.close()
+
+        return
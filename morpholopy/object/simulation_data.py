@@ -1,20 +1,32 @@
-from typing import List, Union, Tuple, Dict
+from typing import List, Union, Tuple, Dict, Optional
+from itertools import product
 import unyt
 import numpy as np
 import glob
+import os
+import shutil
+import tempfile
 
 from .unitilies import constants
 from .unitilies.helper_functions import (
     calculate_kappa_co,
+    calculate_morphology_batched,
+    centre_particles,
     AxialRatios,
     cosmic_time_approx_Gyr,
 )
 from .unitilies import luminosities as lum
+from .unitilies.kernels import deposit_on_cells
+from .unitilies.quantile_sketch import BinnedQuantileSketch
 
 from .halo_catalogue import HaloCatalogue
+from .galaxy_cutouts import GalaxyCutouts
 from .particle_ids import ParticleIds
+from .results_store import ResultsStore
+from .particles import Particles, GasParticles, StarParticles
+
+from swiftsimio import load, mask
 
-from swiftsimio import load
 
 class SimInfo(ParticleIds):
 
@@ -24,6 +36,36 @@ class SimInfo(ParticleIds):
     # Dict with photometry tables to compute stars' luminosities
     pgrids: Dict = {}
 
+    # Photometry tables of all filters stacked for the batched interpolation
+    pgrid_stack: Optional[Tuple] = None
+
+    # Maximum number of particles processed at once by the batched morphology
+    morphology_batch_size = 2 ** 22
+
+    # Snapshot fields read by make_particle_data, by particle type
+    particle_fields = {
+        "gas": (
+            "coordinates",
+            "masses",
+            "velocities",
+            "smoothing_lengths",
+            "star_formation_rates",
+            "densities",
+            "metal_mass_fractions",
+            "element_mass_fractions.hydrogen",
+            "species_fractions.HI",
+            "species_fractions.H2",
+        ),
+        "stars": (
+            "coordinates",
+            "masses",
+            "velocities",
+            "birth_scale_factors",
+            "metal_mass_fractions",
+            "initial_masses",
+        ),
+    }
+
     def __init__(
         self,
         directory: str,
@@ -31,6 +73,14 @@ class SimInfo(ParticleIds):
         catalogue: str,
         name: Union[str, None],
         galaxy_min_stellar_mass: unyt.array.unyt_quantity,
+        bulk_id_matching: bool = False,
+        cache_halo_index: bool = True,
+        region_restricted_reads: bool = False,
+        combined_data_spill_directory: Optional[str] = None,
+        single_precision: bool = False,
+        iterative_shapes: bool = False,
+        combined_histograms: bool = False,
+        cutout_file: Optional[str] = None,
     ):
         """
         Parameters
@@ -49,6 +99,34 @@ class SimInfo(ParticleIds):
         Name of the run
 
         galaxy_min_stellar_mass: unyt.array.unyt_quantity
+
+        bulk_id_matching: bool
+        Match all particles from the halo catalogue to the snapshot in one pass
+
+        cache_halo_index: bool
+        Save the halo index from the bulk mode on disk and reuse it in later runs
+
+        region_restricted_reads: bool
+        Read only the snapshot cells around the selected haloes
+
+        combined_data_spill_directory: Optional[str]
+        Directory where the data for combined plots is spilled instead of being
+        kept in memory
+
+        single_precision: bool
+        Store the particle data of the haloes in single precision
+
+        iterative_shapes: bool
+        Measure the axis ratios with the iterative reduced inertia tensor
+
+        combined_histograms: bool
+        Aggregate the data for combined plots into 2D histograms as each galaxy
+        is finished, instead of keeping every pixel
+
+        cutout_file: Optional[str]
+        Cutout file (see GalaxyCutouts) from which the particles of the haloes are
+        read instead of the snapshot. The snapshot is then only used for its
+        metadata
         """
 
         self.directory = directory
@@ -118,20 +196,78 @@ class SimInfo(ParticleIds):
             galaxy_min_stellar_mass=galaxy_min_stellar_mass,
         )
 
-        # Init parent class with particle ids
+        # Particles of the haloes extracted from the snapshot, if any
+        self.cutouts: Optional[GalaxyCutouts] = None
+        if cutout_file is not None:
+            self.cutouts = GalaxyCutouts(cutout_file)
+            self.cutouts.check_sources(self.source_files)
+            if not np.all(np.isin(self.halo_data.halo_ids, self.cutouts.halo_ids)):
+                raise IOError(
+                    f"Cutout file {cutout_file} does not contain all selected "
+                    "haloes; extract it again with the same catalogue and minimum "
+                    "stellar mass"
+                )
+            print(f"Particles of the haloes are read from {cutout_file}")
+
+        # Init parent class with particle ids. With a cutout file, the particles
+        # of the haloes do not need to be matched to the snapshot
         super().__init__(
             path_to_groups_file=f"{self.directory}/{self.catalogue_groups}",
             path_to_particles_file=f"{self.directory}/{self.catalogue_particles}",
             path_to_snapshot_file=f"{self.directory}/{self.snapshot_name}",
+            bulk_id_matching=bulk_id_matching,
+            cache_halo_index=cache_halo_index,
+            match_ids=self.cutouts is None,
         )
 
+        # Floating-point type of the particle data of the haloes
+        self.particle_dtype = np.float32 if single_precision else np.float64
+
+        # Whether the axis ratios are measured iteratively (see AxialRatios)
+        self.iterative_shapes = iterative_shapes
+
+        # Unit vectors of the inner angular momenta of gas (0) and stars (4) from
+        # the batched morphology, and the haloes it has been computed for
+        self.inner_momenta: Dict[int, np.ndarray] = {
+            parttype: np.full((self.halo_data.number_of_haloes, 3), np.nan)
+            for parttype in (0, 4)
+        }
+        self.morphology_computed = np.zeros(self.halo_data.number_of_haloes, bool)
+
+        # Snapshot rows [start, end) of gas and stars that have been read, if the
+        # snapshot is restricted to the regions around the haloes
+        self.region_row_ranges: Dict[str, np.ndarray] = {}
+
+        if region_restricted_reads and self.cutouts is None:
+            self.restrict_snapshot_to_haloes()
+
         # Contained with spatially resolved data for combined plots
-        self.combined_data = CombinedData()
+        if combined_histograms:
+            self.combined_data = CombinedHistograms()
+        else:
+            self.combined_data = CombinedData(
+                spill_directory=combined_data_spill_directory
+            )
 
         print(f"Data from run '{self.simulation_name}' has been loaded! \n")
 
         return
 
+    @property
+    def source_files(self) -> List[str]:
+        """
+        Paths to the snapshot and catalogue files the halo data is read from
+        """
+        return [
+            f"{self.directory}/{name}"
+            for name in [
+                self.snapshot_name,
+                self.catalogue_name,
+                self.catalogue_groups,
+                self.catalogue_particles,
+            ]
+        ]
+
     def __find_groups_and_particles_catalogues(self) -> None:
         """
         Finds paths to the fields with particles catalogue and groups catalogue
@@ -161,32 +297,169 @@ class SimInfo(ParticleIds):
 
         return
 
-    def make_particle_data(self, halo_id: int) -> Tuple[np.ndarray, np.ndarray]:
-        """
-        Computes and saves gas and stellar particle data into numpy arrays.
-
-        gas data:
-        0-2 coordinates
-        3 masses
-        4-6 velocities
-        7 smoothing lengths
-        8 HI masses
-        9 H2 masses
-        10 SFR
-        11 densities
-        12 metallicities
-
-        star data:
-        0-2 coordinates
-        3 masses
-        4-7 velocities
-        7 softenings
-        8 Mass over softenning cubed
-        9 stellar ages
-        10 stellar metallicities
-        11 stellar initial masses
-
-        @TODO Use classes for the gas and stellar data containers, not numpy arrays
+    def restrict_snapshot_to_haloes(
+        self, halo_indices: Optional[np.ndarray] = None, aperture: float = 30.0
+    ) -> None:
+        """
+        Reloads the snapshot with a spatial mask such that only the top-level cells
+        overlapping the apertures around the haloes' centres are read. Particles
+        outside these cells are not loaded; they lie beyond the aperture, which is
+        the region used in the analysis
+
+        Parameters
+        ----------
+        halo_indices: Optional[np.ndarray]
+        Indices of the haloes in the halo catalogue. By default, all haloes
+
+        aperture: float
+        Aperture radius around the centres of the haloes in units of kpc
+        """
+
+        # The particles are read from the cutout file instead
+        if self.cutouts is not None:
+            return
+
+        if halo_indices is None:
+            halo_indices = np.arange(self.halo_data.number_of_haloes)
+
+        path_to_snapshot = f"{self.directory}/{self.snapshot_name}"
+        region_mask = mask(path_to_snapshot, spatial_only=True)
+
+        # Halo centres and aperture in comoving kpc
+        centres = (
+            np.column_stack(
+                [
+                    self.halo_data.xminpot[halo_indices],
+                    self.halo_data.yminpot[halo_indices],
+                    self.halo_data.zminpot[halo_indices],
+                ]
+            )
+            / self.a
+        )
+        half_size = aperture / self.a
+
+        # One comoving kpc, carrying the metadata that newer swiftsimio versions
+        # require of the region bounds
+        kpc = region_mask.metadata.boxsize[0].to("kpc") / self.boxSize
+
+        for centre in centres:
+
+            # Split the regions that cross the box boundaries
+            intervals = []
+            for low, high in zip(centre - half_size, centre + half_size):
+                if low < 0.0:
+                    intervals.append([[0.0, high], [low + self.boxSize, self.boxSize]])
+                elif high > self.boxSize:
+                    intervals.append([[low, self.boxSize], [0.0, high - self.boxSize]])
+                else:
+                    intervals.append([[low, high]])
+
+            for region in product(*intervals):
+                restrict = [np.array(bounds) * kpc for bounds in region]
+
+                # Older swiftsimio versions call the union of the regions intersect
+                try:
+                    region_mask.constrain_spatial(restrict, union=True)
+                except TypeError:
+                    region_mask.constrain_spatial(restrict, intersect=True)
+
+        self.snapshot = load(path_to_snapshot, mask=region_mask)
+        self.region_row_ranges = {
+            "gas": np.array(region_mask.gas, dtype=np.int64).reshape(-1, 2),
+            "stars": np.array(region_mask.stars, dtype=np.int64).reshape(-1, 2),
+        }
+
+        print(
+            f"Snapshot is restricted to {region_mask.gas_size} gas and "
+            f"{region_mask.stars_size} stellar particles around {len(centres)} haloes"
+        )
+
+        return
+
+    def __to_region_rows(self, rows: np.ndarray, particle_type: str) -> np.ndarray:
+        """
+        Converts snapshot rows into rows of the data read with the spatial mask.
+        Rows outside the masked region are removed
+
+        Parameters
+        ----------
+        rows: np.ndarray
+        Rows of the particles in the snapshot
+
+        particle_type: str
+        Particle type: "gas" or "stars"
+
+        Returns
+        -------
+        Output: np.ndarray
+        Rows of the particles in the masked data
+        """
+
+        ranges = self.region_row_ranges[particle_type]
+        if len(ranges) == 0:
+            return np.array([], dtype=np.int64)
+
+        # The masked data is the concatenation of the ranges in the mask's order
+        first_rows = np.zeros(len(ranges), dtype=np.int64)
+        np.cumsum(ranges[:-1, 1] - ranges[:-1, 0], out=first_rows[1:])
+
+        order = np.argsort(ranges[:, 0])
+        range_index = order[
+            np.clip(np.searchsorted(ranges[order, 0], rows, side="right") - 1, 0, None)
+        ]
+        inside = (rows >= ranges[range_index, 0]) & (rows < ranges[range_index, 1])
+
+        return (
+            first_rows[range_index[inside]]
+            + rows[inside]
+            - ranges[range_index[inside], 0]
+        )
+
+    def preload_particle_fields(self) -> None:
+        """
+        Reads all snapshot (or cutout) fields used by make_particle_data. They are
+        kept in memory afterwards, which lets forked worker processes share the
+        data instead of each reading it again
+        """
+
+        for particle_type, names in self.particle_fields.items():
+            for name in names:
+                self.__particle_field(particle_type, name)
+
+        return
+
+    def __particle_field(self, particle_type: str, name: str) -> np.ndarray:
+        """
+        Returns a field of all particles of a type from the cutout file or, without
+        it, from the snapshot
+
+        Parameters
+        ----------
+        particle_type: str
+        Particle type: "gas" or "stars"
+
+        name: str
+        Name of the field, as in particle_fields
+
+        Returns
+        -------
+        Output: np.ndarray
+        Data of the field in the internal units of the snapshot
+        """
+
+        if self.cutouts is not None:
+            return self.cutouts.field(particle_type, name)
+
+        field = getattr(self.snapshot, particle_type)
+        for attribute in name.split("."):
+            field = getattr(field, attribute)
+
+        return field
+
+    def __halo_rows(self, halo_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the rows of the gas and stellar particles of a halo in the data
+        returned by __particle_field
 
         Parameters
         ----------
@@ -196,95 +469,258 @@ class SimInfo(ParticleIds):
         Returns
         -------
         Output: Tuple[np.ndarray, np.ndarray]
-        Arrays with gas and stellar properties
+        Rows of the gas and stellar particles
         """
 
+        if self.cutouts is not None:
+            return self.cutouts.halo_rows(halo_id)
+
         mask_gas, mask_stars = self.make_masks_gas_and_stars(halo_id=halo_id)
 
-        gas_mass = self.snapshot.gas.masses[mask_gas].value * self.to_Msun_units
-        gas_n_parts = len(gas_mass)
-        gas_data = np.zeros((gas_n_parts, 13))
+        if self.region_row_ranges:
+            mask_gas = self.__to_region_rows(mask_gas, "gas")
+            mask_stars = self.__to_region_rows(mask_stars, "stars")
+
+        return mask_gas, mask_stars
+
+    def extract_cutouts(self, path: str) -> None:
+        """
+        Writes the gas and stellar particles of the selected haloes to a cutout
+        file (see GalaxyCutouts), from which later runs can read them instead of
+        the snapshot
+
+        Parameters
+        ----------
+        path: str
+        Path to the cutout file
+        """
 
-        gas_data[:, 0:3] = (
-            self.snapshot.gas.coordinates[mask_gas].value * self.a * self.to_kpc_units
+        rows = {"gas": [], "stars": []}
+        for halo_id in self.halo_data.halo_ids:
+            mask_gas, mask_stars = self.__halo_rows(halo_id)
+            rows["gas"].append(mask_gas)
+            rows["stars"].append(mask_stars)
+
+        GalaxyCutouts.write(
+            path=path,
+            halo_ids=self.halo_data.halo_ids,
+            rows=rows,
+            fields=self.particle_fields,
+            read_field=self.__particle_field,
+            sources=self.source_files,
         )
 
-        gas_data[:, 3] = gas_mass
-        gas_data[:, 4:7] = self.snapshot.gas.velocities[mask_gas].value  # km/s
-        gas_data[:, 7] = (
-            self.snapshot.gas.smoothing_lengths[mask_gas].value
-            * self.a
-            * self.to_kpc_units
+        print(
+            f"Particles of {self.halo_data.number_of_haloes} haloes "
+            f"({sum(len(r) for r in rows['gas'])} gas and "
+            f"{sum(len(r) for r in rows['stars'])} stellar) have been written to {path}"
         )
 
-        XH = self.snapshot.gas.element_mass_fractions.hydrogen[mask_gas].value
-        gas_HI = self.snapshot.gas.species_fractions.HI[mask_gas].value
-        gas_H2 = self.snapshot.gas.species_fractions.H2[mask_gas].value * 2.0
+        return
+
+    def make_particle_data(self, halo_id: int) -> Tuple[GasParticles, StarParticles]:
+        """
+        Computes gas and stellar particle data of a halo and saves them into
+        GasParticles and StarParticles containers (see object/particles.py for the
+        fields and their units). Apart from the coordinates, masses and
+        velocities, the fields are read from the snapshot (or the cutout file) when
+        first accessed
+
+        Parameters
+        ----------
+        halo_id: int
+        Halo id from the halo catalogue
+
+        Returns
+        -------
+        Output: Tuple[GasParticles, StarParticles]
+        Containers with gas and stellar properties
+        """
+
+        mask_gas, mask_stars = self.__halo_rows(halo_id)
+
+        def gas_field(name: str) -> np.ndarray:
+            return np.asarray(self.__particle_field("gas", name)[mask_gas])
 
-        gas_data[:, 8] = gas_HI * XH * gas_mass
-        gas_data[:, 9] = gas_H2 * XH * gas_mass
+        def stars_field(name: str) -> np.ndarray:
+            return np.asarray(self.__particle_field("stars", name)[mask_stars])
 
-        gas_data[:, 10] = (
-            self.snapshot.gas.star_formation_rates[mask_gas].value
+        # Masses and kinematics are needed for every halo. The other fields are
+        # passed as functions and only read and converted if a stage uses them
+        gas_mass = gas_field("masses") * self.to_Msun_units
+
+        def hydrogen_mass(species: str, factor: float) -> np.ndarray:
+            return (
+                gas_field(f"species_fractions.{species}")
+                * factor
+                * gas_field("element_mass_fractions.hydrogen")
+                * gas_mass
+            )
+
+        gas_data = GasParticles(
+            dtype=self.particle_dtype,
+            coordinates=gas_field("coordinates") * self.a * self.to_kpc_units,
+            masses=gas_mass,
+            velocities=gas_field("velocities"),  # km/s
+            smoothing_lengths=lambda: gas_field("smoothing_lengths")
+            * self.a
+            * self.to_kpc_units,
+            HI_masses=lambda: hydrogen_mass("HI", 1.0),
+            H2_masses=lambda: hydrogen_mass("H2", 2.0),
+            star_formation_rates=lambda: gas_field("star_formation_rates")
             * self.to_Msun_units
-            / self.to_yr_units
+            / self.to_yr_units,
+            densities=lambda: gas_field("densities")
+            * (self.a * self.to_Msun_units / self.to_kpc_units) ** 3,
+            metallicities=lambda: gas_field("metal_mass_fractions") / self.Zsolar,
         )
-        gas_data[:, 11] = (
-            self.snapshot.gas.densities[mask_gas].value
-            * (self.a * self.to_Msun_units / self.to_kpc_units) ** 3
-        )
-        gas_data[:, 12] = (
-            self.snapshot.gas.metal_mass_fractions[mask_gas].value / self.Zsolar
+
+        stars_mass = stars_field("masses") * self.to_Msun_units
+
+        def stars_age() -> np.ndarray:
+            stars_birthz = 1.0 / stars_field("birth_scale_factors") - 1.0
+
+            if len(stars_birthz) > 1:
+                return cosmic_time_approx_Gyr(
+                    z=0.0, Omega_L=self.Omega_l, Hubble_time=self.hubble_time_Gyr
+                ) - cosmic_time_approx_Gyr(
+                    z=stars_birthz,
+                    Omega_L=self.Omega_l,
+                    Hubble_time=self.hubble_time_Gyr,
+                )
+            return np.zeros(stars_birthz.size)
+
+        stars_data = StarParticles(
+            dtype=self.particle_dtype,
+            coordinates=stars_field("coordinates") * self.a * self.to_kpc_units,
+            masses=stars_mass,
+            velocities=stars_field("velocities"),  # km/s
+            smoothing_lengths=lambda: np.full(
+                stars_mass.size, 0.5 * self.baryon_max_soft
+            ),
+            ages=stars_age,
+            metallicities=lambda: stars_field("metal_mass_fractions"),
+            initial_masses=lambda: stars_field("initial_masses") * self.to_Msun_units,
         )
 
-        stars_mass = self.snapshot.stars.masses[mask_stars].value * self.to_Msun_units
-        stars_birthz = (
-            1.0 / self.snapshot.stars.birth_scale_factors[mask_stars].value - 1.0
+        return gas_data, stars_data
+
+    def calculate_morphology_of_haloes(
+        self, halo_indices: Optional[np.ndarray] = None
+    ) -> None:
+        """
+        Computes morphological properties of many haloes at once (see
+        calculate_morphology_batched). The haloes are processed in batches of at
+        most morphology_batch_size particles. Haloes without gas particles are
+        skipped, as they are in the halo loop
+
+        Parameters
+        ----------
+        halo_indices: Optional[np.ndarray]
+        Indices of the haloes in the halo catalogue. By default, all haloes
+        """
+
+        if halo_indices is None:
+            halo_indices = np.arange(self.halo_data.number_of_haloes)
+
+        batch, rows, batch_size = [], {"gas": [], "stars": []}, 0
+
+        for halo_index in halo_indices:
+            mask_gas, mask_stars = self.__halo_rows(self.halo_data.halo_ids[halo_index])
+
+            if len(mask_gas) == 0:
+                continue
+
+            batch.append(halo_index)
+            rows["gas"].append(mask_gas)
+            rows["stars"].append(mask_stars)
+            batch_size += len(mask_gas) + len(mask_stars)
+
+            if batch_size >= self.morphology_batch_size:
+                self.__calculate_morphology_of_batch(np.array(batch), rows)
+                batch, rows, batch_size = [], {"gas": [], "stars": []}, 0
+
+        if batch:
+            self.__calculate_morphology_of_batch(np.array(batch), rows)
+
+        return
+
+    def __calculate_morphology_of_batch(
+        self, halo_indices: np.ndarray, rows: Dict[str, List[np.ndarray]]
+    ) -> None:
+        """
+        Computes morphological properties of a batch of haloes and stores them in
+        halo data
+
+        Parameters
+        ----------
+        halo_indices: np.ndarray
+        Indices of the haloes in the halo catalogue
+
+        rows: Dict[str, List[np.ndarray]]
+        Rows of the gas and stellar particles of each halo in the snapshot (or
+        cutout) data
+        """
+
+        centres = np.column_stack(
+            [
+                self.halo_data.xminpot[halo_indices],
+                self.halo_data.yminpot[halo_indices],
+                self.halo_data.zminpot[halo_indices],
+            ]
+        )
+        centre_velocities = np.column_stack(
+            [
+                self.halo_data.vxminpot[halo_indices],
+                self.halo_data.vyminpot[halo_indices],
+                self.halo_data.vzminpot[halo_indices],
+            ]
         )
 
-        if len(stars_birthz) > 1:
-            stars_age = cosmic_time_approx_Gyr(
-                z=0.0, Omega_L=self.Omega_l, Hubble_time=self.hubble_time_Gyr
-            ) - cosmic_time_approx_Gyr(
-                z=stars_birthz, Omega_L=self.Omega_l, Hubble_time=self.hubble_time_Gyr
+        for particle_type, parttype in [("stars", 4), ("gas", 0)]:
+            batch_rows = np.concatenate(rows[particle_type]).astype(np.int64)
+
+            def field(name: str) -> np.ndarray:
+                return np.asarray(
+                    self.__particle_field(particle_type, name)[batch_rows]
+                )
+
+            kappa, specific_momentum, momentum, axes = calculate_morphology_batched(
+                coordinates=field("coordinates") * self.a * self.to_kpc_units,
+                velocities=field("velocities"),  # km/s
+                masses=field("masses") * self.to_Msun_units,
+                counts=np.array([len(r) for r in rows[particle_type]]),
+                centres=centres,
+                centre_velocities=centre_velocities,
+                box_size=self.boxSize,
+                iterative=self.iterative_shapes,
             )
-        else:
-            stars_age = 0.0
 
-        stars_Z = self.snapshot.stars.metal_mass_fractions[mask_stars].value
-        stars_initmass = (
-            self.snapshot.stars.initial_masses[mask_stars].value * self.to_Msun_units
-        )
+            for i, halo_index in enumerate(halo_indices):
+                morphology = np.array([kappa[i], specific_momentum[i], *axes[i]])
+                if parttype == 4:
+                    self.halo_data.add_stellar_morphology(morphology, halo_index)
+                else:
+                    self.halo_data.add_gas_morphology(morphology, halo_index)
 
-        stars_n_parts = len(stars_mass)
-        stars_data = np.zeros((stars_n_parts, 12))
-        stars_data[:, 0:3] = (
-            self.snapshot.stars.coordinates[mask_stars].value
-            * self.a
-            * self.to_kpc_units
-        )
-        stars_data[:, 3] = stars_mass
-        stars_data[:, 4:7] = self.snapshot.stars.velocities[
-            mask_stars
-        ].value  # km/s  # km/s
-        stars_data[:, 7] = 0.5 * self.baryon_max_soft * np.ones(stars_mass.size)
-        stars_data[:, 8] = stars_mass * (1.2348 / stars_data[:, 7]) ** 3
-        stars_data[:, 9] = stars_age
-        stars_data[:, 10] = stars_Z
-        stars_data[:, 11] = stars_initmass
+            self.inner_momenta[parttype][halo_indices] = momentum
 
-        return gas_data, stars_data
+        self.morphology_computed[halo_indices] = True
+
+        return
 
     def calculate_morphology(
-        self, part_data: np.ndarray, halo_index: int, parttype: int
-    ):
+        self, part_data: Particles, halo_index: int, parttype: int
+    ) -> Tuple[np.ndarray, Particles]:
         """
-        Computes morphological properties of a given halo
+        Computes morphological properties of a given halo. If they have already
+        been computed by calculate_morphology_of_haloes, the particles are only
+        centred and restricted to the aperture
 
         Parameters
         ----------
-        part_data: ndarray
-        Array with gas or stellar properties
+        part_data: Particles
+        Container with gas or stellar properties
 
         halo_index: int
         Halo index in the halo catalogue
@@ -293,6 +729,15 @@ class SimInfo(ParticleIds):
         Particle type: gas (0) or stars (4)
         """
 
+        if self.morphology_computed[halo_index]:
+            part_data, _ = centre_particles(
+                halo_data=self.halo_data,
+                partsDATA=part_data,
+                box_size=self.boxSize,
+                halo_index=halo_index,
+            )
+            return self.inner_momenta[parttype][halo_index].copy(), part_data
+
         # Calculate kappa and specific angular momentum
         kappa, specific_momentum, momentum, part_data = calculate_kappa_co(
             halo_data=self.halo_data,
@@ -302,7 +747,9 @@ class SimInfo(ParticleIds):
         )
 
         # Calculate axis ratios
-        axis_1, axis_2, axis_3 = AxialRatios(part_data[:, :3], part_data[:, 3])
+        axis_1, axis_2, axis_3 = AxialRatios(
+            part_data.coordinates, part_data.masses, iterative=self.iterative_shapes
+        )
         morphology = np.array([kappa, specific_momentum, axis_1, axis_2, axis_3])
 
         # Store morphology parameters in halo data and continue
@@ -312,18 +759,18 @@ class SimInfo(ParticleIds):
             self.halo_data.add_gas_morphology(morphology, halo_index)
         return momentum, part_data
 
-    def write_galaxy_data_to_file(self, output_path: str) -> None:
+    def write_galaxy_data_to_file(self, results_store: ResultsStore) -> None:
         """
-        Writes data with halo main properties to a file
+        Writes data with halo main properties to the results store
 
         Parameters
         ----------
-        output_path: str
-        Path to output directory where the file will be saved
+        results_store: ResultsStore
+        Store with the results of the run
         """
 
-        np.savetxt(
-            f"{output_path}/galaxy_data_{self.simulation_name}.txt",
+        results_store.add(
+            "galaxy_data",
             np.transpose(
                 [
                     self.halo_data.sfr,
@@ -341,23 +788,39 @@ class SimInfo(ParticleIds):
     @classmethod
     def load_photometry_grid(cls):
         """
-        Loads photometry grids for interpolation
+        Loads photometry grids for interpolation. The stacked log10 grids are
+        cached in the user cache directory (see luminosities.CacheDirectory) and
+        reused while the tables are unchanged
         """
 
-        if not cls.pgrids:
+        if not cls.pgrids and cls.pgrid_stack is None:
             system = "GAMA"  # hard-coded for now
-            for pht in glob.glob(f"./photometry/{system}/*"):
-                cls.pgrids[pht[-1]] = lum.MakeGrid(pht)
+            photometry_directory = (
+                f"{os.path.dirname(os.path.dirname(os.path.abspath(__file__)))}"
+                f"/photometry/{system}"
+            )
+            paths = sorted(glob.glob(f"{photometry_directory}/*"))
+
+            cache_prefix = lum.GridCachePrefix(photometry_directory, paths)
+            cls.pgrid_stack = lum.LoadGridStack(cache_prefix)
+
+            if cls.pgrid_stack is None:
+                for pht in paths:
+                    cls.pgrids[pht[-1]] = lum.MakeGrid(pht)
+                cls.pgrid_stack = lum.MakeGridStack(cls.pgrids)
+                if cls.pgrid_stack is not None:
+                    lum.SaveGridStack(cache_prefix, cls.pgrid_stack)
+
             print("Photometry tables have been loaded! \n")
 
     @classmethod
-    def calculate_luminosities(cls, spart_data: np.ndarray):
+    def calculate_luminosities(cls, spart_data: StarParticles):
         """
         Computes stellar luminosities
         Parameters
         ----------
-        spart_data: np.ndarray
-        Array with spart data
+        spart_data: StarParticles
+        Container with spart data
 
         Returns
         -------
@@ -365,18 +828,34 @@ class SimInfo(ParticleIds):
         An array with spart luminosities
         """
 
-        assert cls.pgrids is not {}, (
+        assert cls.pgrids or cls.pgrid_stack is not None, (
             "'pgrids' is empty! Load photometry tables before calculating"
             " stellar luminosities!"
         )
 
         star_abmags = {}
 
+        # Interpolate all filters at once if they share the (Z, age) nodes
+        if cls.pgrid_stack is not None:
+            filters, log_grids, Z_p, t_p = cls.pgrid_stack
+            fluxes = (
+                lum.BiPowInterpStack(
+                    t_p, Z_p, log_grids, spart_data.ages, spart_data.metallicities
+                )
+                * spart_data.initial_masses
+            )
+            magnitudes = -2.5 * np.log10(fluxes * lum.magfac)
+            for filt, filter_magnitudes in zip(filters, magnitudes):
+                star_abmags[filt] = filter_magnitudes
+            return star_abmags
+
         for filt in cls.pgrids.keys():
             grid, Z_p, t_p = cls.pgrids[filt]
             fluxes = (
-                lum.BiPowInterp(t_p, Z_p, grid, spart_data[:, 9], spart_data[:, 10])
-                * spart_data[:, 11]
+                lum.BiPowInterp(
+                    t_p, Z_p, grid, spart_data.ages, spart_data.metallicities
+                )
+                * spart_data.initial_masses
             )
             star_abmags[filt] = -2.5 * np.log10(fluxes * lum.magfac)
         return star_abmags
@@ -384,21 +863,383 @@ class SimInfo(ParticleIds):
 
 class CombinedData:
     """
-    Container holding spatially resolved data for combined plots
+    Container holding spatially resolved data for combined plots. The data of
+    every galaxy is stored as a separate chunk, and the chunks of a field are
+    concatenated only once, when the field is accessed. In the spill mode the
+    chunks are written to files on disk and the fields are memory-mapped
     """
 
+    # Fields of the container
+    fields = (
+        "neutral_gas_surface_density",
+        "molecular_gas_surface_density",
+        "SFR_surface_density",
+        "depletion_time_molecular_gas",
+        "depletion_time_neutral_gas",
+        "H2_to_neutral_surface_density_ratio",
+        "gas_metallicity",
+        "radii_neutral_gas_surface_density",
+        "radii_H2_to_neutral_surface_density_ratio",
+    )
+
+    def __init__(self, spill_directory: Optional[str] = None):
+        """
+        Parameters
+        ----------
+        spill_directory: Optional[str]
+        If provided, the data is written to a temporary directory created in
+        spill_directory instead of being kept in memory
+        """
+
+        self.chunks: Dict[str, List[np.ndarray]] = {name: [] for name in self.fields}
+
+        self.spill_path = None
+        if spill_directory is not None:
+            self.spill_path = tempfile.mkdtemp(
+                prefix="combined_data_", dir=spill_directory
+            )
+
+    def __getattr__(self, name: str) -> np.ndarray:
+        """
+        Returns a field of the container as a single array
+
+        Parameters
+        ----------
+        name: str
+        Name of the field
+
+        Returns
+        -------
+        Output: np.ndarray
+        Data of the field
+        """
+
+        if name not in type(self).fields:
+            raise AttributeError(name)
+
+        if self.spill_path is not None:
+            path = self.__spill_file(name)
+            if not os.path.isfile(path) or os.path.getsize(path) == 0:
+                return np.array([])
+            return np.memmap(path, dtype=np.float64, mode="r")
+
+        # Concatenate the chunks once and keep the result as the only chunk
+        chunks = self.chunks[name]
+        if len(chunks) == 0:
+            return np.array([])
+        if len(chunks) > 1:
+            chunks[:] = [np.concatenate(chunks)]
+        return chunks[0]
+
+    def __spill_file(self, name: str) -> str:
+        """
+        Returns the path to the file with the data of a field in the spill mode
+
+        Parameters
+        ----------
+        name: str
+        Name of the field
+
+        Returns
+        -------
+        Output: str
+        Path to the file
+        """
+
+        return f"{self.spill_path}/{name}.bin"
+
+    def append(self, name: str, values: np.ndarray) -> None:
+        """
+        Appends data to a field
+
+        Parameters
+        ----------
+        name: str
+        Name of the field
+
+        values: np.ndarray
+        Data to append
+        """
+
+        values = np.asarray(values, dtype=np.float64).ravel()
+
+        if self.spill_path is not None:
+            with open(self.__spill_file(name), "ab") as spill_file:
+                values.tofile(spill_file)
+        else:
+            self.chunks[name].append(values)
+
+        return
+
+    def end_galaxy(self) -> None:
+        """
+        Marks the end of the data of a galaxy. The data is kept as it was
+        appended, so there is nothing to do
+        """
+
+        return
+
+    def extend(self, other: "CombinedData") -> None:
+        """
+        Appends the data from another container, e.g. the data of a galaxy
+        computed in a worker process
+
+        Parameters
+        ----------
+        other: CombinedData
+        Container whose data is appended to this one
+        """
+
+        for name in self.fields:
+            self.append(name, getattr(other, name))
+
+        return
+
+    def close(self) -> None:
+        """
+        Removes the files written in the spill mode
+        """
+
+        if self.spill_path is not None:
+            shutil.rmtree(self.spill_path, ignore_errors=True)
+            self.spill_path = None
+            self.chunks = {name: [] for name in self.fields}
+
+        return
+
+
+class CombinedHistograms:
+    """
+    Streaming alternative to CombinedData for the combined plots. The spatially
+    resolved data of a galaxy is kept only until the galaxy is finished, and is
+    then added to 2D histograms with fixed bins, so the memory used does not
+    depend on the number of galaxies. Each histogram counts the pixels in bins of
+    a surface density (x) and of a second quantity (y), and sums their log
+    metallicities. The y bins are extended by an underflow and an overflow bin.
+    The median relations of all pixels and of the metallicity and star formation
+    selections are kept in quantile sketches with the bins of median_relations
+    """
+
+    fields = CombinedData.fields
+
+    # Histograms: x and y fields, range of y, and whether the pixels have
+    # metallicities (grid maps) or not (radial profiles)
+    panels = {
+        "gas": (
+            "neutral_gas_surface_density",
+            "SFR_surface_density",
+            (-6.0, 1.0),
+            True,
+        ),
+        "H2": (
+            "molecular_gas_surface_density",
+            "SFR_surface_density",
+            (-6.0, 1.0),
+            True,
+        ),
+        "depletion_gas": (
+            "neutral_gas_surface_density",
+            "depletion_time_neutral_gas",
+            (7.0, 12.0),
+            True,
+        ),
+        "depletion_H2": (
+            "molecular_gas_surface_density",
+            "depletion_time_molecular_gas",
+            (7.0, 12.0),
+            True,
+        ),
+        "ratios": (
+            "neutral_gas_surface_density",
+            "H2_to_neutral_surface_density_ratio",
+            (-8.0, 0.5),
+            True,
+        ),
+        "radii_ratios": (
+            "radii_neutral_gas_surface_density",
+            "radii_H2_to_neutral_surface_density_ratio",
+            (-8.0, 0.5),
+            False,
+        ),
+    }
+
+    # Range of x of all histograms, and bin size in x and y [dex]
+    x_range = (-1.0, 4.0)
+    bin_size = 0.05
+
+    # Quantities summed in each bin; the last row of a histogram holds the counts
+    sums = ("log_metallicity",)
+
+    # Pixels with a median relation in the panels with metallicities
+    selections = (
+        "all",
+        "low_metallicity",
+        "solar_metallicity",
+        "high_metallicity",
+        "star_forming",
+    )
+
+    # Bins in x of the median relations (the bins of median_relations), and
+    # resolution of the quantile sketches [dex]. The fine histograms of the
+    # sketches extend 2 dex beyond the y range of the panel
+    median_edges = np.arange(-1, 3, 0.1)[:-1]
+    sketch_resolution = 0.02
+
     def __init__(self):
 
-        self.neutral_gas_surface_density: np.ndarray = np.array([])
-        self.molecular_gas_surface_density: np.ndarray = np.array([])
-        self.SFR_surface_density: np.ndarray = np.array([])
+        self.histograms: Dict[str, np.ndarray] = {}
+        for panel in self.panels:
+            x_edges, y_edges = self.edges(panel)
+            self.histograms[panel] = np.zeros(
+                (len(self.sums) + 1, len(x_edges) - 1, len(y_edges) + 1)
+            )
+
+        self.sketches: Dict[str, Dict[str, BinnedQuantileSketch]] = {}
+        for panel, (_, _, y_range, resolved) in self.panels.items():
+            if not resolved:
+                continue
+            value_ranges = [
+                (self.median_edges[0], self.median_edges[-1]),
+                (y_range[0] - 2.0, y_range[1] + 2.0),
+            ]
+            self.sketches[panel] = {
+                selection: BinnedQuantileSketch(
+                    self.median_edges, value_ranges, self.sketch_resolution
+                )
+                for selection in self.selections
+            }
+
+        # Data of the galaxy that is not finished yet
+        self.pending: Dict[str, List[np.ndarray]] = {name: [] for name in self.fields}
 
-        self.depletion_time_molecular_gas: np.ndarray = np.array([])
-        self.depletion_time_neutral_gas: np.ndarray = np.array([])
+    @classmethod
+    def edges(cls, panel: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the bin edges of a histogram
 
-        self.H2_to_neutral_surface_density_ratio: np.ndarray = np.array([])
+        Parameters
+        ----------
+        panel: str
+        Name of the histogram
 
-        self.gas_metallicity: np.ndarray = np.array([])
+        Returns
+        -------
+        Output: Tuple[np.ndarray, np.ndarray]
+        Edges of the bins in x and y. The underflow and overflow bins in y are not
+        included
+        """
 
-        self.radii_neutral_gas_surface_density: np.ndarray = np.array([])
-        self.radii_H2_to_neutral_surface_density_ratio: np.ndarray = np.array([])
+        y_range = cls.panels[panel][2]
+        x_edges = np.linspace(
+            *cls.x_range, round((cls.x_range[1] - cls.x_range[0]) / cls.bin_size) + 1
+        )
+        y_edges = np.linspace(
+            *y_range, round((y_range[1] - y_range[0]) / cls.bin_size) + 1
+        )
+        return x_edges, y_edges
+
+    def append(self, name: str, values: np.ndarray) -> None:
+        """
+        Appends data of the current galaxy to a field
+
+        Parameters
+        ----------
+        name: str
+        Name of the field
+
+        values: np.ndarray
+        Data to append
+        """
+
+        self.pending[name].append(np.asarray(values, dtype=np.float64).ravel())
+
+        return
+
+    def end_galaxy(self) -> None:
+        """
+        Adds the data of the current galaxy to the histograms
+        """
+
+        data = {
+            name: np.concatenate(chunks) if len(chunks) > 0 else np.array([])
+            for name, chunks in self.pending.items()
+        }
+        self.pending = {name: [] for name in self.fields}
+
+        metals = data["gas_metallicity"]
+        metals = np.log10(np.where(metals == 0, 1e-6, metals))
+        weights = np.array([metals], dtype=np.float64)
+        selected = {
+            "all": np.ones(len(metals), dtype=bool),
+            "low_metallicity": (metals > -1.2) & (metals < -0.8),
+            "solar_metallicity": (metals > -0.2) & (metals < 0.2),
+            "high_metallicity": metals > 0.6,
+            "star_forming": data["SFR_surface_density"] > -5.5,
+        }
+
+        for panel, (x_name, y_name, _, resolved) in self.panels.items():
+            x = data[x_name]
+            y = data[y_name]
+            if len(x) == 0:
+                continue
+
+            x_edges, y_edges = self.edges(panel)
+            number_of_x_bins = len(x_edges) - 1
+            number_of_y_bins = len(y_edges) + 1
+
+            # Bins in y start with the underflow bin and end with the overflow bin
+            x_bins = np.searchsorted(x_edges, x, side="right") - 1
+            y_bins = np.searchsorted(y_edges, y, side="right")
+            inside = (x_bins >= 0) & (x_bins < number_of_x_bins) & ~np.isnan(y)
+
+            if resolved:
+                panel_weights = weights[:, inside]
+            else:
+                panel_weights = np.zeros((len(self.sums), np.count_nonzero(inside)))
+
+            self.histograms[panel] += deposit_on_cells(
+                x_bins[inside] * number_of_y_bins + y_bins[inside],
+                panel_weights,
+                number_of_x_bins * number_of_y_bins,
+            ).reshape(self.histograms[panel].shape)
+
+            for selection, sketch in self.sketches.get(panel, {}).items():
+                mask = selected[selection]
+                sketch.update(x[mask], [x[mask], y[mask]])
+
+        return
+
+    def extend(self, other: Union["CombinedHistograms", CombinedData]) -> None:
+        """
+        Adds the data from another container, e.g. the data of a galaxy computed
+        in a worker process
+
+        Parameters
+        ----------
+        other: Union[CombinedHistograms, CombinedData]
+        Histograms to add, or the data of a finished galaxy
+        """
+
+        if isinstance(other, CombinedHistograms):
+            for panel in self.panels:
+                self.histograms[panel] += other.histograms[panel]
+            for panel, sketches in self.sketches.items():
+                for selection, sketch in sketches.items():
+                    sketch.merge(other.sketches[panel][selection])
+            return
+
+        for name in self.fields:
+            self.append(name, getattr(other, name))
+        self.end_galaxy()
+
+        return
+
+    def close(self) -> None:
+        """
+        Drops the data of an unfinished galaxy. The histograms are kept in memory,
+        so there are no files to remove
+        """
+
+        self.pending = {name: [] for name in self.fields}
+
+        return
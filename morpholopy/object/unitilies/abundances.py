@@ -3,6 +3,7 @@ import numpy as np
 import h5py
 import os
 import warnings
+from .kernels import BinnedStatistics
 
 warnings.filterwarnings("ignore")
 from morpholopy.plotter.html import (
@@ -274,17 +275,10 @@ def calculate_relative_abundances(siminfo):
     plt.plot(FeH_sg, OFe_sg, "*", ms=4, color="lightblue", label="Sagittarius")
 
     bins = np.arange(-7.2, 1, 0.2)
-    ind = np.digitize(Fe_H, bins)
-    xm = [
-        np.median(Fe_H[ind == i])
-        for i in range(1, len(bins))
-        if len(Fe_H[ind == i]) > 10
-    ]
-    ym = [
-        np.median(O_Fe[ind == i])
-        for i in range(1, len(bins))
-        if len(O_Fe[ind == i]) > 10
-    ]
+    statistics = BinnedStatistics(Fe_H, [Fe_H, O_Fe], bins, include_left_edges=True)
+    mask = statistics.counts > 10
+    xm = statistics.median(0)[mask]
+    ym = statistics.median(1)[mask]
     plt.plot(xm, ym, "-", lw=1.5, color="black")
 
     plt.text(-1.9, 2.6, siminfo.simulation_name + " $z$=%0.2f" % redshift)
@@ -342,17 +336,10 @@ def calculate_relative_abundances(siminfo):
     )
 
     bins = np.arange(-7.2, 1, 0.2)
-    ind = np.digitize(Fe_H, bins)
-    xm = [
-        np.median(Fe_H[ind == i])
-        for i in range(1, len(bins))
-        if len(Fe_H[ind == i]) > 10
-    ]
-    ym = [
-        np.median(Mg_Fe[ind == i])
-        for i in range(1, len(bins))
-        if len(Mg_Fe[ind == i]) > 10
-    ]
+    statistics = BinnedStatistics(Fe_H, [Fe_H, Mg_Fe], bins, include_left_edges=True)
+    mask = statistics.counts > 10
+    xm = statistics.median(0)[mask]
+    ym = statistics.median(1)[mask]
     plt.plot(xm, ym, "-", lw=1.5, color="black")
 
     plt.text(-1.9, 2.6, siminfo.simulation_name + " $z$=%0.2f" % redshift)
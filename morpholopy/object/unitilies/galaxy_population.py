@@ -2,6 +2,7 @@ from pylab import *
 import numpy as np
 import os
 
+from morpholopy.object.results_store import ResultsStore
 from morpholopy.plotter.html import (
     make_web,
     add_metadata_to_web,
@@ -41,7 +42,7 @@ def plot_population_data(output_path, name_list):
 
     i = 0
     for name in name_list:
-        data = np.loadtxt(f"{output_path}/galaxy_data_" + name + ".txt")
+        data = ResultsStore.read(output_path, name, "galaxy_data")
         stellar_mass = data[:, 1]
         histogram_all, _ = np.histogram(stellar_mass, bins=bins)
         plt.plot(mass_bins, histogram_all, color=color[i], label=name)
@@ -64,7 +65,7 @@ def plot_population_data(output_path, name_list):
 
     i = 0
     for name in name_list:
-        data = np.loadtxt(f"{output_path}/galaxy_data_" + name + ".txt")
+        data = ResultsStore.read(output_path, name, "galaxy_data")
         stellar_mass = data[:, 1]
         sfr = data[:, 0]
         ssfr = sfr / 10 ** stellar_mass
@@ -90,7 +91,7 @@ def plot_population_data(output_path, name_list):
 
     i = 0
     for name in name_list:
-        data = np.loadtxt(f"{output_path}/galaxy_data_" + name + ".txt")
+        data = ResultsStore.read(output_path, name, "galaxy_data")
         stellar_mass = data[:, 1]
         sfr = data[:, 0]
         ssfr = sfr / 10 ** stellar_mass
@@ -116,7 +117,7 @@ def plot_population_data(output_path, name_list):
 
     i = 0
     for name in name_list:
-        data = np.loadtxt(f"{output_path}/galaxy_data_" + name + ".txt")
+        data = ResultsStore.read(output_path, name, "galaxy_data")
         stellar_mass = data[:, 1]
         sfr = data[:, 0]
         ssfr = sfr / 10 ** stellar_mass
@@ -153,7 +154,7 @@ def plot_population_data(output_path, name_list):
 
     i = 0
     for name in name_list:
-        data = np.loadtxt(f"{output_path}/galaxy_data_" + name + ".txt")
+        data = ResultsStore.read(output_path, name, "galaxy_data")
         stellar_mass = data[:, 1]
         sfr = data[:, 0]
         ssfr = sfr / 10 ** stellar_mass
@@ -190,7 +191,7 @@ def plot_population_data(output_path, name_list):
 
     i = 0
     for name in name_list:
-        data = np.loadtxt(f"{output_path}/galaxy_data_" + name + ".txt")
+        data = ResultsStore.read(output_path, name, "galaxy_data")
         stellar_mass = data[:, 1]
         histogram_all, _ = np.histogram(stellar_mass, bins=bins)
         cumulative_histogram_all = np.cumsum(histogram_all)
@@ -214,7 +215,7 @@ def plot_population_data(output_path, name_list):
 
     i = 0
     for name in name_list:
-        data = np.loadtxt(f"{output_path}/galaxy_data_" + name + ".txt")
+        data = ResultsStore.read(output_path, name, "galaxy_data")
         stellar_mass = data[:, 1]
         sfr = data[:, 0]
         ssfr = sfr / 10 ** stellar_mass
@@ -241,7 +242,7 @@ def plot_population_data(output_path, name_list):
 
     i = 0
     for name in name_list:
-        data = np.loadtxt(f"{output_path}/galaxy_data_" + name + ".txt")
+        data = ResultsStore.read(output_path, name, "galaxy_data")
         stellar_mass = data[:, 1]
         sfr = data[:, 0]
         ssfr = sfr / 10 ** stellar_mass
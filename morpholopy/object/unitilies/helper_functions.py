@@ -4,8 +4,10 @@ The routines that calculate disc fractions, circularities and axis ratios have b
 """
 
 import numpy as np
+import heapq
 from scipy.interpolate import interp1d
-from typing import Union
+from typing import Union, List, Tuple
+from .kernels import kappa_sums
 
 
 def cosmic_time_approx_Gyr(
@@ -53,54 +55,108 @@ def cosmic_time_approx_Gyr(
     return cosmic_times
 
 
-def calculate_kappa_co(halo_data, partsDATA, box_size, halo_index):
-    # subhalo contain subhalo data and is strutured as follow
-    # [ (0:3)CentreOfPotential[kpc]: (0)X | (1)Y | (2)Z  | (3:6)Velocity[km/s]: (3)Vx | (4)Vy | (5)Vz  | (6)R200c[kpc]]
-    # partsDATA contains particles data and is structured as follow
-    # [ (:3)Position[kpc]: (0)X | (1)Y | (2)Z  | (3)Mass[Msun] | (4:7)Velocity[km/s]: (4)Vx | (5)Vy | (6)Vz | (7)hsml]
+def partition_by_cost(costs: np.ndarray, number_of_parts: int) -> List[np.ndarray]:
+    """
+    Splits items into parts with similar total costs using the greedy
+    longest-processing-time rule: items are taken in order of decreasing cost
+    and each is assigned to the part with the lowest total cost so far
+
+    Parameters
+    ----------
+    costs: np.ndarray
+    Cost of each item, e.g. the number of particles in each halo
+
+    number_of_parts: int
+    Number of parts, e.g. the number of MPI ranks
+
+    Returns
+    -------
+    Output: List[np.ndarray]
+    Sorted indices of the items assigned to each part
+    """
+
+    parts = [[] for _ in range(number_of_parts)]
+    loads = [(0, part) for part in range(number_of_parts)]
 
-    particlesDATA = np.array(partsDATA).copy()  # isolating a copy
+    for item in np.argsort(-np.asarray(costs), kind="stable"):
+        load, part = heapq.heappop(loads)
+        parts[part].append(item)
+        heapq.heappush(loads, (load + costs[item], part))
+
+    return [np.sort(np.array(part, dtype=np.int64)) for part in parts]
+
+
+def centre_particles(halo_data, partsDATA, box_size, halo_index):
+    # Centres the particles of a halo on its CoP and CoM velocity and restricts
+    # them to the 30 kpc aperture. Returns the new container and the distances of
+    # its particles to the CoP
+    # partsDATA is a GasParticles or StarParticles container (see object/particles.py)
 
     # Centering onto subhalo CoP
-    particlesDATA[:, 0] -= halo_data.xminpot[halo_index]
-    particlesDATA[:, 1] -= halo_data.yminpot[halo_index]
-    particlesDATA[:, 2] -= halo_data.zminpot[halo_index]
-    particlesDATA[:, :3] += box_size / 2
-    particlesDATA[:, :3] %= box_size
-    particlesDATA[:, :3] -= box_size / 2  # end the unwrap
+    positions = partsDATA.coordinates - np.array(
+        [
+            halo_data.xminpot[halo_index],
+            halo_data.yminpot[halo_index],
+            halo_data.zminpot[halo_index],
+        ]
+    )
+    positions += box_size / 2
+    positions %= box_size
+    positions -= box_size / 2  # end the unwrap
 
     # Center velocities on the subhalo CoM velocity
-    particlesDATA[:, 4] -= halo_data.vxminpot[halo_index]
-    particlesDATA[:, 5] -= halo_data.vyminpot[halo_index]
-    particlesDATA[:, 6] -= halo_data.vzminpot[halo_index]
+    velocities = partsDATA.velocities - np.array(
+        [
+            halo_data.vxminpot[halo_index],
+            halo_data.vyminpot[halo_index],
+            halo_data.vzminpot[halo_index],
+        ]
+    )
 
     # Compute distances
-    distancesDATA = np.linalg.norm(particlesDATA[:, :3], axis=1)
+    distancesDATA = np.linalg.norm(positions, axis=1)
 
-    # Restrict particles
+    # Restrict particles (the new container holds its own copies of the fields)
     extract = distancesDATA < 30.0
 
-    particlesDATA = particlesDATA[extract, :]
+    particlesDATA = partsDATA.select(
+        extract, coordinates=positions, velocities=velocities
+    )
     distancesDATA = distancesDATA[extract]
 
-    Mstar = np.sum(particlesDATA[:, 3])  # compute total in-aperture stellar mass
+    velocities = particlesDATA.velocities
+    masses = particlesDATA.masses
+
+    Mstar = np.sum(masses)  # compute total in-aperture stellar mass
     # Compute 30kpc CoM to Sub CoM velocty offset & recenter
-    dvVmass = (
-        np.sum(particlesDATA[:, 3][:, np.newaxis] * particlesDATA[:, 4:7], axis=0)
-        / Mstar
+    dvVmass = np.sum(masses[:, np.newaxis] * velocities, axis=0) / Mstar
+    velocities -= dvVmass.astype(velocities.dtype)
+
+    return particlesDATA, distancesDATA
+
+
+def calculate_kappa_co(halo_data, partsDATA, box_size, halo_index):
+    # subhalo contain subhalo data and is strutured as follow
+    # [ (0:3)CentreOfPotential[kpc]: (0)X | (1)Y | (2)Z  | (3:6)Velocity[km/s]: (3)Vx | (4)Vy | (5)Vz  | (6)R200c[kpc]]
+    # partsDATA is a GasParticles or StarParticles container (see object/particles.py)
+
+    particlesDATA, distancesDATA = centre_particles(
+        halo_data, partsDATA, box_size, halo_index
     )
-    particlesDATA[:, 4:7] -= dvVmass
+
+    positions = particlesDATA.coordinates
+    velocities = particlesDATA.velocities
+    masses = particlesDATA.masses
+    Mstar = np.sum(masses)
 
     # Compute momentum
-    smomentums = np.cross(particlesDATA[:, :3], particlesDATA[:, 4:7])
-    momentum = np.sum(particlesDATA[:, 3][:, np.newaxis] * smomentums, axis=0)
+    smomentums = np.cross(positions, velocities)
+    momentum = np.sum(masses[:, np.newaxis] * smomentums, axis=0)
 
     extract = distancesDATA < 5.0
-    smomentum_inner_5kpc = np.cross(
-        particlesDATA[extract, :3], particlesDATA[extract, 4:7]
-    )
+    smomentum_inner_5kpc = np.cross(positions[extract], velocities[extract])
     momentum_inner_5kpc = np.sum(
-        particlesDATA[extract, 3][:, np.newaxis] * smomentum_inner_5kpc, axis=0
+        masses[extract][:, np.newaxis] * smomentum_inner_5kpc, axis=0
     )
 
     # Compute specific angular momentum
@@ -111,23 +167,25 @@ def calculate_kappa_co(halo_data, partsDATA, box_size, halo_index):
     smomentumz = np.sum(momentum * smomentums / np.linalg.norm(momentum), axis=1)
     cyldistances = (
         distancesDATA ** 2
-        - np.sum(momentum * particlesDATA[:, :3] / np.linalg.norm(momentum), axis=1)
-        ** 2
+        - np.sum(momentum * positions / np.linalg.norm(momentum), axis=1) ** 2
     )
     cyldistances = np.sqrt(np.abs(cyldistances))
 
     if len(cyldistances[cyldistances > 0]) > 0:
         cylmin = np.min(cyldistances[cyldistances > 0])
-        cyldistances[cyldistances == 0] = cylmin
-        vrots = smomentumz / cyldistances
     else:
-        vrots = smomentumz
+        cylmin = np.inf
 
     # Compute kappa_co
-    Mvrot2 = np.sum((particlesDATA[:, 3] * vrots ** 2)[vrots > 0])
-    kappa_co = Mvrot2 / np.sum(
-        particlesDATA[:, 3] * (np.linalg.norm(particlesDATA[:, 4:7], axis=1)) ** 2
+    Mvrot2, Mv2 = kappa_sums(
+        labels=np.zeros(len(masses), dtype=np.int64),
+        masses=masses,
+        smomentumz=smomentumz,
+        cyldistances=cyldistances,
+        cylmin=np.array([cylmin]),
+        speeds2=np.linalg.norm(velocities, axis=1) ** 2,
     )
+    kappa_co = Mvrot2[0] / Mv2[0]
 
     # Apply rotation so that momentum vector corresponds to z-axis
     momentum /= np.linalg.norm(momentum)
@@ -137,6 +195,225 @@ def calculate_kappa_co(halo_data, partsDATA, box_size, halo_index):
     return kappa_co, sa_momentum, momentum_inner_5kpc, particlesDATA
 
 
+def segment_sum(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Sums values over the segments offsets[i]:offsets[i+1] of the first axis
+
+    Parameters
+    ----------
+    values: np.ndarray
+    Concatenated values of all segments
+
+    offsets: np.ndarray
+    Start of each segment, followed by the total number of values
+
+    Returns
+    -------
+    Output: np.ndarray
+    Sum over each segment; zero for empty segments
+    """
+
+    counts = np.diff(offsets)
+    sums = np.zeros((len(counts),) + values.shape[1:])
+
+    # reduceat requires increasing starts, so empty segments are skipped
+    nonempty = counts > 0
+    if np.any(nonempty):
+        sums[nonempty] = np.add.reduceat(values, offsets[:-1][nonempty], axis=0)
+
+    return sums
+
+
+def segment_min(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Minimum of values over the segments offsets[i]:offsets[i+1]
+
+    Parameters
+    ----------
+    values: np.ndarray
+    Concatenated values of all segments
+
+    offsets: np.ndarray
+    Start of each segment, followed by the total number of values
+
+    Returns
+    -------
+    Output: np.ndarray
+    Minimum over each segment; infinity for empty segments
+    """
+
+    counts = np.diff(offsets)
+    minima = np.full(len(counts), np.inf)
+
+    nonempty = counts > 0
+    if np.any(nonempty):
+        minima[nonempty] = np.minimum.reduceat(values, offsets[:-1][nonempty])
+
+    return minima
+
+
+def calculate_morphology_batched(
+    coordinates: np.ndarray,
+    velocities: np.ndarray,
+    masses: np.ndarray,
+    counts: np.ndarray,
+    centres: np.ndarray,
+    centre_velocities: np.ndarray,
+    box_size: float,
+    iterative: bool = False,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Computes kappa_co, specific angular momenta, inner (5 kpc) angular momentum
+    directions and axis ratios of many haloes at once. Does the same as
+    calculate_kappa_co followed by AxialRatios for every halo, but using segmented
+    reductions over the concatenated particles of all haloes
+
+    Parameters
+    ----------
+    coordinates: np.ndarray
+    Coordinates of the particles of all haloes, halo after halo [kpc]
+
+    velocities: np.ndarray
+    Velocities of the particles of all haloes [km/s]
+
+    masses: np.ndarray
+    Masses of the particles of all haloes [Msun]
+
+    counts: np.ndarray
+    Number of particles of each halo
+
+    centres: np.ndarray
+    Centres of potential of the haloes [kpc]
+
+    centre_velocities: np.ndarray
+    Velocities of the centres of potential of the haloes [km/s]
+
+    box_size: float
+    Size of the simulation box [kpc]
+
+    iterative: bool
+    Measure the axis ratios with IterativeAxialRatios
+
+    Returns
+    -------
+    Output: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+    kappa_co, specific angular momenta [kpc km/s], unit vectors of the inner
+    angular momenta and axis ratios (c/a, c/b, b/a) of the haloes
+    """
+
+    number_of_haloes = len(counts)
+    labels = np.repeat(np.arange(number_of_haloes), counts)
+
+    # Centering onto subhalo CoP and CoM velocity
+    positions = coordinates - centres[labels]
+    positions += box_size / 2
+    positions %= box_size
+    positions -= box_size / 2  # end the unwrap
+    distances = np.linalg.norm(positions, axis=1)
+
+    # Restrict particles to the 30 kpc aperture
+    extract = distances < 30.0
+    positions = positions[extract]
+    velocities = velocities[extract] - centre_velocities[labels[extract]]
+    masses = masses[extract]
+    distances = distances[extract]
+    labels = labels[extract]
+
+    offsets = np.zeros(number_of_haloes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=number_of_haloes), out=offsets[1:])
+
+    # Compute 30kpc CoM to Sub CoM velocty offset & recenter
+    Mstar = segment_sum(masses, offsets)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dvVmass = segment_sum(masses[:, np.newaxis] * velocities, offsets)
+        dvVmass /= Mstar[:, np.newaxis]
+    velocities -= dvVmass[labels]
+
+    # Compute momentum
+    smomentums = np.cross(positions, velocities)
+    msmomentums = masses[:, np.newaxis] * smomentums
+    momentum = segment_sum(msmomentums, offsets)
+    msmomentums[distances >= 5.0] = 0.0
+    momentum_inner_5kpc = segment_sum(msmomentums, offsets)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+
+        # Compute specific angular momentum
+        sa_momentum = np.linalg.norm(momentum / Mstar[:, np.newaxis], axis=1)
+
+        # Compute rotational velocities
+        direction = momentum / np.linalg.norm(momentum, axis=1)[:, np.newaxis]
+        smomentumz = np.sum(direction[labels] * smomentums, axis=1)
+        cyldistances = (
+            distances ** 2 - np.sum(direction[labels] * positions, axis=1) ** 2
+        )
+        cyldistances = np.sqrt(np.abs(cyldistances))
+
+        cylmin = segment_min(np.where(cyldistances > 0, cyldistances, np.inf), offsets)
+
+        # Compute kappa_co
+        Mvrot2, Mv2 = kappa_sums(
+            labels=labels,
+            masses=masses,
+            smomentumz=smomentumz,
+            cyldistances=cyldistances,
+            cylmin=cylmin,
+            speeds2=np.linalg.norm(velocities, axis=1) ** 2,
+        )
+        kappa_co = Mvrot2 / Mv2
+
+        momentum_inner_5kpc /= np.linalg.norm(momentum_inner_5kpc, axis=1)[
+            :, np.newaxis
+        ]
+
+    # Calculate axis ratios
+    if iterative:
+        axis_ratios = np.array(
+            [
+                AxialRatios(positions[start:end], masses[start:end], iterative=True)
+                for start, end in zip(offsets[:-1], offsets[1:])
+            ]
+        ).reshape(number_of_haloes, 3)
+        return kappa_co, sa_momentum, momentum_inner_5kpc, axis_ratios
+
+    # MoI tensors of all haloes (see AxialRatios). Particles at the centre have
+    # all products equal to zero and do not contribute
+    x, y, z = positions[:, 0], positions[:, 1], positions[:, 2]
+    products = np.empty((6, len(masses)))
+    np.multiply(y, y, out=products[0])
+    np.multiply(x, x, out=products[1])
+    np.multiply(z, z, out=products[5])
+    np.add(products[1], products[0], out=products[2])
+    products[1] += products[5]
+    products[0] += products[5]
+    np.multiply(x, y, out=products[3])
+    np.multiply(x, z, out=products[4])
+    np.multiply(y, z, out=products[5])
+    np.copysign(np.sqrt(np.abs(products)), products, out=products)
+    products *= masses
+    I_xx, I_yy, I_zz, I_xy, I_xz, I_yz = segment_sum(products.T, offsets).T
+
+    I = np.empty((number_of_haloes, 3, 3))
+    I[:, 0, 0], I[:, 1, 1], I[:, 2, 2] = I_xx, I_yy, I_zz
+    I[:, 0, 1] = I[:, 1, 0] = -I_xy
+    I[:, 0, 2] = I[:, 2, 0] = -I_xz
+    I[:, 1, 2] = I[:, 2, 1] = -I_yz
+
+    # Eigenvalues in decreasing order
+    W = np.linalg.eigvalsh(I)[:, ::-1]
+    W1, W2, W3 = W[:, 0], W[:, 1], W[:, 2]
+
+    # compute axes (unnormalised as we don't need absolute values)
+    a = np.sqrt(np.abs(W1 + W2 - W3))
+    b = np.sqrt(np.abs(W1 + W3 - W2))
+    c = np.sqrt(np.abs(W2 + W3 - W1))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        axis_ratios = np.column_stack([c / a, c / b, b / a])
+
+    return kappa_co, sa_momentum, momentum_inner_5kpc, axis_ratios
+
+
 def AsymFrac(rs, ms, level=1):
     """
     rs - CoM subtracted positions of *selected* particles in galactic units
@@ -208,46 +485,43 @@ class GravPot:
         return np.interp(E, self.E_t, self.jc_t)
 
 
-def AxialRatios(rs, ms):
+def AxialRatios(rs, ms, iterative=False):
     """
     rs - CoM subtracted positions of *selected* particles in galactic units
     ms - *selected* particle masses in galactic units
-    zaza"""
+    iterative - if True, use the iterative shape measurement (IterativeAxialRatios)
+    """
     radius = np.linalg.norm(rs[:, :3], axis=1)
     rs = rs[radius > 0, :]
     ms = ms[radius > 0]
-    rs2 = rs ** 2
+
+    if iterative:
+        return IterativeAxialRatios(rs, ms)
+
+    # Products entering the MoI tensor: yy+zz, xx+zz, xx+yy, xy, xz, yz
+    x, y, z = rs[:, 0], rs[:, 1], rs[:, 2]
+    products = np.empty((6, len(ms)))
+    np.multiply(y, y, out=products[0])
+    np.multiply(x, x, out=products[1])
+    np.multiply(z, z, out=products[5])
+    np.add(products[1], products[0], out=products[2])
+    products[1] += products[5]
+    products[0] += products[5]
+    np.multiply(x, y, out=products[3])
+    np.multiply(x, z, out=products[4])
+    np.multiply(y, z, out=products[5])
+
+    # Each product p contributes p / |p|^0.5 = sign(p) |p|^0.5, which is zero for
+    # p = 0 (no NaN to filter). All components are summed with weights ms at once
+    np.copysign(np.sqrt(np.abs(products)), products, out=products)
+    I_xx, I_yy, I_zz, I_xy, I_xz, I_yz = products @ ms
 
     # construct MoI tensor
-    I_xx = (
-        rs2[:, [1, 2]].sum(axis=-1) / abs((rs2[:, [1, 2]].sum(axis=-1)) ** 0.5)
-    ) * ms
-    I_xx = I_xx[np.isnan(I_xx) == False]  # remove nans
-    I_xx = I_xx.sum()
-    I_yy = (
-        rs2[:, [0, 2]].sum(axis=-1) / abs((rs2[:, [0, 2]].sum(axis=-1)) ** 0.5)
-    ) * ms
-    I_yy = I_yy[np.isnan(I_yy) == False]
-    I_yy = I_yy.sum()
-    I_zz = (
-        rs2[:, [0, 1]].sum(axis=-1) / abs((rs2[:, [0, 1]].sum(axis=-1)) ** 0.5)
-    ) * ms
-    I_zz = I_zz[np.isnan(I_zz) == False]
-    I_zz = I_zz.sum()
-    I_xy = -((rs[:, 0] * rs[:, 1] / abs(rs[:, 0] * rs[:, 1]) ** 0.5) * ms)
-    I_xy = I_xy[np.isnan(I_xy) == False]
-    I_xy = I_xy.sum()
-    I_xz = -((rs[:, 0] * rs[:, 2] / abs(rs[:, 0] * rs[:, 2]) ** 0.5) * ms)
-    I_xz = I_xz[np.isnan(I_xz) == False]
-    I_xz = I_xz.sum()
-    I_yz = -((rs[:, 1] * rs[:, 2] / abs(rs[:, 1] * rs[:, 2]) ** 0.5) * ms)
-    I_yz = I_yz[np.isnan(I_yz) == False]
-    I_yz = I_yz.sum()
-    I = np.array([[I_xx, I_xy, I_xz], [I_xy, I_yy, I_yz], [I_xz, I_yz, I_zz]])
-
-    # Get and order eigenvalues
-    W, V = np.linalg.eig(I)
-    W1, W2, W3 = np.sort(W)[::-1]
+    I = np.array([[I_xx, -I_xy, -I_xz], [-I_xy, I_yy, -I_yz], [-I_xz, -I_yz, I_zz]])
+
+    # Eigenvalues of the symmetric tensor in decreasing order (as in
+    # calculate_morphology_batched)
+    W1, W2, W3 = np.linalg.eigvalsh(I)[::-1]
 
     # compute axes (unnormalised as we don't need absolute values)
     a = np.sqrt(np.abs(W1 + W2 - W3))
@@ -257,6 +531,50 @@ def AxialRatios(rs, ms):
     return c / a, c / b, b / a
 
 
+def IterativeAxialRatios(rs, ms, max_iterations=100, tolerance=1e-3):
+    """
+    Iterative shape measurement (Dubinski & Carlberg 1991): the reduced shape
+    tensor S_ij = sum m x_i x_j / r_ell^2 is computed with the ellipsoidal radius
+    r_ell^2 = x^2 + (y/q)^2 + (z/s)^2 in the principal frame of the previous
+    iteration, until the axis ratios q = b/a and s = c/a converge. All provided
+    particles are used in every iteration
+
+    rs - CoM subtracted positions of *selected* particles (non-zero radii)
+    ms - *selected* particle masses
+    max_iterations - maximum number of iterations
+    tolerance - maximum relative change of q and s at convergence
+    Returns c/a, c/b and b/a
+    """
+    if len(ms) < 3:
+        return np.nan, np.nan, np.nan
+
+    q, s = 1.0, 1.0
+    axes = np.eye(3)
+
+    for _ in range(max_iterations):
+        principal = rs @ axes
+        r_ell2 = principal[:, 0] ** 2 + (principal[:, 1] / q) ** 2
+        r_ell2 += (principal[:, 2] / s) ** 2
+
+        weighted = rs * (ms / r_ell2)[:, np.newaxis]
+        S = weighted.T @ rs
+
+        # Eigenvectors ordered by decreasing eigenvalue: major, middle, minor axes
+        W, V = np.linalg.eigh(S)
+        W, axes = W[::-1], V[:, ::-1]
+        if W[0] <= 0.0 or W[2] <= 0.0:
+            return np.nan, np.nan, np.nan
+
+        q_new = np.sqrt(W[1] / W[0])
+        s_new = np.sqrt(W[2] / W[0])
+        converged = abs(q_new - q) <= tolerance * q and abs(s_new - s) <= tolerance * s
+        q, s = q_new, s_new
+        if converged:
+            break
+
+    return s, s / q, q
+
+
 def DiscFraction(ms, jzs):
     """
     rs - CoM subtracted positions of *selected* particles in galactic units
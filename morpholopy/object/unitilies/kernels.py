@@ -0,0 +1,634 @@
+"""
+Kernels for the per-particle loops: pixel deposits, kappa_co sums and the
+grouping of values into bins for the binned statistics (BinnedStatistics).
+Every kernel has a NumPy implementation and, if numba is installed, a compiled
+one. Both give identical results: the sums are accumulated particle by particle
+in the same order, and the binned values are sorted before any statistics are
+computed. The compiled kernels are used by default when numba is available
+"""
+
+import numpy as np
+from typing import List, Optional, Tuple
+
+try:
+    import numba
+
+    numba_available = True
+except ImportError:
+    numba_available = False
+
+# Kernels used when no backend is given: "numba" or "numpy"
+default_backend = "numba" if numba_available else "numpy"
+
+
+def _deposit_loop(cells, weights, images):
+    # Loop of deposit_on_cells, accumulating in the particle order as np.bincount
+    count = images.shape[0] - 1
+    for quantity in range(count):
+        for particle in range(cells.shape[0]):
+            images[quantity, cells[particle]] += weights[quantity, particle]
+    for particle in range(cells.shape[0]):
+        images[count, cells[particle]] += 1.0
+
+
+def _kappa_sums_loop(
+    labels, masses, smomentumz, cyldistances, cylmin, speeds2, Mvrot2, Mv2
+):
+    # Loop of kappa_sums, accumulating in the particle order as np.bincount
+    for particle in range(labels.shape[0]):
+        label = labels[particle]
+
+        if np.isfinite(cylmin[label]):
+            cyldistance = cyldistances[particle]
+            if cyldistance == 0.0:
+                cyldistance = cylmin[label]
+            vrot = smomentumz[particle] / cyldistance
+        else:
+            vrot = smomentumz[particle]
+
+        if vrot > 0.0:
+            Mvrot2[label] += masses[particle] * (vrot * vrot)
+        Mv2[label] += masses[particle] * speeds2[particle]
+
+
+def _group_into_bins_loop(bins, values, offsets, grouped_values):
+    # Counting sort of the values by bin, keeping their order within each bin
+    position = offsets[:-1].copy()
+    for item in range(bins.shape[0]):
+        bin_index = bins[item]
+        if bin_index >= 0:
+            for row in range(values.shape[0]):
+                grouped_values[row, position[bin_index]] = values[row, item]
+            position[bin_index] += 1
+
+
+if numba_available:
+    _deposit_numba = numba.njit(cache=True)(_deposit_loop)
+    _kappa_sums_numba = numba.njit(cache=True, error_model="numpy")(_kappa_sums_loop)
+    _group_into_bins_numba = numba.njit(cache=True)(_group_into_bins_loop)
+
+
+def deposit_on_cells(
+    cells: np.ndarray,
+    weights: np.ndarray,
+    number_of_cells: int,
+    backend: Optional[str] = None,
+) -> np.ndarray:
+    """
+    Sums particle quantities in cells and counts the particles in each cell
+
+    Parameters
+    ----------
+    cells: np.ndarray
+    Cell index of each particle
+
+    weights: np.ndarray
+    Array of shape (number of quantities, number of particles)
+
+    number_of_cells: int
+    Total number of cells
+
+    backend: Optional[str]
+    "numba" or "numpy". By default, default_backend
+
+    Returns
+    -------
+    Output: np.ndarray
+    Array of shape (number of quantities + 1, number_of_cells) with the summed
+    quantities, followed by the number of particles in each cell
+    """
+
+    images = np.zeros((len(weights) + 1, number_of_cells))
+
+    if (backend or default_backend) == "numba":
+        _deposit_numba(
+            np.ascontiguousarray(cells, dtype=np.int64),
+            np.ascontiguousarray(weights, dtype=np.float64).reshape(
+                len(weights), len(cells)
+            ),
+            images,
+        )
+        return images
+
+    for image, weight in zip(images, weights):
+        image[:] = np.bincount(cells, weights=weight, minlength=number_of_cells)
+    images[-1] = np.bincount(cells, minlength=number_of_cells)
+
+    return images
+
+
+def kappa_sums(
+    labels: np.ndarray,
+    masses: np.ndarray,
+    smomentumz: np.ndarray,
+    cyldistances: np.ndarray,
+    cylmin: np.ndarray,
+    speeds2: np.ndarray,
+    backend: Optional[str] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the rotational velocities of the particles and sums up the terms of
+    kappa_co in each halo. Zero cylindrical distances are replaced by the
+    smallest positive distance in the halo; in haloes without positive distances
+    the rotational velocity is the specific angular momentum along the spin axis
+
+    Parameters
+    ----------
+    labels: np.ndarray
+    Index of the halo of each particle
+
+    masses: np.ndarray
+    Particle masses
+
+    smomentumz: np.ndarray
+    Specific angular momenta along the spin axis of the halo
+
+    cyldistances: np.ndarray
+    Distances to the spin axis of the halo
+
+    cylmin: np.ndarray
+    Smallest positive distance to the spin axis in each halo, or infinity
+
+    speeds2: np.ndarray
+    Squared particle speeds
+
+    backend: Optional[str]
+    "numba" or "numpy". By default, default_backend
+
+    Returns
+    -------
+    Output: Tuple[np.ndarray, np.ndarray]
+    Sum of m vrot^2 over the particles with vrot > 0, and sum of m v^2, in each
+    halo
+    """
+
+    if (backend or default_backend) == "numba":
+        Mvrot2 = np.zeros(len(cylmin))
+        Mv2 = np.zeros(len(cylmin))
+        _kappa_sums_numba(
+            np.ascontiguousarray(labels, dtype=np.int64),
+            np.ascontiguousarray(masses, dtype=np.float64),
+            np.ascontiguousarray(smomentumz, dtype=np.float64),
+            np.ascontiguousarray(cyldistances, dtype=np.float64),
+            np.ascontiguousarray(cylmin, dtype=np.float64),
+            np.ascontiguousarray(speeds2, dtype=np.float64),
+            Mvrot2,
+            Mv2,
+        )
+        return Mvrot2, Mv2
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        has_cylmin = np.isfinite(cylmin)[labels]
+        cyldistances = np.where(cyldistances == 0, cylmin[labels], cyldistances)
+        vrots = np.where(has_cylmin, smomentumz / cyldistances, smomentumz)
+
+    rotating = vrots > 0
+    Mvrot2 = np.bincount(
+        labels[rotating],
+        weights=masses[rotating] * (vrots[rotating] * vrots[rotating]),
+        minlength=len(cylmin),
+    )
+    Mv2 = np.bincount(labels, weights=masses * speeds2, minlength=len(cylmin))
+
+    return Mvrot2, Mv2
+
+
+def bin_indices(
+    x: np.ndarray, edges: np.ndarray, include_left_edges: bool = False
+) -> np.ndarray:
+    """
+    Index of the bin of each value. A value belongs to bin i if
+    edges[i] < x < edges[i + 1], or, with include_left_edges, if
+    edges[i] <= x < edges[i + 1] (as np.digitize)
+
+    Parameters
+    ----------
+    x: np.ndarray
+    Quantity defining the bins
+
+    edges: np.ndarray
+    Increasing bin edges
+
+    include_left_edges: bool
+    Whether values on the left edge of a bin belong to the bin
+
+    Returns
+    -------
+    Output: np.ndarray
+    Bin of each value; -1 for values outside the bins or NaN
+    """
+
+    x = np.asarray(x)
+    number_of_bins = len(edges) - 1
+
+    if include_left_edges:
+        bins = np.searchsorted(edges, x, side="right") - 1
+        return np.where(bins < number_of_bins, bins, -1)
+
+    # Index of the first edge >= x; x is inside a bin if that edge is not x itself
+    upper = np.searchsorted(edges, x, side="left")
+    inside = (upper > 0) & (upper <= number_of_bins)
+    inside[inside] = x[inside] != edges[upper[inside]]
+
+    return np.where(inside, upper - 1, -1)
+
+
+def group_into_bins(
+    x: np.ndarray,
+    values: List[np.ndarray],
+    edges: np.ndarray,
+    include_left_edges: bool = False,
+    backend: Optional[str] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Groups values into the bins of x, keeping their order within each bin, so
+    the values of different arrays stay paired. Values outside the bins (see
+    bin_indices) are dropped
+
+    Parameters
+    ----------
+    x: np.ndarray
+    Quantity defining the bins
+
+    values: List[np.ndarray]
+    Arrays with the same length as x to group
+
+    edges: np.ndarray
+    Increasing bin edges
+
+    include_left_edges: bool
+    Whether values on the left edge of a bin belong to the bin
+
+    backend: Optional[str]
+    "numba" or "numpy". By default, default_backend
+
+    Returns
+    -------
+    Output: Tuple[np.ndarray, np.ndarray]
+    Start of each bin followed by the number of grouped values, and an array of
+    shape (len(values), number of grouped values) with the values of bin i in the
+    columns offsets[i]:offsets[i + 1]
+    """
+
+    x = np.asarray(x)
+    values = np.array(values, dtype=np.float64, ndmin=2).reshape(len(values), len(x))
+    number_of_bins = len(edges) - 1
+
+    bins = bin_indices(x, edges, include_left_edges)
+    inside = bins >= 0
+
+    offsets = np.zeros(number_of_bins + 1, dtype=np.int64)
+    np.cumsum(np.bincount(bins[inside], minlength=number_of_bins), out=offsets[1:])
+
+    grouped_values = np.empty((len(values), offsets[-1]))
+
+    # A counting sort (compiled), or a stable radix sort of the bin indices
+    if (backend or default_backend) == "numba":
+        _group_into_bins_numba(bins.astype(np.int64), values, offsets, grouped_values)
+    else:
+        bin_type = np.int16 if number_of_bins < 2 ** 15 else np.int64
+        order = np.argsort(bins[inside].astype(bin_type), kind="stable")
+        for row, value in enumerate(values):
+            grouped_values[row] = value[inside][order]
+
+    return offsets, grouped_values
+
+
+def sort_within_bins(grouped_values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Sorts grouped values in increasing order within each bin
+
+    Parameters
+    ----------
+    grouped_values: np.ndarray
+    Array of shape (number of arrays, number of values) grouped by bin (see
+    group_into_bins)
+
+    offsets: np.ndarray
+    Start of each bin followed by the number of values
+
+    Returns
+    -------
+    Output: np.ndarray
+    Sorted copy of the values
+    """
+
+    # One sort of each row by bin, then by value. NaN values go last in their bin
+    labels = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    sorted_values = np.empty_like(grouped_values)
+    for row, value in enumerate(grouped_values):
+        sorted_values[row] = value[np.lexsort((value, labels))]
+
+    return sorted_values
+
+
+def sort_into_bins(
+    x: np.ndarray,
+    values: List[np.ndarray],
+    edges: np.ndarray,
+    include_left_edges: bool = False,
+    backend: Optional[str] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Groups values into the bins of x and sorts them within each bin. Values
+    outside the bins (see bin_indices) are dropped
+
+    Parameters
+    ----------
+    x: np.ndarray
+    Quantity defining the bins
+
+    values: List[np.ndarray]
+    Arrays with the same length as x to group
+
+    edges: np.ndarray
+    Increasing bin edges
+
+    include_left_edges: bool
+    Whether values on the left edge of a bin belong to the bin
+
+    backend: Optional[str]
+    "numba" or "numpy". By default, default_backend
+
+    Returns
+    -------
+    Output: Tuple[np.ndarray, np.ndarray]
+    Start of each bin followed by the number of grouped values, and an array of
+    shape (len(values), number of grouped values) with the values of bin i in the
+    columns offsets[i]:offsets[i + 1], sorted in increasing order
+    """
+
+    offsets, grouped_values = group_into_bins(
+        x, values, edges, include_left_edges, backend
+    )
+
+    return offsets, sort_within_bins(grouped_values, offsets)
+
+
+def binned_median(sorted_values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Medians of sorted values in bins, as computed by np.median
+
+    Parameters
+    ----------
+    sorted_values: np.ndarray
+    Values sorted within each bin (see sort_into_bins)
+
+    offsets: np.ndarray
+    Start of each bin followed by the number of values
+
+    Returns
+    -------
+    Output: np.ndarray
+    Median in each bin; NaN for empty bins and bins containing NaN
+    """
+
+    counts = np.diff(offsets)
+    medians = np.full(len(counts), np.nan)
+
+    nonempty = counts > 0
+    lower = offsets[:-1][nonempty] + (counts[nonempty] - 1) // 2
+    upper = offsets[:-1][nonempty] + counts[nonempty] // 2
+    medians[nonempty] = (sorted_values[lower] + sorted_values[upper]) / 2.0
+
+    # Odd counts: the middle value itself
+    odd = lower == upper
+    medians[np.flatnonzero(nonempty)[odd]] = sorted_values[lower[odd]]
+
+    # NaN is sorted last, and the median of data with NaN is NaN
+    medians[nonempty] = np.where(
+        np.isnan(sorted_values[offsets[1:][nonempty] - 1]), np.nan, medians[nonempty]
+    )
+
+    return medians
+
+
+def binned_percentile(
+    sorted_values: np.ndarray, offsets: np.ndarray, percentile: float
+) -> np.ndarray:
+    """
+    Percentiles of sorted values in bins, as computed by np.percentile with the
+    default (linear) method
+
+    Parameters
+    ----------
+    sorted_values: np.ndarray
+    Values sorted within each bin (see sort_into_bins)
+
+    offsets: np.ndarray
+    Start of each bin followed by the number of values
+
+    percentile: float
+    Percentile between 0 and 100
+
+    Returns
+    -------
+    Output: np.ndarray
+    Percentile in each bin; NaN for empty bins and bins containing NaN
+    """
+
+    counts = np.diff(offsets)
+    percentiles = np.full(len(counts), np.nan)
+
+    nonempty = counts > 0
+    n = counts[nonempty]
+    quantile = np.true_divide(percentile, 100)
+
+    virtual_index = (n - 1) * quantile
+    previous_index = np.floor(virtual_index)
+    gamma = virtual_index - previous_index
+    previous_index = previous_index.astype(np.int64)
+    next_index = previous_index + 1
+
+    # Beyond the last value, np.percentile takes the last value
+    above = virtual_index >= n - 1
+    previous_index[above] = n[above] - 1
+    next_index[above] = n[above] - 1
+
+    a = sorted_values[offsets[:-1][nonempty] + previous_index]
+    b = sorted_values[offsets[:-1][nonempty] + next_index]
+
+    # Same linear interpolation as np.percentile (numpy's _lerp)
+    diff_b_a = b - a
+    lerp = a + diff_b_a * gamma
+    lerp = np.where(gamma >= 0.5, b - diff_b_a * (1 - gamma), lerp)
+
+    has_nan = np.isnan(sorted_values[offsets[1:][nonempty] - 1])
+    percentiles[nonempty] = np.where(has_nan, np.nan, lerp)
+
+    return percentiles
+
+
+def binned_mean(
+    grouped_values: np.ndarray,
+    offsets: np.ndarray,
+    grouped_weights: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Means, or weighted means, of grouped values in bins
+
+    Parameters
+    ----------
+    grouped_values: np.ndarray
+    Values grouped by bin (see group_into_bins)
+
+    offsets: np.ndarray
+    Start of each bin followed by the number of values
+
+    grouped_weights: Optional[np.ndarray]
+    Weights grouped with the values; by default, all values have equal weights
+
+    Returns
+    -------
+    Output: np.ndarray
+    Mean in each bin; NaN for empty bins and bins with zero total weight
+    """
+
+    if grouped_weights is None:
+        grouped_weights = np.ones(len(grouped_values))
+
+    counts = np.diff(offsets)
+    means = np.full(len(counts), np.nan)
+
+    nonempty = counts > 0
+    if not np.any(nonempty):
+        return means
+
+    starts = offsets[:-1][nonempty]
+    sums = np.add.reduceat(grouped_values * grouped_weights, starts)
+    total_weights = np.add.reduceat(grouped_weights, starts)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means[nonempty] = sums / total_weights
+
+    return means
+
+
+class BinnedStatistics:
+    """
+    Statistics of one or more quantities in bins of x. The values are grouped by
+    bin once; the counts, means, medians and percentiles of all bins are then
+    computed from the bin boundaries. The values are sorted within the bins only
+    once, when the first median or percentile is requested
+    """
+
+    def __init__(
+        self,
+        x: np.ndarray,
+        values: List[np.ndarray],
+        edges: np.ndarray,
+        weights: Optional[np.ndarray] = None,
+        include_left_edges: bool = False,
+        backend: Optional[str] = None,
+    ):
+        """
+        Parameters
+        ----------
+        x: np.ndarray
+        Quantity defining the bins
+
+        values: List[np.ndarray]
+        Arrays with the same length as x, one for each quantity
+
+        edges: np.ndarray
+        Increasing bin edges
+
+        weights: Optional[np.ndarray]
+        Weights of the values in the means; by default, equal weights
+
+        include_left_edges: bool
+        Whether values on the left edge of a bin belong to the bin (see
+        bin_indices)
+
+        backend: Optional[str]
+        "numba" or "numpy". By default, default_backend
+        """
+
+        rows = list(values) if weights is None else list(values) + [weights]
+        self.offsets, grouped_values = group_into_bins(
+            x, rows, edges, include_left_edges, backend
+        )
+
+        self.grouped_values = grouped_values[: len(values)]
+        self.grouped_weights = None if weights is None else grouped_values[-1]
+        self.sorted_values: Optional[np.ndarray] = None
+
+    @property
+    def counts(self) -> np.ndarray:
+        """
+        Number of values in each bin
+        """
+        return np.diff(self.offsets)
+
+    def mean(self, row: int) -> np.ndarray:
+        """
+        Mean of a quantity in each bin, weighted by the weights if given
+
+        Parameters
+        ----------
+        row: int
+        Index of the quantity
+
+        Returns
+        -------
+        Output: np.ndarray
+        Mean in each bin; NaN for empty bins
+        """
+
+        return binned_mean(self.grouped_values[row], self.offsets, self.grouped_weights)
+
+    def median(self, row: int) -> np.ndarray:
+        """
+        Median of a quantity in each bin, as computed by np.median
+
+        Parameters
+        ----------
+        row: int
+        Index of the quantity
+
+        Returns
+        -------
+        Output: np.ndarray
+        Median in each bin; NaN for empty bins and bins containing NaN
+        """
+
+        return binned_median(self.sorted(row), self.offsets)
+
+    def percentile(self, row: int, percentile: float) -> np.ndarray:
+        """
+        Percentile of a quantity in each bin, as computed by np.percentile
+
+        Parameters
+        ----------
+        row: int
+        Index of the quantity
+
+        percentile: float
+        Percentile between 0 and 100
+
+        Returns
+        -------
+        Output: np.ndarray
+        Percentile in each bin; NaN for empty bins and bins containing NaN
+        """
+
+        return binned_percentile(self.sorted(row), self.offsets, percentile)
+
+    def sorted(self, row: int) -> np.ndarray:
+        """
+        Values of a quantity sorted within each bin
+
+        Parameters
+        ----------
+        row: int
+        Index of the quantity
+
+        Returns
+        -------
+        Output: np.ndarray
+        Sorted values
+        """
+
+        if self.sorted_values is None:
+            self.sorted_values = sort_within_bins(self.grouped_values, self.offsets)
+        return self.sorted_values[row]
@@ -1,4 +1,7 @@
 import numpy as np
+import hashlib
+import glob
+import os
 
 
 #####
@@ -99,3 +102,149 @@ def BiPowInterp(x_nodes, y_nodes, gridvals, x, y):
     f_out = 10 ** ((ydiff1 * f_1 + ydiff2 * f_2) / ydiff3)
 
     return f_out
+
+
+def MakeGridStack(grids):
+    """
+    Stacks the photometry grids of several filters sharing the same (Z, age)
+    nodes, so that they can be interpolated in one pass with BiPowInterpStack
+
+    grids - dict with the output of MakeGrid for each filter
+    Returns the list of filters, the stacked grid of log10 fluxes with the shape
+    (n_filters, n_Z, n_age), and the Z and age nodes; None if the nodes differ
+    """
+    filters = list(grids.keys())
+    _, Z_points, age_points = grids[filters[0]]
+
+    for filt in filters:
+        _, Z_p, t_p = grids[filt]
+        if not (np.array_equal(Z_p, Z_points) and np.array_equal(t_p, age_points)):
+            return None
+
+    old_settings = np.seterr(all="ignore")
+    log_fluxs = np.log10(np.stack([grids[filt][0] for filt in filters]))
+    np.seterr(**old_settings)
+
+    return filters, log_fluxs, Z_points, age_points
+
+
+def BiPowInterpStack(x_nodes, y_nodes, log_gridvals, x, y):
+    """
+    Same as BiPowInterp for a stack of grids of log10 values with the shape
+    (n_grids, y_nodes.size, x_nodes.size). The bins and interpolation weights of
+    the points are computed once and applied to all grids
+    Returns an array with the shape (n_grids, x.size)
+    """
+    old_settings = np.seterr(all="ignore")
+
+    x_nodes = np.clip(np.log10(x_nodes), -100, 100)
+    y_nodes = np.clip(np.log10(y_nodes), -4, 100)
+
+    x = np.clip(np.log10(x), -100, 100)
+    y = np.clip(np.log10(y), -4, 100)
+
+    x_clip = np.clip(x, x_nodes.min(), (x_nodes.max()))
+    y_clip = np.clip(y, y_nodes.min(), (y_nodes.max()))
+
+    x_digi = np.clip(np.digitize(x_clip, x_nodes), -1, x_nodes.size - 1)
+    y_digi = np.clip(np.digitize(y_clip, y_nodes), -1, y_nodes.size - 1)
+
+    f_11 = log_gridvals[:, y_digi - 1, x_digi - 1]
+    f_12 = log_gridvals[:, y_digi, x_digi - 1]
+    f_21 = log_gridvals[:, y_digi - 1, x_digi]
+    f_22 = log_gridvals[:, y_digi, x_digi]
+
+    xdiff1 = x_nodes[x_digi] - x_clip
+    xdiff2 = x_clip - x_nodes[x_digi - 1]
+    xdiff3 = x_nodes[x_digi] - x_nodes[x_digi - 1]
+
+    f_1 = (f_11 * xdiff1 + f_21 * xdiff2) / xdiff3
+    f_2 = (f_12 * xdiff1 + f_22 * xdiff2) / xdiff3
+
+    ydiff1 = y_nodes[y_digi] - y_clip
+    ydiff2 = y_clip - y_nodes[y_digi - 1]
+    ydiff3 = y_nodes[y_digi] - y_nodes[y_digi - 1]
+    f_out = 10 ** ((ydiff1 * f_1 + ydiff2 * f_2) / ydiff3)
+
+    return f_out
+
+
+# Arrays forming a cached grid stack, in the order returned by MakeGridStack
+grid_stack_arrays = ("filters", "log_fluxs", "Z_points", "age_points")
+
+
+def CacheDirectory():
+    """
+    Returns the directory of the morpholopy cache files:
+    $XDG_CACHE_HOME/morpholopy, or ~/.cache/morpholopy if XDG_CACHE_HOME is not set
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "morpholopy")
+
+
+def GridCachePrefix(directory, paths):
+    """
+    Returns the path prefix of the cache files of the grid stack made from the
+    photometry tables in a directory. The files are kept in CacheDirectory() and
+    the cache key is the hash of the tables
+
+    directory - directory with the photometry tables
+    paths - paths to the photometry tables
+    """
+    key = hashlib.sha1()
+    for path in sorted(paths):
+        key.update(os.path.basename(path).encode())
+        with open(path, "rb") as table:
+            key.update(table.read())
+
+    system = os.path.basename(directory.rstrip("/"))
+    return f"{CacheDirectory()}/{system}.grid_cache_{key.hexdigest()[:16]}."
+
+
+def LoadGridStack(cache_prefix):
+    """
+    Memory-maps a grid stack saved by SaveGridStack
+    Returns None if there is no cache with the provided prefix
+    """
+    arrays = []
+    for name in grid_stack_arrays:
+        path = f"{cache_prefix}{name}.npy"
+        if not os.path.isfile(path):
+            return None
+        arrays.append(np.load(path, mmap_mode="r"))
+
+    filters, log_fluxs, Z_points, age_points = arrays
+    return [str(filt) for filt in filters], log_fluxs, Z_points, age_points
+
+
+def SaveGridStack(cache_prefix, grid_stack):
+    """
+    Saves a grid stack from MakeGridStack to the cache files and removes the cache
+    files made from other versions of the photometry tables
+    """
+    stale_prefix = cache_prefix[: cache_prefix.rindex(".grid_cache_")]
+
+    try:
+        os.makedirs(os.path.dirname(cache_prefix), exist_ok=True)
+
+        for path in glob.glob(f"{stale_prefix}.grid_cache_*.npy"):
+            if not path.startswith(cache_prefix):
+                os.remove(path)
+
+        filters, log_fluxs, Z_points, age_points = grid_stack
+        for name, array in zip(
+            grid_stack_arrays, [np.array(filters), log_fluxs, Z_points, age_points]
+        ):
+            path = f"{cache_prefix}{name}.npy"
+
+            # Write to a temporary file first so that an interrupted run does not
+            # leave a truncated cache behind
+            temporary_path = f"{path}.{os.getpid()}.tmp"
+            with open(temporary_path, "wb") as cache_file:
+                np.save(cache_file, array)
+            os.replace(temporary_path, path)
+
+    except OSError as error:
+        print(f"Could not save the photometry grids to {cache_prefix}*.npy: {error}")
@@ -0,0 +1,241 @@
+"""
+Mergeable quantile sketches for the median relations. The values in each bin of
+x are counted in a fine histogram, so the sketch can be updated galaxy by
+galaxy and the sketches of different processes can be added up, without
+keeping the values themselves. The exact smallest and largest value of each
+bin are kept as well, so that quantiles never fall outside the data
+"""
+
+import numpy as np
+from typing import List, Tuple
+
+from .kernels import bin_indices
+
+
+class BinnedQuantileSketch:
+    """
+    Quantiles of one or more quantities in bins of x. Every quantity has a fine
+    histogram with a fixed resolution in each bin of x, extended by an underflow
+    and an overflow bin. The value of a rank is placed within the fine bin that
+    holds it, so it is off by less than the resolution for values within the
+    range of the fine histogram. Beyond the range, it is placed between the
+    range and the smallest or largest value of the bin
+    """
+
+    def __init__(
+        self,
+        edges: np.ndarray,
+        value_ranges: List[Tuple[float, float]],
+        resolution: float = 0.01,
+    ):
+        """
+        Parameters
+        ----------
+        edges: np.ndarray
+        Increasing edges of the bins of x. A value belongs to bin i if
+        edges[i] < x < edges[i + 1]
+
+        value_ranges: List[Tuple[float, float]]
+        Range of the fine histogram of each quantity
+
+        resolution: float
+        Width of the fine bins
+        """
+
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.value_ranges = [tuple(value_range) for value_range in value_ranges]
+        self.resolution = resolution
+
+        number_of_bins = len(self.edges) - 1
+        self.counts = [
+            np.zeros((number_of_bins, self.number_of_fine_bins(row) + 2))
+            for row in range(len(self.value_ranges))
+        ]
+        self.minima = np.full((len(self.value_ranges), number_of_bins), np.inf)
+        self.maxima = np.full((len(self.value_ranges), number_of_bins), -np.inf)
+
+    def number_of_fine_bins(self, row: int) -> int:
+        """
+        Returns the number of fine bins of a quantity, without the underflow and
+        overflow bins
+
+        Parameters
+        ----------
+        row: int
+        Index of the quantity
+
+        Returns
+        -------
+        Output: int
+        Number of fine bins
+        """
+
+        low, high = self.value_ranges[row]
+        return int(round((high - low) / self.resolution))
+
+    def update(self, x: np.ndarray, values: List[np.ndarray]) -> None:
+        """
+        Adds values to the sketch. Values whose x is outside the bins and NaN
+        values are dropped
+
+        Parameters
+        ----------
+        x: np.ndarray
+        Quantity defining the bins
+
+        values: List[np.ndarray]
+        Arrays with the same length as x, one for each quantity
+        """
+
+        bins = bin_indices(x, self.edges)
+
+        for row, (value, counts) in enumerate(zip(values, self.counts)):
+            value = np.asarray(value, dtype=np.float64)
+            keep = (bins >= 0) & ~np.isnan(value)
+            value = value[keep]
+            value_bins = bins[keep]
+
+            # Fine bins start with the underflow bin and end with the overflow bin
+            low, _ = self.value_ranges[row]
+            number_of_fine_bins = self.number_of_fine_bins(row)
+            fine_bins = np.clip(
+                np.floor((value - low) / self.resolution) + 1,
+                0,
+                number_of_fine_bins + 1,
+            ).astype(np.int64)
+
+            counts += np.bincount(
+                value_bins * counts.shape[1] + fine_bins, minlength=counts.size
+            ).reshape(counts.shape)
+            np.minimum.at(self.minima[row], value_bins, value)
+            np.maximum.at(self.maxima[row], value_bins, value)
+
+        return
+
+    def merge(self, other: "BinnedQuantileSketch") -> None:
+        """
+        Adds the values of another sketch with the same bins
+
+        Parameters
+        ----------
+        other: BinnedQuantileSketch
+        Sketch to add
+        """
+
+        for counts, other_counts in zip(self.counts, other.counts):
+            counts += other_counts
+        np.minimum(self.minima, other.minima, out=self.minima)
+        np.maximum(self.maxima, other.maxima, out=self.maxima)
+
+        return
+
+    @property
+    def number_of_values(self) -> np.ndarray:
+        """
+        Number of values of the first quantity in each bin
+        """
+        return self.counts[0].sum(axis=1)
+
+    def value_at_rank(self, row: int, ranks: np.ndarray) -> np.ndarray:
+        """
+        Estimates the value with a given rank in each bin. The values in a fine
+        bin are taken to be spread evenly over the bin, limited to the smallest
+        and largest value in the bin of x, so that the first and last rank give
+        these values exactly
+
+        Parameters
+        ----------
+        row: int
+        Index of the quantity
+
+        ranks: np.ndarray
+        Rank (starting at 0) in each bin, smaller than the number of values
+
+        Returns
+        -------
+        Output: np.ndarray
+        Value with the rank in each bin
+        """
+
+        counts = self.counts[row]
+        cumulative = np.cumsum(counts, axis=1)
+        bins = np.arange(len(counts))
+
+        # Fine bin holding the rank, and the rank within that fine bin
+        fine_bins = np.minimum(
+            np.sum(cumulative <= ranks[:, None], axis=1), counts.shape[1] - 1
+        )
+        in_bin = counts[bins, fine_bins]
+        rank_in_bin = ranks - (cumulative[bins, fine_bins] - in_bin)
+
+        # Edges of that fine bin, limited to the values in the bin of x
+        low, high = self.value_ranges[row]
+        fine_edges = np.linspace(low, high, self.number_of_fine_bins(row) + 1)
+        lower = np.concatenate([[-np.inf], fine_edges])[fine_bins]
+        upper = np.concatenate([fine_edges, [np.inf]])[fine_bins]
+        lower = np.clip(lower, self.minima[row], self.maxima[row])
+        upper = np.clip(upper, self.minima[row], self.maxima[row])
+
+        # A single value in a fine bin is placed at its centre, unless it is the
+        # smallest or largest value in the bin of x
+        single = np.where(
+            lower == self.minima[row],
+            0.0,
+            np.where(upper == self.maxima[row], 1.0, 0.5),
+        )
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fraction = np.where(in_bin > 1, rank_in_bin / (in_bin - 1), single)
+            return lower + fraction * (upper - lower)
+
+    def percentile(self, row: int, percentile: float) -> np.ndarray:
+        """
+        Percentile of a quantity in each bin, interpolated linearly between the
+        values of the neighbouring ranks as np.percentile
+
+        Parameters
+        ----------
+        row: int
+        Index of the quantity
+
+        percentile: float
+        Percentile between 0 and 100
+
+        Returns
+        -------
+        Output: np.ndarray
+        Percentile in each bin; NaN for empty bins
+        """
+
+        number_of_values = self.counts[row].sum(axis=1)
+        nonempty = number_of_values > 0
+
+        rank = percentile / 100.0 * np.maximum(number_of_values - 1, 0)
+        previous_rank = np.floor(rank)
+        next_rank = np.minimum(previous_rank + 1, np.maximum(number_of_values - 1, 0))
+
+        previous_value = self.value_at_rank(row, previous_rank)
+        next_value = self.value_at_rank(row, next_rank)
+
+        with np.errstate(invalid="ignore"):
+            percentiles = previous_value + (rank - previous_rank) * (
+                next_value - previous_value
+            )
+
+        return np.where(nonempty, percentiles, np.nan)
+
+    def median(self, row: int) -> np.ndarray:
+        """
+        Median of a quantity in each bin
+
+        Parameters
+        ----------
+        row: int
+        Index of the quantity
+
+        Returns
+        -------
+        Output: np.ndarray
+        Median in each bin; NaN for empty bins
+        """
+        return self.percentile(row, 50)
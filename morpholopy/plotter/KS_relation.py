@@ -9,94 +9,158 @@ import numpy as np
 from swiftsimio.visualisation.rotation import rotation_matrix_from_vector
 import scipy.stats as stat
 from .loadObservationalData import read_obs_data
+from object.unitilies.kernels import deposit_on_cells, BinnedStatistics
 
 
-def project_pixel_grid(data, mode, res, region, rotation_matrix):
+# Gas quantities deposited onto the pixel grid for each mode
+grid_quantities = {0: "H2", 1: "HI+H2", 2: "SFR", 3: "HI"}
+
+
+def deposit_on_grid(x, y, res, region, weights):
+    """
+    Deposits several particle quantities onto a res x res grid in a single pass
+    over the particle positions. Pixel [i, j] covers the i-th interval in x and
+    the j-th interval in y. Particles outside the region are ignored
+
+    Parameters
+    ----------
+    x: np.ndarray
+    Particle x coordinates
+
+    y: np.ndarray
+    Particle y coordinates
+
+    res: int
+    Number of pixels per side
+
+    region: list
+    Lower and upper bounds of the grid in both directions
+
+    weights: List[np.ndarray]
+    Particle quantities to sum up in each pixel
+
+    Returns
+    -------
+    Output: np.ndarray
+    Array of shape (len(weights) + 1, res, res) with the summed quantities,
+    followed by the number of particles in each pixel
+    """
 
     x_min, x_max = region
     y_min, y_max = region
     x_range = x_max - x_min
     y_range = y_max - y_min
 
-    if mode == 0:
-        m = data[:, 9]  # H2
-    if mode == 1:
-        m = data[:, 9] + data[:, 8]  # H2+HI
-    if mode == 2:
-        m = data[:, 10]  # SFR
-    if mode == 3:
-        m = data[:, 8]  # HI
+    # Truncate towards zero, as int() does
+    particle_cell_x = (res * ((x - x_min) / x_range)).astype(np.int64)
+    particle_cell_y = (res * ((y - y_min) / y_range)).astype(np.int64)
 
-    # Rotate co-ordinates as required
-    x, y, _ = np.matmul(rotation_matrix, data[:, :3].T)
+    inside = (
+        (particle_cell_x >= 0)
+        & (particle_cell_x < res)
+        & (particle_cell_y >= 0)
+        & (particle_cell_y < res)
+    )
+    cells = particle_cell_x[inside] * res + particle_cell_y[inside]
 
-    x = (x - x_min) / x_range
-    y = (y - y_min) / y_range
+    images = deposit_on_cells(
+        cells, np.array([weight[inside] for weight in weights]), res * res
+    )
 
-    image = np.zeros((res, res))
-    maximal_array_index = res
-    inverse_cell_area = res * res
+    return images.reshape(len(weights) + 1, res, res)
 
-    for x_pos, y_pos, mass in zip(x, y, m):
-        particle_cell_x = int(res * x_pos)
-        particle_cell_y = int(res * y_pos)
 
-        if not (
-            particle_cell_x < 0
-            or particle_cell_x >= maximal_array_index
-            or particle_cell_y < 0
-            or particle_cell_y >= maximal_array_index
-        ):
-            image[particle_cell_x, particle_cell_y] += mass * inverse_cell_area
-    return image
+class SparseMap:
+    """
+    Pixel maps of several quantities on a res x res grid, storing only the
+    occupied pixels: their flat indices and the values of each quantity there
+    """
 
+    def __init__(self, res, pixels, values):
+        """
+        Parameters
+        ----------
+        res: int
+        Number of pixels per side
 
-def integrate_metallicity_using_grid(data, res, region, rotation_matrix):
+        pixels: np.ndarray
+        Flat indices of the occupied pixels in increasing order
 
-    x_min, x_max = region
-    y_min, y_max = region
-    x_range = x_max - x_min
-    y_range = y_max - y_min
+        values: dict
+        Values of each quantity at the occupied pixels
+        """
 
-    m = data[:, 12]
+        self.res = res
+        self.pixels = pixels
+        self.values = values
 
-    # Rotate co-ordinates as required
-    x, y, _ = np.matmul(rotation_matrix, data[:, :3].T)
+    def __getitem__(self, name):
+        return self.values[name]
 
-    x = (x - x_min) / x_range
-    y = (y - y_min) / y_range
 
-    image = np.zeros((res, res))
-    num_parts = np.zeros((res, res))
-    maximal_array_index = res
+def project_gas_quantities(x, y, data, res, region):
+    """
+    Computes surface density maps of H2, HI, HI+H2 and SFR (only star-forming
+    particles), and the map of mean metallicity in one pass over the gas
+    particles. Only the pixels containing particles are kept
 
-    for x_pos, y_pos, mass in zip(x, y, m):
-        particle_cell_x = int(res * x_pos)
-        particle_cell_y = int(res * y_pos)
+    Parameters
+    ----------
+    x: np.ndarray
+    Particle x coordinates in the projection plane
 
-        if not (
-            particle_cell_x < 0
-            or particle_cell_x >= maximal_array_index
-            or particle_cell_y < 0
-            or particle_cell_y >= maximal_array_index
-        ):
-            image[particle_cell_x, particle_cell_y] += mass
-            num_parts[particle_cell_x, particle_cell_y] += 1
+    y: np.ndarray
+    Particle y coordinates in the projection plane
 
-    num_parts[num_parts == 0] = 1  # lower value to avoid error
-    image /= num_parts  # Mean metallicity
-    return image
+    data: GasParticles
+    Container with gas properties
 
+    res: int
+    Number of pixels per side
 
-def project_gas(data, mode, resolution, region, rotation_matrix):
+    region: list
+    Lower and upper bounds of the grid in kpc
 
-    image = project_pixel_grid(data, mode, resolution, region, rotation_matrix)
+    Returns
+    -------
+    Output: SparseMap
+    Maps of "H2", "HI", "HI+H2", "SFR", "metals" and particle counts "count"
+    """
 
     x_range = region[1] - region[0]
     y_range = region[1] - region[0]
     area = 1.0 / (x_range * y_range)
-    image *= area
-    return image
+    inverse_cell_area = res * res
+
+    sfr = data.star_formation_rates.copy()
+    sfr[sfr <= 0.0] = 0.0
+
+    images = deposit_on_grid(
+        x,
+        y,
+        res,
+        region,
+        [
+            data.H2_masses * inverse_cell_area,
+            data.HI_masses * inverse_cell_area,
+            data.neutral_masses * inverse_cell_area,
+            sfr * inverse_cell_area,
+            data.metallicities,
+        ],
+    ).reshape(6, res * res)
+
+    pixels = np.flatnonzero(images[-1])
+    H2, HI, neutral, SFR, metals, count = images[:, pixels]
+
+    maps = {"H2": H2, "HI": HI, "HI+H2": neutral, "SFR": SFR}
+    for name in maps:
+        maps[name] *= area
+
+    # Mean metallicity
+    maps["metals"] = metals / count
+    maps["count"] = count
+
+    return SparseMap(res, pixels, maps)
 
 
 def bin_surface(radial_bins):
@@ -108,98 +172,182 @@ def bin_surface(radial_bins):
     return outer - inner
 
 
-def project_metals_with_azimuthal_average(data, rotation_matrix, bin_size):
-    """Returns the mean gas metallicity from each concentric shell"""
+class FaceOnView:
+    """
+    Gas particles of a galaxy seen face-on. The particle coordinates are rotated
+    and the cylindrical radii are computed once; the grid maps and radial profiles
+    are computed on demand and memoized
+    """
 
-    m = data[:, 12]
+    def __init__(self, data, ang_momentum):
+        """
+        Parameters
+        ----------
+        data: GasParticles
+        Container with gas properties
 
-    # Rotate co-ordinates as required
-    x, y, _ = np.matmul(rotation_matrix, data[:, :3].T)
-    r = np.sqrt(x ** 2 + y ** 2)
+        ang_momentum: np.ndarray
+        Vector pointing along the line of sight
+        """
 
-    # Define radial bins [log scale, kpc units]
-    radial_bins = np.arange(0, 40, bin_size)
-    MeanMetals, _, _ = stat.binned_statistic(
-        x=r,
-        values=m,
-        statistic="mean",
-        bins=radial_bins,
-    )
-
-    return MeanMetals
+        self.data = data
 
+        face_on_rotation_matrix = rotation_matrix_from_vector(ang_momentum)
 
-def project_gas_with_azimuthal_average(data, mode, rotation_matrix, bin_size):
+        # Rotate co-ordinates as required
+        self.x, self.y, _ = np.matmul(face_on_rotation_matrix, data.coordinates.T)
+        self.r = np.sqrt(self.x ** 2 + self.y ** 2)
 
-    if mode == 0:
-        m = data[:, 9]  # H2
-    if mode == 1:
-        m = data[:, 9] + data[:, 8]  # HI+H2
-    if mode == 2:
-        m = data[:, 10]  # SFR
-    if mode == 3:
-        m = data[:, 8]  # HI
-
-    # Rotate co-ordinates as required
-    x, y, _ = np.matmul(rotation_matrix, data[:, :3].T)
-    r = np.sqrt(x ** 2 + y ** 2)
-
-    # Define radial bins [log scale, kpc units]
-    radial_bins = np.arange(0, 30, bin_size)
-    SumMode, _, _ = stat.binned_statistic(
-        x=r,
-        values=m,
-        statistic="sum",
-        bins=radial_bins,
-    )
-    surface_density = SumMode / bin_surface(radial_bins)  # Msun/kpc^2
+        self.star_formation_rate_mask = data.star_formation_rates > 0.0
 
-    return surface_density
+        self.__grid_maps = {}
+        self.__radial_profiles = {}
 
+    def grid_maps(self, res, region):
+        """
+        Returns the maps computed by project_gas_quantities
 
-def KS_relation(data, ang_momentum, mode, method, size):
+        Parameters
+        ----------
+        res: int
+        Number of pixels per side
 
-    image_diameter = 60
-    extent = [-30, 30]  # kpc
-    number_of_pixels = int(image_diameter / size + 1)
+        region: list
+        Lower and upper bounds of the grid in kpc
 
-    face_on_rotation_matrix = rotation_matrix_from_vector(ang_momentum)
+        Returns
+        -------
+        Output: SparseMap
+        Maps of "H2", "HI", "HI+H2", "SFR", "metals" and particle counts "count"
+        """
 
-    if method == "grid":
-        # Calculate the surface density maps using grid of pixel size
-
-        partsDATA = data.copy()
-        map_mass = project_gas(
-            partsDATA, mode, number_of_pixels, extent, face_on_rotation_matrix
-        )
-        map_metals = integrate_metallicity_using_grid(
-            partsDATA, number_of_pixels, extent, face_on_rotation_matrix
-        )
-
-        star_formation_rate_mask = partsDATA[:, 10] > 0.0
-        partsDATA = partsDATA[star_formation_rate_mask, :]
-        map_SFR = project_gas(
-            partsDATA, 2, number_of_pixels, extent, face_on_rotation_matrix
-        )
-
-    else:
-        partsDATA = data.copy()
-        map_mass = project_gas_with_azimuthal_average(
-            partsDATA, mode, face_on_rotation_matrix, size
-        )
-        map_metals = project_metals_with_azimuthal_average(
-            partsDATA, face_on_rotation_matrix, size
-        )
-
-        star_formation_rate_mask = np.where(partsDATA[:, 10] > 0.0)[0]
-        partsDATA = partsDATA[star_formation_rate_mask, :]
-
-        if len(star_formation_rate_mask) > 0:
-            map_SFR = project_gas_with_azimuthal_average(
-                partsDATA, 2, face_on_rotation_matrix, size
+        key = (res, tuple(region))
+        if key not in self.__grid_maps:
+            self.__grid_maps[key] = project_gas_quantities(
+                self.x, self.y, self.data, res, region
+            )
+        return self.__grid_maps[key]
+
+    def radial_profile(self, quantity, bin_size):
+        """
+        Returns the azimuthally-averaged profile of a quantity in concentric
+        shells around the centre of the galaxy
+
+        Parameters
+        ----------
+        quantity: str
+        "H2", "HI", "HI+H2" or "SFR" (star-forming particles only) for surface
+        densities in Msun/kpc^2 (Msun/yr/kpc^2), or "metals" for the mean
+        metallicity
+
+        bin_size: float
+        Width of the shells in kpc
+
+        Returns
+        -------
+        Output: np.ndarray
+        Values of the quantity in each shell
+        """
+
+        key = (quantity, bin_size)
+        if key in self.__radial_profiles:
+            return self.__radial_profiles[key]
+
+        r = self.r
+        if quantity == "H2":
+            m = self.data.H2_masses
+        elif quantity == "HI":
+            m = self.data.HI_masses
+        elif quantity == "HI+H2":
+            m = self.data.neutral_masses
+        elif quantity == "SFR":
+            m = self.data.star_formation_rates[self.star_formation_rate_mask]
+            r = r[self.star_formation_rate_mask]
+        elif quantity == "metals":
+            m = self.data.metallicities
+
+        if quantity == "metals":
+            # Define radial bins [log scale, kpc units]
+            radial_bins = np.arange(0, 40, bin_size)
+            profile, _, _ = stat.binned_statistic(
+                x=r, values=m, statistic="mean", bins=radial_bins
             )
         else:
-            map_SFR = np.zeros(len(map_mass))
+            # Define radial bins [log scale, kpc units]
+            radial_bins = np.arange(0, 30, bin_size)
+            if len(m) > 0:
+                SumMode, _, _ = stat.binned_statistic(
+                    x=r, values=m, statistic="sum", bins=radial_bins
+                )
+                profile = SumMode / bin_surface(radial_bins)  # Msun/kpc^2
+            else:
+                profile = np.zeros(len(radial_bins) - 1)
+
+        self.__radial_profiles[key] = profile
+        return profile
+
+    def surface_density(self, quantity, method, size):
+        """
+        Returns a copy of the surface density map of a quantity
+
+        Parameters
+        ----------
+        quantity: str
+        "H2", "HI", "HI+H2" or "SFR"
+
+        method: str
+        "grid" for a grid of pixels, or "radii" for concentric shells
+
+        size: float
+        Pixel size or shell width in kpc
+
+        Returns
+        -------
+        Output: np.ndarray
+        Surface densities in Msun/kpc^2 (Msun/yr/kpc^2 for SFR) in the occupied
+        pixels of the grid, or in each shell
+        """
+
+        if method == "grid":
+            image_diameter = 60
+            extent = [-30, 30]  # kpc
+            number_of_pixels = int(image_diameter / size + 1)
+            return self.grid_maps(number_of_pixels, extent)[quantity].copy()
+
+        return self.radial_profile(quantity, size).copy()
+
+    def metallicity(self, method, size):
+        """
+        Returns a copy of the map of mean metallicity
+
+        Parameters
+        ----------
+        method: str
+        "grid" for a grid of pixels, or "radii" for concentric shells
+
+        size: float
+        Pixel size or shell width in kpc
+
+        Returns
+        -------
+        Output: np.ndarray
+        Mean metallicities in the occupied pixels of the grid, or in each shell
+        """
+
+        if method == "grid":
+            image_diameter = 60
+            extent = [-30, 30]  # kpc
+            number_of_pixels = int(image_diameter / size + 1)
+            return self.grid_maps(number_of_pixels, extent)["metals"].copy()
+
+        return self.radial_profile("metals", size).copy()
+
+
+def KS_relation(view, mode, method, size):
+
+    map_mass = view.surface_density(grid_quantities[mode], method, size)
+    map_metals = view.metallicity(method, size)
+    map_SFR = view.surface_density("SFR", method, size)
 
     # Bounds
     map_SFR[map_SFR <= 0] = 1e-6
@@ -217,38 +365,52 @@ def median_relations(x, y):
 
     xrange = np.arange(-1, 3, 0.1)
 
-    xvalues = np.ones(len(xrange) - 1) * (-10)
-    yvalues = np.zeros(len(xrange) - 1)
-    yvalues_err_down = np.zeros(len(xrange) - 1)
-    yvalues_err_up = np.zeros(len(xrange) - 1)
+    # The last bin is not used
+    statistics = BinnedStatistics(x, [x, y], xrange[:-1])
 
     perc = [16, 84]
 
-    for i in range(0, len(xrange) - 2):
-        mask = (x > xrange[i]) & (x < xrange[i + 1])
-        if len(x[mask]) > 4:
-            xvalues[i] = np.median(x[mask])
-            yvalues[i] = np.median(y[mask])
-            yvalues_err_down[i], yvalues_err_up[i] = np.transpose(
-                np.percentile(y[mask], perc)
-            )
-
-    mask = xvalues > -10
-    xvalues = xvalues[mask]
-    yvalues = yvalues[mask]
-    yvalues_err_down = yvalues_err_down[mask]
-    yvalues_err_up = yvalues_err_up[mask]
+    mask = statistics.counts > 4
+    xvalues = statistics.median(0)[mask]
+    yvalues = statistics.median(1)[mask]
+    yvalues_err_down = statistics.percentile(1, perc[0])[mask]
+    yvalues_err_up = statistics.percentile(1, perc[1])[mask]
 
     return xvalues, yvalues, yvalues_err_down, yvalues_err_up
 
 
+def median_relations_from_sketch(sketch):
+    """
+    Median relation with the 16th and 84th percentiles, as median_relations,
+    computed from a quantile sketch of the data instead of the data itself
+
+    Parameters
+    ----------
+    sketch: BinnedQuantileSketch
+    Sketch of x and y in the bins of median_relations
+
+    Returns
+    -------
+    Output: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+    Median x in the bins with more than 4 values, and the median, 16th and 84th
+    percentiles of y in these bins
+    """
+
+    mask = sketch.number_of_values > 4
+
+    return (
+        sketch.median(0)[mask],
+        sketch.median(1)[mask],
+        sketch.percentile(1, 16)[mask],
+        sketch.percentile(1, 84)[mask],
+    )
+
+
 def make_KS_data(
-    particles_data,
-    ang_momentum,
+    view,
     mode,
     index,
-    output_path,
-    simulation_name,
+    results_store,
     combined_data,
 ):
 
@@ -258,57 +420,43 @@ def make_KS_data(
 
     # Get the surface densities
     surface_density, SFR_surface_density, tgas, metals = KS_relation(
-        particles_data, ang_momentum, mode, method, size
+        view, mode, method, size
     )
 
     if mode == 0:
 
-        combined_data.molecular_gas_surface_density = np.append(
-            combined_data.molecular_gas_surface_density, surface_density
-        )
-        combined_data.depletion_time_molecular_gas = np.append(
-            combined_data.depletion_time_molecular_gas, tgas
-        )
+        combined_data.append("molecular_gas_surface_density", surface_density)
+        combined_data.append("depletion_time_molecular_gas", tgas)
 
-        np.savetxt(
-            f"{output_path}/KS_molecular_relation_grid_%i_" % (index)
-            + simulation_name
-            + ".txt",
+        results_store.add(
+            "KS_molecular_relation_grid",
             np.transpose([surface_density, SFR_surface_density]),
+            index,
         )
 
-        np.savetxt(
-            f"{output_path}/molecular_gas_depletion_timescale_grid_%i_" % (index)
-            + simulation_name
-            + ".txt",
+        results_store.add(
+            "molecular_gas_depletion_timescale_grid",
             np.transpose([surface_density, tgas]),
+            index,
         )
 
     elif mode == 1:
 
-        combined_data.neutral_gas_surface_density = np.append(
-            combined_data.neutral_gas_surface_density, surface_density
-        )
-        combined_data.depletion_time_neutral_gas = np.append(
-            combined_data.depletion_time_neutral_gas, tgas
-        )
-        combined_data.SFR_surface_density = np.append(
-            combined_data.SFR_surface_density, SFR_surface_density
-        )
-        combined_data.gas_metallicity = np.append(combined_data.gas_metallicity, metals)
+        combined_data.append("neutral_gas_surface_density", surface_density)
+        combined_data.append("depletion_time_neutral_gas", tgas)
+        combined_data.append("SFR_surface_density", SFR_surface_density)
+        combined_data.append("gas_metallicity", metals)
 
-        np.savetxt(
-            f"{output_path}/KS_relation_best_grid_%i_" % (index)
-            + simulation_name
-            + ".txt",
+        results_store.add(
+            "KS_relation_best_grid",
             np.transpose([surface_density, SFR_surface_density]),
+            index,
         )
 
-        np.savetxt(
-            f"{output_path}/gas_depletion_timescale_best_grid_%i_" % (index)
-            + simulation_name
-            + ".txt",
+        results_store.add(
+            "gas_depletion_timescale_best_grid",
             np.transpose([surface_density, tgas]),
+            index,
         )
 
     ###### Making KS plots with azimuthally averaged method #################
@@ -318,63 +466,43 @@ def make_KS_data(
     size = 0.8  # kpc
 
     surface_density, SFR_surface_density, tgas, metals = KS_relation(
-        particles_data, ang_momentum, mode, method, size
+        view, mode, method, size
     )
 
     if mode == 0:
-        np.savetxt(
-            f"{output_path}/KS_molecular_relation_radii_%i_" % (index)
-            + simulation_name
-            + ".txt",
+        results_store.add(
+            "KS_molecular_relation_radii",
             np.transpose([surface_density, SFR_surface_density]),
+            index,
         )
 
-        np.savetxt(
-            f"{output_path}/molecular_gas_depletion_timescale_radii_%i_" % (index)
-            + simulation_name
-            + ".txt",
+        results_store.add(
+            "molecular_gas_depletion_timescale_radii",
             np.transpose([surface_density, tgas]),
+            index,
         )
 
     elif mode == 1:
-        np.savetxt(
-            f"{output_path}/KS_relation_best_radii_%i_" % (index)
-            + simulation_name
-            + ".txt",
+        results_store.add(
+            "KS_relation_best_radii",
             np.transpose([surface_density, SFR_surface_density]),
+            index,
         )
 
-        np.savetxt(
-            f"{output_path}/gas_depletion_timescale_best_radii_%i_" % (index)
-            + simulation_name
-            + ".txt",
+        results_store.add(
+            "gas_depletion_timescale_best_radii",
             np.transpose([surface_density, tgas]),
+            index,
         )
 
     return
 
 
-def surface_ratios(data, ang_momentum, method, size):
-
-    face_on_rotation_matrix = rotation_matrix_from_vector(ang_momentum)
+def surface_ratios(view, method, size):
 
-    if method == "grid":
-        image_diameter = 60
-        extent = [-30, 30]  # kpc
-        number_of_pixels = int(image_diameter / size + 1)
-
-        # Calculate the maps using grid
-        map_H2 = project_gas(data, 0, number_of_pixels, extent, face_on_rotation_matrix)
-        map_HI = project_gas(data, 3, number_of_pixels, extent, face_on_rotation_matrix)
-
-    else:
-        # Calculate the maps using azimuthally-average shells
-        map_H2 = project_gas_with_azimuthal_average(
-            data, 0, face_on_rotation_matrix, size
-        )
-        map_HI = project_gas_with_azimuthal_average(
-            data, 3, face_on_rotation_matrix, size
-        )
+    # Calculate the maps using grid or azimuthally-average shells
+    map_H2 = view.surface_density("H2", method, size)
+    map_HI = view.surface_density("HI", method, size)
 
     map_gas = map_H2 + map_HI
 
@@ -412,26 +540,21 @@ def Krumholz_eq39(Sigma_neutral, f):
     return RH2
 
 
-def make_surface_density_ratios(
-    data, ang_momentum, index, output_path, simulation_name, combined_data
-):
+def make_surface_density_ratios(view, index, results_store, combined_data):
 
     # Get the surface densities
     method = "grid"
     binsize = 0.25  # kpc
     Sigma_gas_neutral, Sigma_gas_molecular, Sigma_ratio = surface_ratios(
-        data, ang_momentum, method, binsize
+        view, method, binsize
     )
 
-    combined_data.H2_to_neutral_surface_density_ratio = np.append(
-        combined_data.H2_to_neutral_surface_density_ratio, Sigma_ratio
-    )
+    combined_data.append("H2_to_neutral_surface_density_ratio", Sigma_ratio)
 
-    np.savetxt(
-        f"{output_path}/Surface_density_ratio_grid_%i_" % (index)
-        + simulation_name
-        + ".txt",
+    results_store.add(
+        "Surface_density_ratio_grid",
         np.transpose([Sigma_gas_neutral, Sigma_ratio]),
+        index,
     )
 
     ########################################################################
@@ -443,55 +566,46 @@ def make_surface_density_ratios(
         Sigma_gas_250pc_neutral,
         Sigma_gas_250pc_molecular,
         Sigma_ratio_250pc,
-    ) = surface_ratios(data, ang_momentum, method, binsize)
+    ) = surface_ratios(view, method, binsize)
 
     binsize = 0.8  # kpc
     (
         Sigma_gas_800pc_neutral,
         Sigma_gas_800pc_molecular,
         Sigma_ratio_800pc,
-    ) = surface_ratios(data, ang_momentum, method, binsize)
+    ) = surface_ratios(view, method, binsize)
 
-    combined_data.radii_neutral_gas_surface_density = np.append(
-        combined_data.radii_neutral_gas_surface_density, Sigma_gas_800pc_neutral
-    )
-    combined_data.radii_H2_to_neutral_surface_density_ratio = np.append(
-        combined_data.radii_H2_to_neutral_surface_density_ratio, Sigma_ratio_800pc
-    )
+    combined_data.append("radii_neutral_gas_surface_density", Sigma_gas_800pc_neutral)
+    combined_data.append("radii_H2_to_neutral_surface_density_ratio", Sigma_ratio_800pc)
 
-    np.savetxt(
-        f"{output_path}/Surface_density_ratio_radii_250pc_%i_" % (index)
-        + simulation_name
-        + ".txt",
+    results_store.add(
+        "Surface_density_ratio_radii_250pc",
         np.transpose([Sigma_gas_250pc_neutral, Sigma_ratio_250pc]),
+        index,
     )
-    np.savetxt(
-        f"{output_path}/Surface_density_ratio_radii_800pc_%i_" % (index)
-        + simulation_name
-        + ".txt",
+    results_store.add(
+        "Surface_density_ratio_radii_800pc",
         np.transpose([Sigma_gas_800pc_neutral, Sigma_ratio_800pc]),
+        index,
     )
 
 
-def calculate_integrated_quantities(data, ang_momentum, radius, mode):
+def calculate_integrated_quantities(view, radius, mode):
 
-    face_on_rotation_matrix = rotation_matrix_from_vector(ang_momentum)
-
-    x, y, _ = np.matmul(face_on_rotation_matrix, data[:, :3].T)
-    r = np.sqrt(x ** 2 + y ** 2)
-    select = r <= radius
+    data = view.data
+    select = view.r <= radius
 
     surface = np.pi * radius ** 2
     if mode == 0:
-        m = data[select, 9]
+        m = data.H2_masses[select]
     if mode == 1:
-        m = data[select, 9] + data[select, 8]
+        m = data.neutral_masses[select]
 
     # If we have gas within rhalfMs
     if len(m) > 0:
         Sigma_gas = np.log10(np.sum(m) / surface) - 6.0  # Msun / pc^2
 
-        sfr = data[select, 10]
+        sfr = data.star_formation_rates[select]
         sfr = sfr[sfr > 0]
         Sigma_SFR = np.log10(np.sum(sfr) / surface)  # Msun / yr / kpc^2
 
@@ -502,20 +616,19 @@ def calculate_integrated_quantities(data, ang_momentum, radius, mode):
     return Sigma_gas, Sigma_SFR
 
 
-def make_KS_plots(
-    data, ang_momentum, index, output_path, simulation_name, combined_data
-):
+def make_KS_plots(data, ang_momentum, index, results_store, combined_data):
+
+    # Rotate the galaxy once for all maps
+    view = FaceOnView(data, ang_momentum)
 
     for mode, project in enumerate(
         ["molecular_hydrogen_masses", "not_ionized_hydrogen_masses"]
     ):
-        make_KS_data(
-            data, ang_momentum, mode, index, output_path, simulation_name, combined_data
-        )
+        make_KS_data(view, mode, index, results_store, combined_data)
 
-    make_surface_density_ratios(
-        data, ang_momentum, index, output_path, simulation_name, combined_data
-    )
+    make_surface_density_ratios(view, index, results_store, combined_data)
+
+    combined_data.end_galaxy()
 
 
 def calculate_surface_densities(data, ang_momentum, galaxy_data, index):
@@ -523,13 +636,11 @@ def calculate_surface_densities(data, ang_momentum, galaxy_data, index):
     # If we have gas, calculate ..
     radius = galaxy_data.half_mass_radius_star[index]
 
+    view = FaceOnView(data, ang_momentum)
+
     # Mode ==0 : "molecular_hydrogen_masses"
     # Mode ==1 : "not_ionized_hydrogen_masses"
-    Sigma_H2, Sigma_SFR_H2 = calculate_integrated_quantities(
-        data, ang_momentum, radius, 0
-    )
-    Sigma_gas, Sigma_SFR = calculate_integrated_quantities(
-        data, ang_momentum, radius, 1
-    )
+    Sigma_H2, Sigma_SFR_H2 = calculate_integrated_quantities(view, radius, 0)
+    Sigma_gas, Sigma_SFR = calculate_integrated_quantities(view, radius, 1)
     Sigma = np.array([Sigma_H2, Sigma_gas, Sigma_SFR])
     galaxy_data.add_surface_density(Sigma, index)
@@ -0,0 +1,82 @@
+"""
+Figure templates: figures whose layout (axes, labels, reference lines,
+observational data and colour bars) is built once per process and reused for
+every plot with the same layout. Only the plotted data is swapped before each
+figure is saved
+"""
+
+import matplotlib.pylab as plt
+from abc import ABC, abstractmethod
+from matplotlib.pylab import rcParams
+from types import MappingProxyType
+from typing import Dict, Mapping, Tuple
+
+# Templates built in this process, by class and build arguments
+_templates: Dict[Tuple, "FigureTemplate"] = {}
+
+
+class FigureTemplate(ABC):
+    """
+    Base class of the figure templates. Subclasses set the plot parameters and
+    build the layout in build; they are obtained with get
+    """
+
+    # Plot parameters of the figure; read-only so that no subclass changes the
+    # parameters of the others
+    params: Mapping = MappingProxyType({})
+
+    def __init__(self, *arguments):
+        """
+        Parameters
+        ----------
+        arguments:
+        Arguments passed on to build
+        """
+
+        rcParams.update(self.params)
+        self.fig = plt.figure()
+        self.build(*arguments)
+
+    @classmethod
+    def get(cls, *arguments) -> "FigureTemplate":
+        """
+        Returns the template built with the given arguments, building it if this
+        process has not done so yet
+
+        Parameters
+        ----------
+        arguments:
+        Hashable arguments of build
+
+        Returns
+        -------
+        Output: FigureTemplate
+        The template
+        """
+
+        key = (cls,) + arguments
+        if key not in _templates:
+            _templates[key] = cls(*arguments)
+        return _templates[key]
+
+    @abstractmethod
+    def build(self, *arguments):
+        """
+        Creates the axes and everything that does not change between plots
+        """
+
+    def save(self, outfile: str, dpi: int):
+        """
+        Saves the figure with its current data
+
+        Parameters
+        ----------
+        outfile: str
+        Output file name
+
+        dpi: int
+        Resolution of the output file
+        """
+
+        rcParams.update(self.params)
+        self.fig.savefig(outfile, dpi=dpi)
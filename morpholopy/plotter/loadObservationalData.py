@@ -6,23 +6,21 @@ import numpy as np
 import codecs
 import matplotlib.pyplot as plt
 import matplotlib.colors as colors
+from object.unitilies.kernels import BinnedStatistics
 
 
 def bin_data_general(array_x, array_y, array_x_bin, x_limit):
+    statistics = BinnedStatistics(array_x, [array_y], array_x_bin)
+
     # create a SFR value array
-    y_array_bin = np.zeros(len(array_x_bin) - 1)
-    y_array_bin_std_up = np.zeros(len(array_x_bin) - 1)
-    y_array_bin_std_down = np.zeros(len(array_x_bin) - 1)
-
-    for i in range(0, len(array_x_bin) - 1):
-        mask = (array_x > array_x_bin[i]) & (array_x < array_x_bin[i + 1])
-        y_array_bin[i] = np.median(array_y[mask])
-        try:
-            y_array_bin_std_up[i], y_array_bin_std_down[i] = np.transpose(
-                np.percentile(array_y[mask], [16, 84])
-            )
-        except:
-            y_array_bin_std_up[i], y_array_bin_std_down[i] = [0.0, 0.0]
+    y_array_bin = statistics.median(0)
+    y_array_bin_std_up = statistics.percentile(0, 16)
+    y_array_bin_std_down = statistics.percentile(0, 84)
+
+    # Empty bins have no percentiles
+    empty = statistics.counts == 0
+    y_array_bin_std_up[empty] = 0.0
+    y_array_bin_std_down[empty] = 0.0
 
     array_x_bin = (array_x_bin[1:] + array_x_bin[:-1]) / 2.0
     y_array_bin_std_up = np.abs(y_array_bin_std_up - y_array_bin)
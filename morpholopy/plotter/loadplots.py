@@ -1,5 +1,6 @@
 import numpy as np
 from .html import add_web_section, PlotsInPipeline
+from object.results_store import ResultsStore
 from typing import List
 
 
@@ -334,56 +335,29 @@ def loadGalaxyPlots(
         title = "%i Galaxy " % (index + 1)
         caption = " "
         for name in name_list:
-            data = np.loadtxt(f"{output_path}/galaxy_data_" + name + ".txt")
-
-            try:
-                sfr_galaxy = data[:, 0]
-                mass_galaxy = data[:, 1]
-                gas_mass_galaxy = data[:, 2]
-                mass_halo = data[:, 3]
-                galaxy_metallicity_gas_sfr = data[:, 4]
-                galaxy_metallicity_gas = data[:, 5]
-
-                caption += "<strong>Simulation: " + name + "</strong>. Galaxy details: "
-                caption += r"$\log_{10}$ M$_{200}$/M$_{\odot} = $%0.2f," % (
-                    mass_halo[index]
-                )
-                caption += " SFR = %0.1f M$_{\odot}$/yr," % (sfr_galaxy[index])
-                caption += " Z$_{\mathrm{SFR}>0}$ = %0.3f," % (
-                    galaxy_metallicity_gas_sfr[index]
-                )
-                caption += " Z$_{\mathrm{gas}}$ = %0.3f," % (
-                    galaxy_metallicity_gas[index]
-                )
-                caption += " $\log_{10}$ M$_{*}$/M$_{\odot} = $%0.2f" % (
-                    mass_galaxy[index]
-                )
-                caption += (
-                    ' $\&$ $\log_{10}$ M$_{\mathrm{gas}}$/M$_{\odot} = $%0.2f.</p><p style="font-size:18px;">'
-                    % (gas_mass_galaxy[index])
-                )
-
-            # If only one galaxy is available, the data array is one dimensional
-            except IndexError:
-
-                sfr_galaxy = data[0]
-                mass_galaxy = data[1]
-                gas_mass_galaxy = data[2]
-                mass_halo = data[3]
-                galaxy_metallicity_gas_sfr = data[4]
-                galaxy_metallicity_gas = data[5]
-                caption += "<strong>Simulation: " + name + "</strong>. Galaxy details: "
-                caption += r"$\log_{10}$ M$_{200}$/M$_{\odot} = $%0.2f," % (mass_halo)
-                caption += " SFR = %0.1f M$_{\odot}$/yr," % (sfr_galaxy)
-                caption += " Z$_{\mathrm{SFR}>0}$ = %0.3f," % (
-                    galaxy_metallicity_gas_sfr
-                )
-                caption += " Z$_{\mathrm{gas}}$ = %0.3f," % (galaxy_metallicity_gas)
-                caption += " $\log_{10}$ M$_{*}$/M$_{\odot} = $%0.2f" % (mass_galaxy)
-                caption += (
-                    ' $\&$ $\log_{10}$ M$_{\mathrm{gas}}$/M$_{\odot} = $%0.2f.</p><p style="font-size:18px;">'
-                    % (gas_mass_galaxy)
-                )
+            data = ResultsStore.read(output_path, name, "galaxy_data")
+
+            sfr_galaxy = data[:, 0]
+            mass_galaxy = data[:, 1]
+            gas_mass_galaxy = data[:, 2]
+            mass_halo = data[:, 3]
+            galaxy_metallicity_gas_sfr = data[:, 4]
+            galaxy_metallicity_gas = data[:, 5]
+
+            caption += "<strong>Simulation: " + name + "</strong>. Galaxy details: "
+            caption += r"$\log_{10}$ M$_{200}$/M$_{\odot} = $%0.2f," % (
+                mass_halo[index]
+            )
+            caption += " SFR = %0.1f M$_{\odot}$/yr," % (sfr_galaxy[index])
+            caption += " Z$_{\mathrm{SFR}>0}$ = %0.3f," % (
+                galaxy_metallicity_gas_sfr[index]
+            )
+            caption += " Z$_{\mathrm{gas}}$ = %0.3f," % (galaxy_metallicity_gas[index])
+            caption += " $\log_{10}$ M$_{*}$/M$_{\odot} = $%0.2f" % (mass_galaxy[index])
+            caption += (
+                ' $\&$ $\log_{10}$ M$_{\mathrm{gas}}$/M$_{\odot} = $%0.2f.</p><p style="font-size:18px;">'
+                % (gas_mass_galaxy[index])
+            )
 
         id = abs(hash("galaxy and ks relation %i" % index))
         plots = PlotsInWeb.plots_details
@@ -1,8 +1,10 @@
-import matplotlib.pylab as plt
-from matplotlib.pylab import rcParams
 from sphviewer.tools import QuickView
 from swiftsimio.visualisation.rotation import rotation_matrix_from_vector
 import numpy as np
+from collections import deque
+from multiprocessing import get_context
+from typing import Callable, Dict, List, Tuple
+from .figure_templates import FigureTemplate
 
 # Plot parameters
 params = {
@@ -83,21 +85,17 @@ def rotation_matrix(vector: np.float64, pos_parts: np.float64, axis: str = "z"):
     return pos_face_on
 
 
-def plot_galaxy_parts(
-    partsDATA, parttype, ang_momentum, halo_data, index, output_path, simulation_name
-):
-
-    # Plot ranges
+def image_radius(halo_data, index):
+    # Half-size of the images: 5 stellar half mass radii, but at most 30 kpc
     r_limit = 5 * halo_data.half_mass_radius_star[index]
     r_img = 30.0
     if r_limit < r_img:
         r_img = r_limit
-    xmin = -r_img
-    ymin = -r_img
-    xmax = r_img
-    ymax = r_img
+    return r_img
 
-    pos_parts = partsDATA[:, 0:3].copy()
+
+def face_on_and_edge_on(pos_parts, ang_momentum):
+    # Particle positions seen face-on and edge-on
     face_on_rotation_matrix = rotation_matrix_from_vector(ang_momentum, axis="z")
     edge_on_rotation_matrix = rotation_matrix_from_vector(ang_momentum, axis="y")
 
@@ -105,112 +103,155 @@ def plot_galaxy_parts(
     pos_face_on = pos_face_on.T
     pos_edge_on = np.matmul(edge_on_rotation_matrix, pos_parts.T)
     pos_edge_on = pos_edge_on.T
+    return pos_face_on, pos_edge_on
 
-    if parttype == 0:
-        density = np.log10(partsDATA[:, 11])
-    if parttype == 4:
-        density = np.log10(partsDATA[:, 8])
-
-    # Sort particles for better viewing
-    arg_sort = np.argsort(density)
-    density = density[arg_sort]
-    pos_face_on = pos_face_on[arg_sort, :]
-    pos_edge_on = pos_edge_on[arg_sort, :]
-
-    denmin = np.min(density)
-    denmax = np.max(density)
-
-    rcParams.update(params)
-    fig = plt.figure()
-    ax = plt.subplot(1, 2, 1)
 
-    if parttype == 4:
-        title = "Stellar component"
-    if parttype == 0:
-        title = "Gas component"
-
-    ax.set_title(title)
-    ax.tick_params(labelleft=True, labelbottom=True, length=0)
-    plt.xlabel("x [kpc]")
-    plt.ylabel("y [kpc]")
-    ax.set_xlim(xmin, xmax)
-    ax.set_ylim(ymin, ymax)
-
-    plt.scatter(
-        pos_face_on[:, 0],
-        pos_face_on[:, 1],
-        c=density,
-        alpha=1,
-        s=10,
-        vmin=denmin,
-        vmax=denmax,
-        cmap="magma",
-        edgecolors="none",
-    )
-    ax.autoscale(False)
-
-    ax = plt.subplot(1, 2, 2)
+def galaxy_title(halo_data, index, parttype, with_radius):
+    # Title with the morphology of the galaxy
     if parttype == 4:
         kappa = halo_data.kappa_co[index]
         mass = halo_data.log10_stellar_mass[index]
         ac = halo_data.axis_ca[index]
         cb = halo_data.axis_cb[index]
         ba = halo_data.axis_ba[index]
-        radius = halo_data.half_mass_radius_star[index]
         title = r" $\kappa_{\mathrm{co}} = $%0.2f" % (kappa)
         title += " - $\log_{10}$ $M_{*}/M_{\odot} = $%0.2f" % (mass)
-        title += " \n c/a = %0.2f," % (ac)
-        title += " c/b = %0.2f," % (cb)
-        title += " b/a = %0.2f" % (ba)
-        title += "\n Stellar half mass radius %0.2f kpc" % (radius)
     if parttype == 0:
         kappa = halo_data.gas_kappa_co[index]
         mass = halo_data.log10_gas_mass[index]
         ac = halo_data.gas_axis_ca[index]
         cb = halo_data.gas_axis_cb[index]
         ba = halo_data.gas_axis_ba[index]
-        radius = halo_data.half_mass_radius_star[index]
         title = r" $\kappa_{\mathrm{co}} = $%0.2f" % (kappa)
         title += " - $\log_{10}$ $M_{gas}/M_{\odot} = $%0.2f" % (mass)
-        title += " \n c/a = %0.2f," % (ac)
-        title += " c/b = %0.2f," % (cb)
-        title += " b/a = %0.2f" % (ba)
+    title += " \n c/a = %0.2f," % (ac)
+    title += " c/b = %0.2f," % (cb)
+    title += " b/a = %0.2f" % (ba)
+    if with_radius:
+        radius = halo_data.half_mass_radius_star[index]
         title += "\n Stellar half mass radius %0.2f kpc" % (radius)
-    ax.set_title(title)
-
-    ax.tick_params(labelleft=True, labelbottom=True, length=0)
-    plt.xlabel("x [kpc]")
-    plt.ylabel("z [kpc]")
-    ax.set_xlim(xmin, xmax)
-    ax.set_ylim(ymin, ymax)
-
-    plt.scatter(
-        pos_edge_on[:, 0],
-        pos_edge_on[:, 1],
-        c=density,
-        alpha=1,
-        s=10,
-        vmin=denmin,
-        vmax=denmax,
-        cmap="magma",
-        edgecolors="none",
+    return title
+
+
+def project(pos_parts, weights, hsml_parts, r_img, p=0):
+    # Logarithmic projected map of the weights seen along the z axis (p=0)
+    qv = QuickView(
+        pos_parts,
+        mass=weights,
+        hsml=hsml_parts,
+        logscale=True,
+        plot=False,
+        r="infinity",
+        p=p,
+        t=0,
+        extent=[-r_img, r_img, -r_img, r_img],
+        x=0,
+        y=0,
+        z=0,
     )
+    return qv.get_image(), qv.get_extent()
+
+
+class GalaxyParticles(FigureTemplate):
+    """
+    Particles of a galaxy seen face-on and edge-on, coloured by density
+    """
+
+    params = params
+
+    def build(self):
+        self.axes = (self.fig.add_subplot(1, 2, 1), self.fig.add_subplot(1, 2, 2))
+        self.points = []
+
+        for ax, ylabel in zip(self.axes, ["y [kpc]", "z [kpc]"]):
+            ax.tick_params(labelleft=True, labelbottom=True, length=0)
+            ax.set_xlabel("x [kpc]")
+            ax.set_ylabel(ylabel)
+            self.points.append(
+                ax.scatter(
+                    np.zeros(0),
+                    np.zeros(0),
+                    c=np.zeros(0),
+                    alpha=1,
+                    s=10,
+                    cmap="magma",
+                    edgecolors="none",
+                )
+            )
+            ax.autoscale(False)
+
+        cbar_ax = self.fig.add_axes([0.86, 0.22, 0.018, 0.5])
+        cbar_ax.tick_params(labelsize=15)
+        cb = self.fig.colorbar(self.points[1], ticks=[4, 6, 8, 10], cax=cbar_ax)
+        cb.set_label(label=r"$\log_{10}$ $\rho$ [M$_{\odot}$/kpc$^{3}$]", labelpad=0.5)
+
+    def update(self, positions, density, titles, r_img):
+        denmin = np.min(density)
+        denmax = np.max(density)
+
+        for ax, points, pos, title in zip(self.axes, self.points, positions, titles):
+            ax.set_title(title)
+            ax.set_xlim(-r_img, r_img)
+            ax.set_ylim(-r_img, r_img)
+            points.set_offsets(pos[:, :2])
+            points.set_array(density)
+            points.set_clim(denmin, denmax)
+
+
+class GalaxyMaps(FigureTemplate):
+    """
+    Projected maps of a galaxy seen face-on and edge-on, with the colour bar of
+    the edge-on map
+    """
+
+    params = params
+
+    def build(self, colorbar_label):
+        self.axes = (self.fig.add_subplot(1, 2, 1), self.fig.add_subplot(1, 2, 2))
+        self.images = []
+
+        for ax, ylabel in zip(self.axes, ["y [kpc]", "z [kpc]"]):
+            ax.tick_params(labelleft=True, labelbottom=True, length=0)
+            ax.set_xlabel("x [kpc]")
+            ax.set_ylabel(ylabel)
+            ax.set_xlim(-1, 1)
+            ax.set_ylim(-1, 1)
+            self.images.append(ax.imshow(np.zeros((1, 1)), extent=[-1, 1, -1, 1]))
+            ax.autoscale(False)
+
+        cbar_ax = self.fig.add_axes([0.86, 0.22, 0.018, 0.5])
+        cbar_ax.tick_params(labelsize=15)
+        cb = self.fig.colorbar(self.images[1], ticks=[4, 6, 8, 10, 12], cax=cbar_ax)
+        cb.set_label(label=colorbar_label, labelpad=0.5)
+
+    def update(self, maps, extents, titles, r_img, cmap, vmins=(None, None)):
+        for ax, image, img, ext, title, vmin in zip(
+            self.axes, self.images, maps, extents, titles, vmins
+        ):
+            ax.set_title(title)
+            ax.set_xlim(-r_img, r_img)
+            ax.set_ylim(-r_img, r_img)
+            image.set_data(img)
+            image.set_extent(ext)
+            image.set_cmap(cmap)
+
+            # Colour range of the map, as chosen by imshow: the given minimum or
+            # the smallest finite value, up to the largest finite value
+            finite = img[np.isfinite(img)]
+            image.set_clim(finite.min() if vmin is None else vmin, finite.max())
 
-    ax.autoscale(False)
 
-    cbar_ax = fig.add_axes([0.86, 0.22, 0.018, 0.5])
-    cbar_ax.tick_params(labelsize=15)
-    cb = plt.colorbar(ticks=[4, 6, 8, 10], cax=cbar_ax)
-    cb.set_label(label=r"$\log_{10}$ $\rho$ [M$_{\odot}$/kpc$^{3}$]", labelpad=0.5)
+def plot_galaxy_parts(
+    pos_face_on, pos_edge_on, density, left_title, right_title, r_img, outfile
+):
+    # Particles seen face-on and edge-on, coloured by density
+    template = GalaxyParticles.get()
+    template.update(
+        [pos_face_on, pos_edge_on], density, [left_title, right_title], r_img
+    )
+    template.save(outfile, dpi=150)
 
-    if parttype == 4:
-        outfile = (
-            f"{output_path}/galaxy_sparts_%i_" % (index) + simulation_name + ".png"
-        )
-    if parttype == 0:
-        outfile = f"{output_path}/galaxy_parts_%i_" % (index) + simulation_name + ".png"
-    fig.savefig(outfile, dpi=150)
-    plt.close("all")
+    return
 
 
 def get_normalized_image(image, vmin=None, vmax=None):
@@ -227,238 +268,56 @@ def get_normalized_image(image, vmin=None, vmax=None):
 
 
 def plot_galaxy(
-    parts_data, parttype, ang_momentum, halo_data, index, output_path, simulation_name
+    pos_face_on,
+    pos_edge_on,
+    mass,
+    hsml_parts,
+    cmap,
+    left_title,
+    right_title,
+    r_img,
+    outfile,
 ):
-    # partsDATA contains particles data and is structured as follow
-    # [ (:3)Position[Mpc]: (0)X | (1)Y | (2)Z ]
-    if parttype == 4:
-        cmap = plt.cm.magma
-    if parttype == 0:
-        cmap = plt.cm.viridis
-
-    pos_parts = parts_data[:, 0:3].copy()
-    face_on_rotation_matrix = rotation_matrix_from_vector(ang_momentum, axis="z")
-    edge_on_rotation_matrix = rotation_matrix_from_vector(ang_momentum, axis="y")
-
-    pos_face_on = np.matmul(face_on_rotation_matrix, pos_parts.T)
-    pos_face_on = pos_face_on.T
-    pos_edge_on = np.matmul(edge_on_rotation_matrix, pos_parts.T)
-    pos_edge_on = pos_edge_on.T
-
-    hsml_parts = parts_data[:, 7]
-    mass = parts_data[:, 3]
-
-    r_limit = 5 * halo_data.half_mass_radius_star[index]
-    r_img = 30.0
-    if r_limit < r_img:
-        r_img = r_limit
-    xmin = -r_img
-    ymin = -r_img
-    xmax = r_img
-    ymax = r_img
-
-    rcParams.update(params)
-    fig = plt.figure()
-    ax = plt.subplot(1, 2, 1)
-
-    if parttype == 4:
-        title = "Stellar component"
-    if parttype == 0:
-        title = "HI+H2 gas"
-    ax.set_title(title)
-
-    ###### plot one side ########################
-    qv = QuickView(
-        pos_face_on,
-        mass=mass,
-        hsml=hsml_parts,
-        logscale=True,
-        plot=False,
-        r="infinity",
-        p=0,
-        t=0,
-        extent=[xmin, xmax, ymin, ymax],
-        x=0,
-        y=0,
-        z=0,
+    # Projected mass maps seen face-on and edge-on
+    img, ext = project(pos_face_on, mass, hsml_parts, r_img)
+    img_edge_on, ext_edge_on = project(pos_edge_on, mass, hsml_parts, r_img)
+
+    template = GalaxyMaps.get(r"$\log_{10}$ $\Sigma$ [M$_{\odot}$/kpc$^{2}$]")
+    template.update(
+        [get_normalized_image(img), get_normalized_image(img_edge_on)],
+        [ext, ext_edge_on],
+        [left_title, right_title],
+        r_img,
+        cmap,
     )
-    img = qv.get_image()
-    ext = qv.get_extent()
-    ax.tick_params(labelleft=True, labelbottom=True, length=0)
-    plt.xlabel("x [kpc]")
-    plt.ylabel("y [kpc]")
-    ax.set_xlim(xmin, xmax)
-    ax.set_ylim(ymin, ymax)
-    img = get_normalized_image(img)
-    ax.imshow(img, cmap=cmap, extent=ext)
-    ax.autoscale(False)
-
-    ###### plot another side ########################
-    ax = plt.subplot(1, 2, 2)
-    if parttype == 4:
-        kappa = halo_data.kappa_co[index]
-        mass_galaxy = halo_data.log10_stellar_mass[index]
-        ac = halo_data.axis_ca[index]
-        cb = halo_data.axis_cb[index]
-        ba = halo_data.axis_ba[index]
-        title = r" $\kappa_{\mathrm{co}} = $%0.2f" % (kappa)
-        title += " - $\log_{10}$ $M_{*}/M_{\odot} = $%0.2f" % (mass_galaxy)
-        title += " \n c/a = %0.2f," % (ac)
-        title += " c/b = %0.2f," % (cb)
-        title += " b/a = %0.2f" % (ba)
-    if parttype == 0:
-        kappa = halo_data.gas_kappa_co[index]
-        mass_galaxy = halo_data.log10_gas_mass[index]
-        ac = halo_data.gas_axis_ca[index]
-        cb = halo_data.gas_axis_cb[index]
-        ba = halo_data.gas_axis_ba[index]
-        title = r" $\kappa_{\mathrm{co}} = $%0.2f" % (kappa)
-        title += " - $\log_{10}$ $M_{gas}/M_{\odot} = $%0.2f" % (mass_galaxy)
-        title += " \n c/a = %0.2f," % (ac)
-        title += " c/b = %0.2f," % (cb)
-        title += " b/a = %0.2f" % (ba)
-    ax.set_title(title)
-
-    qv = QuickView(
-        pos_edge_on,
-        mass=mass,
-        hsml=hsml_parts,
-        logscale=True,
-        plot=False,
-        r="infinity",
-        p=0,
-        t=0,
-        extent=[xmin, xmax, ymin, ymax],
-        x=0,
-        y=0,
-        z=0,
-    )
-    img = qv.get_image()
-    ext = qv.get_extent()
-    ax.tick_params(labelleft=True, labelbottom=True, length=0)
-    plt.xlabel("x [kpc]")
-    plt.ylabel("z [kpc]")
-    ax.set_xlim(xmin, xmax)
-    ax.set_ylim(ymin, ymax)
-    img = get_normalized_image(img)
-    ims = ax.imshow(img, cmap=cmap, extent=ext)
-    ax.autoscale(False)
-
-    cbar_ax = fig.add_axes([0.86, 0.22, 0.018, 0.5])
-    cbar_ax.tick_params(labelsize=15)
-    cb = plt.colorbar(ims, ticks=[4, 6, 8, 10, 12], cax=cbar_ax)
-    cb.set_label(label=r"$\log_{10}$ $\Sigma$ [M$_{\odot}$/kpc$^{2}$]", labelpad=0.5)
-
-    if parttype == 0:
-        outfile = f"{output_path}/galaxy_gas_%i_" % (index) + simulation_name + ".png"
-    if parttype == 4:
-        outfile = f"{output_path}/galaxy_stars_%i_" % (index) + simulation_name + ".png"
-    fig.savefig(outfile, dpi=150)
-    plt.close("all")
+    template.save(outfile, dpi=150)
 
     return
 
 
 def render_luminosity_map(
-    parts_data,
-    luminosity,
-    filtname,
-    ang_momentum,
-    halo_data,
-    index,
-    output_path,
-    simulation_name,
+    pos_face_on, pos_edge_on, luminosity, hsml_parts, r_img, outfile
 ):
-    pos_parts = parts_data[:, 0:3].copy()
-
-    face_on_rotation_matrix = rotation_matrix_from_vector(ang_momentum)
-    edge_on_rotation_matrix = rotation_matrix_from_vector(ang_momentum, axis="y")
-
-    pos_face_on = np.matmul(face_on_rotation_matrix, pos_parts.T)
-    pos_face_on = pos_face_on.T
-    pos_edge_on = np.matmul(edge_on_rotation_matrix, pos_parts.T)
-    pos_edge_on = pos_edge_on.T
+    # Projected luminosity maps seen face-on and edge-on
+    img, ext = project(pos_face_on, luminosity, hsml_parts, r_img)
+    img_edge_on, ext_edge_on = project(pos_edge_on, luminosity, hsml_parts, r_img, p=90)
 
-    hsml_parts = parts_data[:, 7]
+    # Colour range of 2.3 dex below the brightest pixel
+    vmins = (img.max() - 2.3, img_edge_on.max() - 2.3)
 
-    r_limit = 5 * halo_data.half_mass_radius_star[index]
-    r_img = 30.0
-    if r_limit < r_img:
-        r_img = r_limit
-    xmin = -r_img
-    ymin = -r_img
-    xmax = r_img
-    ymax = r_img
-
-    rcParams.update(params)
-    fig = plt.figure()
-    ax = plt.subplot(1, 2, 1)
-
-    ###### plot one side ########################
-    qv = QuickView(
-        pos_face_on,
-        mass=luminosity,
-        hsml=hsml_parts,
-        logscale=True,
-        plot=False,
-        r="infinity",
-        p=0,
-        t=0,
-        extent=[xmin, xmax, ymin, ymax],
-        x=0,
-        y=0,
-        z=0,
-    )
-    img = qv.get_image()
-    ext = qv.get_extent()
-    ax.tick_params(labelleft=True, labelbottom=True, length=0)
-    plt.xlabel("x [kpc]")
-    plt.ylabel("y [kpc]")
-    ax.set_xlim(xmin, xmax)
-    ax.set_ylim(ymin, ymax)
-    img = get_normalized_image(img, vmin=img.max() - 2.3)
-    ax.imshow(img, cmap="magma", extent=ext, vmin=img.max() - 2.3)
-    ax.autoscale(False)
-
-    ###### plot another side ########################
-    ax = plt.subplot(1, 2, 2)
-    qv = QuickView(
-        pos_edge_on,
-        mass=luminosity,
-        hsml=hsml_parts,
-        logscale=True,
-        plot=False,
-        r="infinity",
-        p=90,
-        t=0,
-        extent=[xmin, xmax, ymin, ymax],
-        x=0,
-        y=0,
-        z=0,
-    )
-    img = qv.get_image()
-    ext = qv.get_extent()
-    ax.tick_params(labelleft=True, labelbottom=True, length=0)
-    plt.xlabel("x [kpc]")
-    plt.ylabel("z [kpc]")
-    ax.set_xlim(xmin, xmax)
-    ax.set_ylim(ymin, ymax)
-    img = get_normalized_image(img, vmin=img.max() - 2.3)
-    ims = ax.imshow(img, cmap="magma", vmin=img.max() - 2.3, extent=ext)
-    ax.autoscale(False)
-
-    cbar_ax = fig.add_axes([0.86, 0.22, 0.018, 0.5])
-    cbar_ax.tick_params(labelsize=15)
-    cb = plt.colorbar(ims, ticks=[4, 6, 8, 10, 12], cax=cbar_ax)
-    cb.set_label(label=r"$\log_{10}$ $\Sigma$ [Jy/kpc$^{2}$]", labelpad=0.5)
-
-    outfile = (
-        f"{output_path}/galaxy_%s_map_%i_" % (filtname, index)
-        + simulation_name
-        + ".png"
+    template = GalaxyMaps.get(r"$\log_{10}$ $\Sigma$ [Jy/kpc$^{2}$]")
+    template.update(
+        [
+            get_normalized_image(img, vmin=vmins[0]),
+            get_normalized_image(img_edge_on, vmin=vmins[1]),
+        ],
+        [ext, ext_edge_on],
+        ["", ""],
+        r_img,
+        "magma",
+        vmins=vmins,
     )
-    fig.savefig(outfile, dpi=150)
-    plt.close("all")
+    template.save(outfile, dpi=150)
 
     return
 
@@ -473,39 +332,225 @@ def visualize_galaxy(
     i,
     output_path,
     simulation_name,
-):
+) -> List[Tuple[Callable, Dict]]:
+    """
+    Prepares the images of a galaxy: projected stellar and gas mass maps,
+    particle distributions and stellar luminosity maps. Only the particle data
+    needed to draw the images is computed here; the images are drawn when the
+    returned jobs are run by an ImageRenderer
 
-    # Create stars image
-    plot_galaxy(
-        stars_data, 4, stars_ang_momentum, halo_data, i, output_path, simulation_name
-    )
+    Parameters
+    ----------
+    stars_data: StarParticles
+    Container with stellar properties
 
-    # Create gas image
-    plot_galaxy(
-        gas_data, 0, stars_ang_momentum, halo_data, i, output_path, simulation_name
-    )
+    gas_data: GasParticles
+    Container with gas properties
 
-    # Plot distribution of stellar particles
-    plot_galaxy_parts(
-        stars_data, 4, stars_ang_momentum, halo_data, i, output_path, simulation_name
+    star_absmag: dict
+    Absolute magnitudes of the stellar particles in each filter
+
+    stars_ang_momentum: np.ndarray
+    Direction of the stellar angular momentum
+
+    gas_ang_momentum: np.ndarray
+    Direction of the gas angular momentum (not used; the images are aligned
+    with the stellar angular momentum)
+
+    halo_data: HaloCatalogue
+    Halo properties
+
+    i: int
+    Index of the galaxy in the halo catalogue
+
+    output_path: str
+    Path to the output directory
+
+    simulation_name: str
+    Name of the run
+
+    Returns
+    -------
+    Output: List[Tuple[Callable, Dict]]
+    Drawing functions and their arguments, one for each image
+    """
+
+    r_img = image_radius(halo_data, i)
+    outfile = (
+        lambda name: f"{output_path}/galaxy_{name}_%i_" % (i) + simulation_name + ".png"
     )
 
-    # Plot distribution of gas particles
-    plot_galaxy_parts(
-        gas_data, 0, stars_ang_momentum, halo_data, i, output_path, simulation_name
+    stars_face_on, stars_edge_on = face_on_and_edge_on(
+        stars_data.coordinates, stars_ang_momentum
     )
+    gas_face_on, gas_edge_on = face_on_and_edge_on(
+        gas_data.coordinates, stars_ang_momentum
+    )
+
+    # Sort particles by density for better viewing
+    stars_density = np.log10(stars_data.densities)
+    stars_sort = np.argsort(stars_density)
+    gas_density = np.log10(gas_data.densities)
+    gas_sort = np.argsort(gas_density)
+
+    jobs = [
+        # Create stars image
+        (
+            plot_galaxy,
+            dict(
+                pos_face_on=stars_face_on,
+                pos_edge_on=stars_edge_on,
+                mass=stars_data.masses,
+                hsml_parts=stars_data.smoothing_lengths,
+                cmap="magma",
+                left_title="Stellar component",
+                right_title=galaxy_title(halo_data, i, 4, with_radius=False),
+                r_img=r_img,
+                outfile=outfile("stars"),
+            ),
+        ),
+        # Create gas image
+        (
+            plot_galaxy,
+            dict(
+                pos_face_on=gas_face_on,
+                pos_edge_on=gas_edge_on,
+                mass=gas_data.masses,
+                hsml_parts=gas_data.smoothing_lengths,
+                cmap="viridis",
+                left_title="HI+H2 gas",
+                right_title=galaxy_title(halo_data, i, 0, with_radius=False),
+                r_img=r_img,
+                outfile=outfile("gas"),
+            ),
+        ),
+        # Plot distribution of stellar particles
+        (
+            plot_galaxy_parts,
+            dict(
+                pos_face_on=stars_face_on[stars_sort, :],
+                pos_edge_on=stars_edge_on[stars_sort, :],
+                density=stars_density[stars_sort],
+                left_title="Stellar component",
+                right_title=galaxy_title(halo_data, i, 4, with_radius=True),
+                r_img=r_img,
+                outfile=outfile("sparts"),
+            ),
+        ),
+        # Plot distribution of gas particles
+        (
+            plot_galaxy_parts,
+            dict(
+                pos_face_on=gas_face_on[gas_sort, :],
+                pos_edge_on=gas_edge_on[gas_sort, :],
+                density=gas_density[gas_sort],
+                left_title="Gas component",
+                right_title=galaxy_title(halo_data, i, 0, with_radius=True),
+                r_img=r_img,
+                outfile=outfile("parts"),
+            ),
+        ),
+    ]
 
     for filt in ["u", "r", "K"]:
         lums = pow(10.0, -0.4 * star_absmag[filt]) * 3631
-        render_luminosity_map(
-            stars_data,
-            lums,
-            filt,
-            stars_ang_momentum,
-            halo_data,
-            i,
-            output_path,
-            simulation_name,
+        jobs.append(
+            (
+                render_luminosity_map,
+                dict(
+                    pos_face_on=stars_face_on,
+                    pos_edge_on=stars_edge_on,
+                    luminosity=lums,
+                    hsml_parts=stars_data.smoothing_lengths,
+                    r_img=r_img,
+                    outfile=outfile(f"{filt}_map"),
+                ),
+            )
         )
 
+    return jobs
+
+
+def render_image(job: Tuple[Callable, Dict]) -> None:
+    """
+    Draws an image
+
+    Parameters
+    ----------
+    job: Tuple[Callable, Dict]
+    Drawing function and its arguments
+    """
+
+    function, arguments = job
+    function(**arguments)
+
     return
+
+
+class ImageRenderer:
+    """
+    Draws the galaxy images prepared by visualize_galaxy. With workers, the
+    images are drawn by a pool of processes while the galaxies are analysed;
+    otherwise they are drawn immediately in the calling process
+    """
+
+    def __init__(self, number_of_workers: int):
+        """
+        Parameters
+        ----------
+        number_of_workers: int
+        Number of processes drawing the images. If 0, the images are drawn by the
+        process submitting them
+        """
+
+        self.pool = None
+        if number_of_workers > 0:
+            self.pool = get_context("fork").Pool(number_of_workers)
+
+        # Queued images, oldest first. At most max_queued images are queued at a
+        # time, so that the analysis does not run ahead of the workers and keep
+        # the data of every image in memory
+        self.results = deque()
+        self.max_queued = 2 * number_of_workers
+
+    def submit(self, jobs: List[Tuple[Callable, Dict]]) -> None:
+        """
+        Draws images, or queues them if the renderer has workers
+
+        Parameters
+        ----------
+        jobs: List[Tuple[Callable, Dict]]
+        Drawing functions and their arguments
+        """
+
+        for job in jobs:
+            if self.pool is None:
+                render_image(job)
+                continue
+
+            self.results.append(self.pool.apply_async(render_image, (job,)))
+
+            # Collect the drawn images, re-raising errors from the workers, and
+            # wait for the oldest image while too many are queued
+            while self.results and (
+                self.results[0].ready() or len(self.results) > self.max_queued
+            ):
+                self.results.popleft().get()
+
+        return
+
+    def close(self) -> None:
+        """
+        Waits until all queued images are drawn and stops the workers
+        """
+
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+        # Re-raise errors from the workers
+        while self.results:
+            self.results.popleft().get()
+
+        return
@@ -1,33 +1,28 @@
 import matplotlib.pylab as plt
 from matplotlib.pylab import rcParams
 import numpy as np
+from object.results_store import ResultsStore
+from object.simulation_data import CombinedHistograms
+from .KS_relation import median_relations_from_sketch
 
 color = ["tab:blue", "tab:orange"]
 
 
-def output_momentum(stellar_mass, momentum, parttype, output_path, simulation_name):
+def output_momentum(stellar_mass, momentum, parttype, results_store):
     index = [i for i, v in enumerate(momentum) if v is not None]
     x = [stellar_mass[i] for i in index]
     y = [momentum[i] for i in index]
-    np.savetxt(
-        f"{output_path}/momentum_parttype_%i_" % (parttype) + simulation_name + ".txt",
-        np.transpose([x, y]),
-    )
+    results_store.add("momentum_parttype_%i" % (parttype), np.transpose([x, y]))
 
 
-def output_kappa(stellar_mass, kappa, parttype, output_path, simulation_name):
+def output_kappa(stellar_mass, kappa, parttype, results_store):
     index = [i for i, v in enumerate(kappa) if v is not None]
     x = [stellar_mass[i] for i in index]
     y = [kappa[i] for i in index]
-    np.savetxt(
-        f"{output_path}/Kappa_co_parttype_%i_" % (parttype) + simulation_name + ".txt",
-        np.transpose([x, y]),
-    )
+    results_store.add("Kappa_co_parttype_%i" % (parttype), np.transpose([x, y]))
 
 
-def output_axis_ratios(
-    stellar_mass, axis_ratios, parttype, output_path, simulation_name
-):
+def output_axis_ratios(stellar_mass, axis_ratios, parttype, results_store):
     y = axis_ratios[:, 0]
     y1 = axis_ratios[:, 1]
     y2 = axis_ratios[:, 2]
@@ -37,20 +32,33 @@ def output_axis_ratios(
     y1 = [y1[i] for i in index]
     y2 = [y2[i] for i in index]
 
-    np.savetxt(
-        f"{output_path}/Axis_ratios_parttype_%i_" % (parttype)
-        + simulation_name
-        + ".txt",
+    results_store.add(
+        "Axis_ratios_parttype_%i" % (parttype),
         np.transpose([x, y0, y1, y2]),
     )
 
 
-def output_accumulative_densities(combined_data, output_path, simulation_name):
+def output_accumulative_densities(combined_data, results_store):
 
-    np.savetxt(
-        f"{output_path}/accumulative_surface_density_gas_grid"
-        + simulation_name
-        + ".txt",
+    # Histograms of the pixels of all galaxies, with their bin edges
+    if isinstance(combined_data, CombinedHistograms):
+        for panel, histogram in combined_data.histograms.items():
+            x_edges, y_edges = combined_data.edges(panel)
+            results_store.add(f"accumulative_histogram_{panel}", histogram)
+            results_store.add(f"accumulative_histogram_{panel}_x_edges", x_edges)
+            results_store.add(f"accumulative_histogram_{panel}_y_edges", y_edges)
+
+        # Median relations with the 16th and 84th percentiles from the sketches
+        for panel, sketches in combined_data.sketches.items():
+            for selection, sketch in sketches.items():
+                results_store.add(
+                    f"accumulative_median_{panel}_{selection}",
+                    np.transpose(median_relations_from_sketch(sketch)),
+                )
+        return
+
+    results_store.add(
+        "accumulative_surface_density_gas_grid",
         np.transpose(
             [
                 combined_data.neutral_gas_surface_density,
@@ -60,10 +68,8 @@ def output_accumulative_densities(combined_data, output_path, simulation_name):
         ),
     )
 
-    np.savetxt(
-        f"{output_path}/accumulative_surface_density_H2_grid"
-        + simulation_name
-        + ".txt",
+    results_store.add(
+        "accumulative_surface_density_H2_grid",
         np.transpose(
             [
                 combined_data.molecular_gas_surface_density,
@@ -73,10 +79,8 @@ def output_accumulative_densities(combined_data, output_path, simulation_name):
         ),
     )
 
-    np.savetxt(
-        f"{output_path}/accumulative_surface_density_ratios_grid"
-        + simulation_name
-        + ".txt",
+    results_store.add(
+        "accumulative_surface_density_ratios_grid",
         np.transpose(
             [
                 combined_data.SFR_surface_density,
@@ -86,10 +90,8 @@ def output_accumulative_densities(combined_data, output_path, simulation_name):
         ),
     )
 
-    np.savetxt(
-        f"{output_path}/accumulative_surface_density_ratios_radii"
-        + simulation_name
-        + ".txt",
+    results_store.add(
+        "accumulative_surface_density_ratios_radii",
         np.transpose(
             [
                 combined_data.radii_neutral_gas_surface_density,
@@ -99,26 +101,22 @@ def output_accumulative_densities(combined_data, output_path, simulation_name):
     )
 
 
-def write_morphology_data_to_file(
-    galaxy_data, combined_data, output_path, simulation_name
-):
+def write_morphology_data_to_file(galaxy_data, combined_data, results_store):
     """
-    Writes morphology data to a file
+    Adds morphology data to the results store
     """
 
     output_momentum(
         10 ** galaxy_data.log10_stellar_mass,
         galaxy_data.momentum,
         4,
-        output_path,
-        simulation_name,
+        results_store,
     )
     output_momentum(
         10 ** galaxy_data.log10_stellar_mass,
         galaxy_data.gas_momentum,
         0,
-        output_path,
-        simulation_name,
+        results_store,
     )
 
     # plot kappa for stars and gas :
@@ -126,15 +124,13 @@ def write_morphology_data_to_file(
         10 ** galaxy_data.log10_stellar_mass,
         galaxy_data.kappa_co,
         4,
-        output_path,
-        simulation_name,
+        results_store,
     )
     output_kappa(
         10 ** galaxy_data.log10_stellar_mass,
         galaxy_data.gas_kappa_co,
         0,
-        output_path,
-        simulation_name,
+        results_store,
     )
 
     # Axis ratios
@@ -146,8 +142,7 @@ def write_morphology_data_to_file(
         10 ** galaxy_data.log10_stellar_mass,
         axis_ratios,
         4,
-        output_path,
-        simulation_name,
+        results_store,
     )
 
     axis_ratios = np.zeros((len(galaxy_data.gas_axis_ca), 3))
@@ -158,12 +153,11 @@ def write_morphology_data_to_file(
         10 ** galaxy_data.log10_stellar_mass,
         axis_ratios,
         0,
-        output_path,
-        simulation_name,
+        results_store,
     )
 
     # plot surface densities
-    output_accumulative_densities(combined_data, output_path, simulation_name)
+    output_accumulative_densities(combined_data, results_store)
 
     return
 
@@ -331,12 +325,11 @@ def plot_momentum(output_path, name_list):
         plt.grid("True")
 
         for i, name in enumerate(name_list):
-            data = np.loadtxt(
-                f"{output_path}/momentum_parttype_%i_" % (parttype) + name + ".txt"
+            data = ResultsStore.read(
+                output_path, name, "momentum_parttype_%i" % (parttype)
             )
 
-            # In case of no objects len(shape) = 1
-            if len(np.shape(data)) > 1:
+            if len(data) > 0:
                 plt.plot(data[:, 0], data[:, 1], "o", color=color[i], label=name)
 
         plt.xlabel("Stellar Mass [M$_{\odot}$]")
@@ -381,12 +374,11 @@ def plot_kappa(output_path, name_list):
         plt.grid("True")
 
         for i, name in enumerate(name_list):
-            data = np.loadtxt(
-                f"{output_path}/Kappa_co_parttype_%i_" % (parttype) + name + ".txt"
+            data = ResultsStore.read(
+                output_path, name, "Kappa_co_parttype_%i" % (parttype)
             )
 
-            # In case of no objects len(shape) = 1
-            if len(np.shape(data)) > 1:
+            if len(data) > 0:
                 plt.plot(data[:, 0], data[:, 1], "o", color=color[i], label=name)
 
         plt.xscale("log")
@@ -428,12 +420,11 @@ def plot_axis_ratios(output_path, name_list):
         plt.grid("True")
 
         for i, name in enumerate(name_list):
-            data = np.loadtxt(
-                f"{output_path}/Axis_ratios_parttype_%i_" % (parttype) + name + ".txt"
+            data = ResultsStore.read(
+                output_path, name, "Axis_ratios_parttype_%i" % (parttype)
             )
 
-            # In case of no objects len(shape) = 1
-            if len(np.shape(data)) > 1:
+            if len(data) > 0:
                 plt.plot(data[:, 0], data[:, 1], "o", color=color[i], label=name)
 
         plt.xscale("log")
@@ -448,12 +439,11 @@ def plot_axis_ratios(output_path, name_list):
         plt.grid("True")
 
         for i, name in enumerate(name_list):
-            data = np.loadtxt(
-                f"{output_path}/Axis_ratios_parttype_%i_" % (parttype) + name + ".txt"
+            data = ResultsStore.read(
+                output_path, name, "Axis_ratios_parttype_%i" % (parttype)
             )
 
-            # In case of no objects len(shape) = 1
-            if len(np.shape(data)) > 1:
+            if len(data) > 0:
                 plt.plot(data[:, 0], data[:, 2], "o", color=color[i], label=name)
 
         plt.xscale("log")
@@ -468,12 +458,11 @@ def plot_axis_ratios(output_path, name_list):
         plt.grid("True")
 
         for i, name in enumerate(name_list):
-            data = np.loadtxt(
-                f"{output_path}/Axis_ratios_parttype_%i_" % (parttype) + name + ".txt"
+            data = ResultsStore.read(
+                output_path, name, "Axis_ratios_parttype_%i" % (parttype)
             )
 
-            # In case of no objects len(shape) = 1
-            if len(np.shape(data)) > 1:
+            if len(data) > 0:
                 plt.plot(data[:, 0], data[:, 3], "o", color=color[i], label=name)
 
         plt.xscale("log")
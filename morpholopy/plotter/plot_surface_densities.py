@@ -1,7 +1,8 @@
 import matplotlib.pylab as plt
 from matplotlib.pylab import rcParams
-from .KS_relation import median_relations
+from .KS_relation import median_relations, median_relations_from_sketch
 import numpy as np
+from object.simulation_data import CombinedHistograms
 
 
 def plot_integrated_surface_densities(
@@ -117,42 +118,50 @@ def plot_integrated_surface_densities(
     plt.close()
 
 
-def plot_combined_surface_densities(combined_data, output_path, simulation_name):
+# Plot parameters of the combined plots
+combined_params = {
+    "font.size": 12,
+    "font.family": "Times",
+    "text.usetex": True,
+    "figure.figsize": (5.5, 4),
+    "figure.subplot.left": 0.15,
+    "figure.subplot.right": 0.85,
+    "figure.subplot.bottom": 0.18,
+    "figure.subplot.top": 0.9,
+    "lines.markersize": 2,
+    "lines.linewidth": 2.0,
+}
 
-    # Get the default KS relation for correct IMF
-    def KS(sigma_g, n, A):
-        return A * sigma_g ** n
 
-    # Plot parameters
-    params = {
-        "font.size": 12,
-        "font.family": "Times",
-        "text.usetex": True,
-        "figure.figsize": (5.5, 4),
-        "figure.subplot.left": 0.15,
-        "figure.subplot.right": 0.85,
-        "figure.subplot.bottom": 0.18,
-        "figure.subplot.top": 0.9,
-        "lines.markersize": 2,
-        "lines.linewidth": 2.0,
-    }
-    rcParams.update(params)
+# Get the default KS relation for correct IMF
+def KS(sigma_g, n, A):
+    return A * sigma_g ** n
 
-    sigma_SFR = combined_data.SFR_surface_density
-    metals = combined_data.gas_metallicity
-    metals[metals == 0] = 1e-6
-    metals = np.log10(np.array(metals, dtype="float"))
-    arg_sort = np.argsort(metals)
-    metals = metals[arg_sort[::-1]]
-    sigma_SFR = sigma_SFR[arg_sort[::-1]]
 
-    for plot in ["gas", "H2"]:
+def start_combined_panel(panel):
+    """
+    Creates the figure of a combined plot and draws the KS reference lines
 
-        # star formation rate surgface density vs surface density
-        fig = plt.figure()
-        ax = plt.subplot(1, 1, 1)
-        plt.grid("True")
+    Parameters
+    ----------
+    panel: str
+    "SFR" (star formation rate surface density vs surface density),
+    "depletion" (depletion time vs surface density) or "ratios" (H2 to neutral
+    gas ratio vs surface density)
+
+    Returns
+    -------
+    Output: Tuple[Figure, Axes]
+    Figure and its axes
+    """
+
+    rcParams.update(combined_params)
+
+    fig = plt.figure()
+    ax = plt.subplot(1, 1, 1)
+    plt.grid("True")
 
+    if panel == "SFR":
         Sigma_g = np.logspace(-2, 3, 1000)
         Sigma_star = KS(Sigma_g, 1.4, 1.515e-4)
         plt.plot(
@@ -173,6 +182,107 @@ def plot_combined_surface_densities(combined_data, output_path, simulation_name)
             linestyle="-",
         )
 
+    elif panel == "depletion":
+        Sigma_g = np.logspace(-1, 4, 1000)
+        Sigma_star = KS(Sigma_g, 1.4, 1.515e-4)
+        plt.plot(
+            np.log10(Sigma_g),
+            np.log10(Sigma_g) - np.log10(Sigma_star) + 6.0,
+            color="red",
+            label="KS law (Kennicutt 98)",
+            linestyle="--",
+        )
+
+    return fig, ax
+
+
+def finish_combined_panel(fig, ax, mappable, panel, plot, outfile):
+    """
+    Adds the axis labels, limits, legend and metallicity colour bar to a
+    combined plot, and saves and closes it
+
+    Parameters
+    ----------
+    fig: Figure
+    Figure from start_combined_panel
+
+    ax: Axes
+    Axes of the figure
+
+    mappable: ScalarMappable
+    Points or mesh coloured by metallicity
+
+    panel: str
+    "SFR", "depletion" or "ratios" (see start_combined_panel)
+
+    plot: str
+    Surface density on the x axis: "gas" (HI + H2) or "H2"
+
+    outfile: str
+    Output file name
+    """
+
+    if plot == "gas":
+        plt.xlabel(
+            "log $\\Sigma_{\\rm HI} + \\Sigma_{\\rm H_2}$  $[{\\rm M_\\odot\\cdot pc^{-2}}]$"
+        )
+    else:
+        plt.xlabel("log $\\Sigma_{\\rm H_2}$  $[{\\rm M_\\odot\\cdot pc^{-2}}]$")
+
+    if panel == "SFR":
+        plt.ylabel(
+            "log $\\Sigma_{\\rm SFR}$ $[{\\rm M_\\odot \\cdot yr^{-1} \\cdot kpc^{-2}}]$"
+        )
+        plt.ylim(-6.0, 1.0)
+    elif panel == "depletion" and plot == "gas":
+        plt.ylabel(
+            "log $\\rm t_{gas} = (\\Sigma_{\\rm HI} + \\Sigma_{\\rm H_2})/ \\Sigma_{\\rm SFR}$ $[{\\rm yr }]$"
+        )
+        plt.ylim(7, 12)
+    elif panel == "depletion":
+        plt.ylabel(
+            "log $\\rm t_{H_2} = \\Sigma_{\\rm H_2} / \\Sigma_{\\rm SFR}$ $[{\\rm yr }]$"
+        )
+        plt.ylim(7, 12)
+    else:
+        plt.ylabel(
+            r"log $\Sigma_{\mathrm{H2}} / (\Sigma_{\mathrm{HI}}+\Sigma_{\mathrm{H2}})$"
+        )
+        plt.ylim(-8.0, 0.5)
+
+    plt.xlim(-1.0, 4.0)
+    plt.legend(
+        loc=[0.65, 0.0] if panel == "ratios" else [0.0, 0.5],
+        labelspacing=0.2,
+        handlelength=1,
+        handletextpad=0.2,
+        frameon=False,
+    )
+
+    cbar_ax = fig.add_axes([0.87, 0.18, 0.018, 0.5])
+    cbar_ax.tick_params(labelsize=15)
+    cb = plt.colorbar(mappable, ticks=[-3, -2, -1, 0, 1], cax=cbar_ax)
+    cb.set_label(label="log Z$_{\mathrm{gas}}$/Z$_{\odot}$", labelpad=0.5)
+    ax.tick_params(direction="in", axis="both", which="both", pad=4.5)
+    plt.savefig(outfile, dpi=200)
+    plt.close()
+
+
+def plot_combined_surface_densities(combined_data, output_path, simulation_name):
+
+    sigma_SFR = combined_data.SFR_surface_density
+    metals = combined_data.gas_metallicity
+    metals[metals == 0] = 1e-6
+    metals = np.log10(np.array(metals, dtype="float"))
+    arg_sort = np.argsort(metals)
+    metals = metals[arg_sort[::-1]]
+    sigma_SFR = sigma_SFR[arg_sort[::-1]]
+
+    for plot in ["gas", "H2"]:
+
+        # star formation rate surgface density vs surface density
+        fig, ax = start_combined_panel("SFR")
+
         if plot == "gas":
             sigma_gas = combined_data.neutral_gas_surface_density
             t_gas = combined_data.depletion_time_neutral_gas
@@ -183,7 +293,7 @@ def plot_combined_surface_densities(combined_data, output_path, simulation_name)
         sigma_gas = sigma_gas[arg_sort[::-1]]
         t_gas = t_gas[arg_sort[::-1]]
 
-        plt.scatter(
+        points = plt.scatter(
             sigma_gas,
             sigma_SFR,
             c=metals,
@@ -241,55 +351,19 @@ def plot_combined_surface_densities(combined_data, output_path, simulation_name)
         plt.plot(x, y, "-", lw=2, color="white")
         plt.plot(x, y, "-", lw=1.5, color="black", label="star-forming")
 
-        if plot == "gas":
-            plt.xlabel(
-                "log $\\Sigma_{\\rm HI} + \\Sigma_{\\rm H_2}$  $[{\\rm M_\\odot\\cdot pc^{-2}}]$"
-            )
-        else:
-            plt.xlabel("log $\\Sigma_{\\rm H_2}$  $[{\\rm M_\\odot\\cdot pc^{-2}}]$")
-
-        plt.ylabel(
-            "log $\\Sigma_{\\rm SFR}$ $[{\\rm M_\\odot \\cdot yr^{-1} \\cdot kpc^{-2}}]$"
-        )
-        plt.xlim(-1.0, 4.0)
-        plt.ylim(-6.0, 1.0)
-        plt.legend(
-            loc=[0.0, 0.5],
-            labelspacing=0.2,
-            handlelength=1,
-            handletextpad=0.2,
-            frameon=False,
-        )
-
-        cbar_ax = fig.add_axes([0.87, 0.18, 0.018, 0.5])
-        cbar_ax.tick_params(labelsize=15)
-        cb = plt.colorbar(ticks=[-3, -2, -1, 0, 1], cax=cbar_ax)
-        cb.set_label(label="log Z$_{\mathrm{gas}}$/Z$_{\odot}$", labelpad=0.5)
-        ax.tick_params(direction="in", axis="both", which="both", pad=4.5)
-        plt.savefig(
-            f"{output_path}/combined_surface_density_{plot}_"
-            + simulation_name
-            + ".png",
-            dpi=200,
+        finish_combined_panel(
+            fig,
+            ax,
+            points,
+            "SFR",
+            plot,
+            f"{output_path}/combined_surface_density_{plot}_{simulation_name}.png",
         )
-        plt.close()
 
         # Depletion time vs surface density
-        fig = plt.figure()
-        ax = plt.subplot(1, 1, 1)
-        plt.grid("True")
-
-        Sigma_g = np.logspace(-1, 4, 1000)
-        Sigma_star = KS(Sigma_g, 1.4, 1.515e-4)
-        plt.plot(
-            np.log10(Sigma_g),
-            np.log10(Sigma_g) - np.log10(Sigma_star) + 6.0,
-            color="red",
-            label="KS law (Kennicutt 98)",
-            linestyle="--",
-        )
+        fig, ax = start_combined_panel("depletion")
 
-        plt.scatter(
+        points = plt.scatter(
             sigma_gas,
             t_gas,
             c=metals,
@@ -327,7 +401,7 @@ def plot_combined_surface_densities(combined_data, output_path, simulation_name)
         )
 
         select = np.where(metals > 0.6)[0]
-        x, y, y_down, y_up = median_relations(sigma_gas[select], sigma_SFR[select])
+        x, y, y_down, y_up = median_relations(sigma_gas[select], t_gas[select])
         plt.plot(x, y, "-", lw=2, color="white")
         plt.plot(
             x,
@@ -347,53 +421,25 @@ def plot_combined_surface_densities(combined_data, output_path, simulation_name)
         plt.plot(x, y, "-", lw=2, color="white")
         plt.plot(x, y, "-", lw=1.5, color="black", label="star-forming")
 
-        if plot == "gas":
-            plt.xlabel(
-                "log $\\Sigma_{\\rm HI} + \\Sigma_{\\rm H_2}$  $[{\\rm M_\\odot\\cdot pc^{-2}}]$"
-            )
-            plt.ylabel(
-                "log $\\rm t_{gas} = (\\Sigma_{\\rm HI} + \\Sigma_{\\rm H_2})/ \\Sigma_{\\rm SFR}$ $[{\\rm yr }]$"
-            )
-        else:
-            plt.xlabel("log $\\Sigma_{\\rm H_2}$  $[{\\rm M_\\odot\\cdot pc^{-2}}]$")
-            plt.ylabel(
-                "log $\\rm t_{H_2} = \\Sigma_{\\rm H_2} / \\Sigma_{\\rm SFR}$ $[{\\rm yr }]$"
-            )
-
-        plt.xlim(-1, 4.0)
-        plt.ylim(7, 12)
-        plt.legend(
-            loc=[0.0, 0.5],
-            labelspacing=0.2,
-            handlelength=1,
-            handletextpad=0.2,
-            frameon=False,
-        )
-
-        cbar_ax = fig.add_axes([0.87, 0.18, 0.018, 0.5])
-        cbar_ax.tick_params(labelsize=15)
-        cb = plt.colorbar(ticks=[-3, -2, -1, 0, 1], cax=cbar_ax)
-        cb.set_label(label="log Z$_{\mathrm{gas}}$/Z$_{\odot}$", labelpad=0.5)
-        ax.tick_params(direction="in", axis="both", which="both", pad=4.5)
-        plt.savefig(
+        finish_combined_panel(
+            fig,
+            ax,
+            points,
+            "depletion",
+            plot,
             f"{output_path}/depletion_time_combined_surface_density_{plot}_"
-            + simulation_name
-            + ".png",
-            dpi=200,
+            f"{simulation_name}.png",
         )
-        plt.close()
 
     #######
-    fig = plt.figure()
-    ax = plt.subplot(1, 1, 1)
-    plt.grid("True")
+    fig, ax = start_combined_panel("ratios")
 
     sigma_gas = combined_data.neutral_gas_surface_density
     sigma_ratio = combined_data.H2_to_neutral_surface_density_ratio
     sigma_gas = sigma_gas[arg_sort[::-1]]
     sigma_ratio = sigma_ratio[arg_sort[::-1]]
 
-    plt.scatter(
+    points = plt.scatter(
         sigma_gas,
         sigma_ratio,
         c=metals,
@@ -459,32 +505,165 @@ def plot_combined_surface_densities(combined_data, output_path, simulation_name)
         label="method:annuli",
     )
 
-    plt.xlabel(
-        "log $\\Sigma_{\\rm HI} + \\Sigma_{\\rm H_2}$  $[{\\rm M_\\odot\\cdot pc^{-2}}]$"
+    finish_combined_panel(
+        fig,
+        ax,
+        points,
+        "ratios",
+        "gas",
+        f"{output_path}/combined_surface_density_ratios_{simulation_name}.png",
     )
-    plt.ylabel(
-        r"log $\Sigma_{\mathrm{H2}} / (\Sigma_{\mathrm{HI}}+\Sigma_{\mathrm{H2}})$"
+
+
+# Median relations drawn on the combined histograms: selection of pixels (None
+# for all pixels), colour and label
+histogram_median_lines = [
+    ("low_metallicity", "crimson", "log Z$_{\mathrm{gas}}$/Z$_{\odot}$=-1"),
+    ("solar_metallicity", "mediumpurple", "log Z$_{\mathrm{gas}}$/Z$_{\odot}$=0"),
+    ("high_metallicity", "lightblue", "log Z$_{\mathrm{gas}}$/Z$_{\odot}$=1"),
+    ("all", "grey", "All"),
+    ("star_forming", "black", "star-forming"),
+]
+
+
+def plot_combined_histogram(combined_histograms, panel, lines, label=None):
+    """
+    Draws the mean metallicity of the pixels in the bins of a combined
+    histogram, and the median relations of the selected pixels
+
+    Parameters
+    ----------
+    combined_histograms: CombinedHistograms
+    Histograms of all galaxies
+
+    panel: str
+    Name of the histogram
+
+    lines: list
+    Selections, colours and labels of the median relations
+
+    label: str
+    Legend label of the mesh, if any
+
+    Returns
+    -------
+    Output: QuadMesh
+    Mesh coloured by metallicity
+    """
+
+    x_edges, y_edges = combined_histograms.edges(panel)
+    histogram = combined_histograms.histograms[panel]
+    counts = histogram[-1]
+
+    # Bins within the y range, without the underflow and overflow bins
+    with np.errstate(invalid="ignore", divide="ignore"):
+        metals = histogram[0][:, 1:-1] / counts[:, 1:-1]
+    metals = np.ma.masked_where(counts[:, 1:-1] == 0, metals)
+
+    mesh = plt.pcolormesh(
+        x_edges,
+        y_edges,
+        metals.T,
+        alpha=0.9,
+        vmin=-3,
+        vmax=1,
+        cmap="CMRmap_r",
+        zorder=2,
     )
-    plt.xlim(-1.0, 4.0)
-    plt.ylim(-8.0, 0.5)
-    plt.legend(
-        loc=[0.65, 0.0],
-        labelspacing=0.2,
-        handlelength=1,
-        handletextpad=0.2,
-        frameon=False,
+
+    # Legend entry of the mesh, which the legend cannot show itself
+    if label is not None:
+        plt.plot([], [], "s", ms=4, color=mesh.cmap(0.75), label=label)
+
+    for selection, color, line_label in lines:
+        sketch = combined_histograms.sketches[panel][selection]
+        x, y, y_down, y_up = median_relations_from_sketch(sketch)
+        plt.plot(x, y, "-", lw=2, color="white")
+        plt.plot(x, y, "-", lw=1.5, color=color, label=line_label)
+
+    return mesh
+
+
+def plot_combined_histograms(combined_histograms, output_path, simulation_name):
+    """
+    Makes the combined plots of plot_combined_surface_densities from the
+    histograms of all galaxies. The pixels are shown as bins coloured by their
+    mean metallicity instead of individual points
+
+    Parameters
+    ----------
+    combined_histograms: CombinedHistograms
+    Histograms of all galaxies
+
+    output_path: str
+    Path to the output directory
+
+    simulation_name: str
+    Name of the run
+    """
+
+    for plot in ["gas", "H2"]:
+
+        # star formation rate surgface density vs surface density
+        fig, ax = start_combined_panel("SFR")
+        mesh = plot_combined_histogram(
+            combined_histograms, plot, histogram_median_lines
+        )
+        finish_combined_panel(
+            fig,
+            ax,
+            mesh,
+            "SFR",
+            plot,
+            f"{output_path}/combined_surface_density_{plot}_{simulation_name}.png",
+        )
+
+        # Depletion time vs surface density
+        fig, ax = start_combined_panel("depletion")
+        mesh = plot_combined_histogram(
+            combined_histograms, "depletion_" + plot, histogram_median_lines
+        )
+        finish_combined_panel(
+            fig,
+            ax,
+            mesh,
+            "depletion",
+            plot,
+            f"{output_path}/depletion_time_combined_surface_density_{plot}_"
+            f"{simulation_name}.png",
+        )
+
+    #######
+    fig, ax = start_combined_panel("ratios")
+
+    mesh = plot_combined_histogram(
+        combined_histograms, "ratios", histogram_median_lines[:-1], "method:grid"
     )
 
-    cbar_ax = fig.add_axes([0.87, 0.18, 0.018, 0.5])
-    cbar_ax.tick_params(labelsize=15)
-    cb = plt.colorbar(ticks=[-3, -2, -1, 0, 1], cax=cbar_ax)
-    cb.set_label(label="log Z$_{\mathrm{gas}}$/Z$_{\odot}$", labelpad=0.5)
-    ax.tick_params(direction="in", axis="both", which="both", pad=4.5)
-    plt.savefig(
-        f"{output_path}/combined_surface_density_ratios_" + simulation_name + ".png",
-        dpi=200,
+    # The annuli, at the centres of the occupied bins
+    x_edges, y_edges = combined_histograms.edges("radii_ratios")
+    x_bins, y_bins = np.nonzero(combined_histograms.histograms["radii_ratios"][-1])
+    y_centres = np.concatenate(
+        [y_edges[:1], 0.5 * (y_edges[1:] + y_edges[:-1]), y_edges[-1:]]
+    )
+    plt.plot(
+        0.5 * (x_edges[x_bins] + x_edges[x_bins + 1]),
+        y_centres[y_bins],
+        "o",
+        ms=4,
+        alpha=0.5,
+        color="tab:blue",
+        label="method:annuli",
+    )
+
+    finish_combined_panel(
+        fig,
+        ax,
+        mesh,
+        "ratios",
+        "gas",
+        f"{output_path}/combined_surface_density_ratios_{simulation_name}.png",
     )
-    plt.close()
 
 
 def plot_surface_densities(
@@ -500,4 +679,7 @@ def plot_surface_densities(
         simulation_name,
     )
 
-    plot_combined_surface_densities(combined_data, output_path, simulation_name)
+    if isinstance(combined_data, CombinedHistograms):
+        plot_combined_histograms(combined_data, output_path, simulation_name)
+    else:
+        plot_combined_surface_densities(combined_data, output_path, simulation_name)
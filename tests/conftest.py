@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules of morpholopy import each other relative to the directory of the
+# pipeline script, e.g. "from object.unitilies.kernels import ..."
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "morpholopy")
+)
@@ -0,0 +1,136 @@
+"""
+Analyses the synthetic run written by synthetic_run.py as morpholopy.py does, up
+to the results store, without drawing the galaxy images or making the plots.
+All haloes are analysed as galaxies to visualise, so the results store holds
+the tables of every galaxy. Run as a script:
+
+    python run_synthetic_analysis.py run_directory output_directory [--mpi]
+
+With --mpi, run it with mpirun; rank 0 writes the results store
+"""
+
+import argparse
+import os
+import sys
+
+import unyt
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "morpholopy"
+    ),
+)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from morpholopy import compute_galaxy_morpholopy, compute_galaxies_with_mpi
+from object import simulation_data
+from object.results_store import ResultsStore
+from plotter.plot_galaxy import ImageRenderer
+from plotter.plot_morphology import write_morphology_data_to_file
+from synthetic_run import catalogue_name, snapshot_name
+
+
+class DiscardingRenderer(ImageRenderer):
+    """
+    Renderer dropping the galaxy images instead of drawing them
+    """
+
+    def __init__(self):
+        super().__init__(0)
+
+    def submit(self, jobs) -> None:
+        return
+
+
+def analyse_synthetic_run(run_directory: str, output_directory: str, comm) -> None:
+    """
+    Computes the morphological properties of all haloes of the synthetic run and
+    writes them to the results store
+
+    Parameters
+    ----------
+    run_directory: str
+    Directory with the synthetic snapshot and catalogue
+
+    output_directory: str
+    Directory of the results store
+
+    comm: Optional[mpi4py.MPI.Comm]
+    MPI communicator, or None for a serial run
+    """
+
+    # Rank 0 loads the data first, as in morpholopy.py
+    if comm is not None and comm.Get_rank() > 0:
+        comm.Barrier()
+
+    sim_info = simulation_data.SimInfo(
+        directory=run_directory,
+        snapshot=snapshot_name,
+        catalogue=catalogue_name,
+        name=None,
+        galaxy_min_stellar_mass=unyt.unyt_quantity(1e8, "Msun"),
+    )
+
+    if comm is not None and comm.Get_rank() == 0:
+        comm.Barrier()
+
+    results_store = ResultsStore(output_directory, sim_info.simulation_name)
+    if comm is None or comm.Get_rank() == 0:
+        results_store.create()
+
+    simulation_data.SimInfo.load_photometry_grid()
+
+    num_galaxies = sim_info.halo_data.number_of_haloes
+    renderer = DiscardingRenderer()
+
+    if comm is not None:
+        if not compute_galaxies_with_mpi(
+            sim_info=sim_info,
+            num_galaxies=num_galaxies,
+            output_path=output_directory,
+            results_store=results_store,
+            renderer=renderer,
+            comm=comm,
+        ):
+            sim_info.combined_data.close()
+            return
+    else:
+        sim_info.calculate_morphology_of_haloes()
+        for i in range(sim_info.halo_data.number_of_haloes):
+            compute_galaxy_morpholopy(
+                sim_info=sim_info,
+                halo_counter=i,
+                num_galaxies=num_galaxies,
+                output_path=output_directory,
+                results_store=results_store,
+                renderer=renderer,
+            )
+            results_store.flush()
+
+    write_morphology_data_to_file(
+        sim_info.halo_data, sim_info.combined_data, results_store
+    )
+    sim_info.write_galaxy_data_to_file(results_store)
+    results_store.flush()
+
+    sim_info.combined_data.close()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Analyses the synthetic run up to the results store."
+    )
+    parser.add_argument("run_directory", type=str)
+    parser.add_argument("output_directory", type=str)
+    parser.add_argument("--mpi", action="store_true")
+    args = parser.parse_args()
+
+    comm = None
+    if args.mpi:
+        from mpi4py import MPI
+
+        comm = MPI.COMM_WORLD
+
+    analyse_synthetic_run(args.run_directory, args.output_directory, comm)
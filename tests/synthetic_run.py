@@ -0,0 +1,467 @@
+"""
+Writes a small synthetic run: a SWIFT snapshot and a VELOCIraptor catalogue
+(properties, catalog_groups and catalog_particles files) with rotating discs of
+gas and stars in a few haloes. The files hold only the datasets and metadata
+read by morpholopy, with the same layout as the files written by SWIFT and
+VELOCIraptor.
+
+Run as a script to write the files into a directory:
+
+    python synthetic_run.py run_directory
+"""
+
+import os
+import sys
+from typing import Dict, List, Tuple
+
+import h5py
+import numpy as np
+
+# Internal units of the snapshot (cgs), as in the SWIFT cosmological runs:
+# Mpc, 1e10 Msun and km/s
+unit_length = 3.08567758e24
+unit_mass = 1.98841e43
+unit_time = 3.08567758e19
+
+# Box size [Mpc], number of top-level cells per side, and scale factor
+box_size = 10.0
+cells_per_side = 4
+scale_factor = 1.0
+
+snapshot_name = "snapshot_0000.hdf5"
+catalogue_name = "halos_0000.properties"
+
+# Columns of the named datasets, as in the SWIFT EAGLE-like runs
+element_names = [
+    "Hydrogen",
+    "Helium",
+    "Carbon",
+    "Nitrogen",
+    "Oxygen",
+    "Neon",
+    "Magnesium",
+    "Silicon",
+    "Iron",
+]
+species_names = ["elec", "HI", "HII", "Hm", "HeI", "HeII", "HeIII", "H2", "H2p", "H3p"]
+
+
+def rotation_matrix(rng: np.random.Generator) -> np.ndarray:
+    """
+    Returns a random rotation matrix
+    """
+
+    matrix, upper = np.linalg.qr(rng.normal(size=(3, 3)))
+    matrix *= np.sign(np.diag(upper))
+    if np.linalg.det(matrix) < 0:
+        matrix[:, 0] *= -1
+    return matrix
+
+
+def disc(
+    rng: np.random.Generator,
+    number_of_particles: int,
+    scale_length: float,
+    dispersion: float,
+    rotation: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the positions [kpc] and velocities [km/s] of the particles of an
+    exponential disc with a flat rotation curve, relative to its centre
+    """
+
+    radii = np.minimum(rng.exponential(scale_length, number_of_particles), 25.0)
+    angles = rng.uniform(0.0, 2.0 * np.pi, number_of_particles)
+    heights = rng.normal(0.0, 0.1 * scale_length, number_of_particles)
+
+    circular_velocity = 200.0 * (1.0 - np.exp(-radii / 2.0))
+    positions = np.column_stack(
+        [radii * np.cos(angles), radii * np.sin(angles), heights]
+    )
+    velocities = rng.normal(0.0, dispersion, (number_of_particles, 3))
+    velocities[:, 0] -= circular_velocity * np.sin(angles)
+    velocities[:, 1] += circular_velocity * np.cos(angles)
+
+    return positions @ rotation.T, velocities @ rotation.T
+
+
+def make_haloes(rng: np.random.Generator, number_of_haloes: int) -> List[Dict]:
+    """
+    Returns the haloes of the catalogue: central discs of different sizes, one
+    of them across the box boundary, followed by a satellite and a central with
+    a low stellar mass, which are not selected
+    """
+
+    haloes = []
+    for i in range(number_of_haloes + 2):
+        centre = rng.uniform(0.0, box_size * 1000.0, 3)
+        if i == 0:
+            centre[0] = 5.0
+        haloes.append(
+            {
+                "centre": centre,
+                "velocity": rng.normal(0.0, 100.0, 3),
+                "number_of_gas": int(rng.integers(200, 600)),
+                "number_of_stars": int(rng.integers(300, 900)),
+                "rotation": rotation_matrix(rng),
+                "structure_type": 15 if i == number_of_haloes else 10,
+                "gas_mass": 1e-4,
+                "star_mass": 1e-6 if i == number_of_haloes + 1 else 1e-4,
+            }
+        )
+    return haloes
+
+
+def write_dataset(
+    group: h5py.Group,
+    name: str,
+    data: np.ndarray,
+    mass: float = 0.0,
+    length: float = 0.0,
+    time: float = 0.0,
+    a_exponent: float = 0.0,
+) -> None:
+    """
+    Writes a snapshot dataset with the unit attributes written by SWIFT
+    """
+
+    dataset = group.create_dataset(name, data=data)
+    conversion = unit_mass ** mass * unit_length ** length * unit_time ** time
+    for unit, exponent in [
+        ("I", 0.0),
+        ("L", length),
+        ("M", mass),
+        ("T", 0.0),
+        ("t", time),
+    ]:
+        dataset.attrs[f"U_{unit} exponent"] = [exponent]
+    dataset.attrs["a-scale exponent"] = [a_exponent]
+    dataset.attrs["h-scale exponent"] = [0.0]
+    dataset.attrs[
+        "Conversion factor to CGS (not including cosmological corrections)"
+    ] = [conversion]
+    dataset.attrs[
+        "Conversion factor to physical CGS (including cosmological corrections)"
+    ] = [conversion * scale_factor ** a_exponent]
+
+    return
+
+
+def write_snapshot(path: str, particles: Dict[str, Dict[str, Tuple]]) -> None:
+    """
+    Writes the snapshot. The particles are sorted by top-level cell, and the
+    cell metadata used by swiftsimio masks is written as well. Each field is
+    given by its data and the unit exponents passed on to write_dataset
+    """
+
+    cell_size = box_size / cells_per_side
+    number_of_cells = cells_per_side ** 3
+    cell_indices = np.indices((cells_per_side,) * 3).reshape(3, -1).T
+    centres = (cell_indices + 0.5) * cell_size
+
+    with h5py.File(path, "w") as snapshot:
+        header = snapshot.create_group("Header")
+        number_of_particles = np.array(
+            [len(particles["gas"]["Masses"][0]), 0, 0, 0]
+            + [len(particles["stars"]["Masses"][0]), 0, 0]
+        )
+        header.attrs["BoxSize"] = [box_size] * 3
+        header.attrs["Dimension"] = [3]
+        header.attrs["NumPart_ThisFile"] = number_of_particles
+        header.attrs["NumPart_Total"] = number_of_particles
+        header.attrs["NumPart_Total_HighWord"] = np.zeros(7, dtype=np.int64)
+        header.attrs["MassTable"] = np.zeros(7)
+        header.attrs["NumFilesPerSnapshot"] = [1]
+        header.attrs["Scale-factor"] = [scale_factor]
+        header.attrs["Redshift"] = [1.0 / scale_factor - 1.0]
+        header.attrs["RunName"] = np.bytes_("Synthetic")
+
+        for group_name in ["Units", "InternalCodeUnits"]:
+            units = snapshot.create_group(group_name)
+            units.attrs["Unit mass in cgs (U_M)"] = [unit_mass]
+            units.attrs["Unit length in cgs (U_L)"] = [unit_length]
+            units.attrs["Unit time in cgs (U_t)"] = [unit_time]
+            units.attrs["Unit current in cgs (U_I)"] = [1.0]
+            units.attrs["Unit temperature in cgs (U_T)"] = [1.0]
+
+        cosmology = snapshot.create_group("Cosmology")
+        for name, value in [
+            ("Cosmological run", 1),
+            ("H0 [internal units]", 70.0),
+            ("h", 0.7),
+            ("Omega_b", 0.05),
+            ("Omega_cdm", 0.25),
+            ("Omega_m", 0.3),
+            ("Omega_lambda", 0.7),
+            ("Omega_r", 0.0),
+            ("Omega_k", 0.0),
+            ("w_0", -1.0),
+            ("w_a", 0.0),
+            ("Scale-factor", scale_factor),
+            ("Redshift", 1.0 / scale_factor - 1.0),
+        ]:
+            cosmology.attrs[name] = [value]
+
+        gravity = snapshot.create_group("GravityScheme")
+        gravity.attrs["Maximal physical baryon softening length  [internal units]"] = [
+            7e-4
+        ]
+
+        named_columns = snapshot.create_group("SubgridScheme/NamedColumns")
+        named_columns.create_dataset(
+            "ElementMassFractions", data=np.array(element_names, dtype="S")
+        )
+        named_columns.create_dataset(
+            "SpeciesFractions", data=np.array(species_names, dtype="S")
+        )
+
+        cells = snapshot.create_group("Cells")
+        cells.create_dataset("Centres", data=centres)
+        metadata = cells.create_group("Meta-data")
+        metadata.attrs["size"] = [cell_size] * 3
+        metadata.attrs["dimension"] = [cells_per_side] * 3
+        metadata.attrs["nr_cells"] = number_of_cells
+
+        for particle_type, fields in [("PartType0", "gas"), ("PartType4", "stars")]:
+            data = particles[fields]
+            coordinates = data["Coordinates"][0]
+            cell = np.floor(coordinates / cell_size).astype(np.int64)
+            cell = np.ravel_multi_index(cell.T, (cells_per_side,) * 3)
+            order = np.argsort(cell, kind="stable")
+            cell = cell[order]
+
+            counts = np.bincount(cell, minlength=number_of_cells)
+            offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            cells.create_dataset(f"Counts/{particle_type}", data=counts)
+            cells.create_dataset(f"OffsetsInFile/{particle_type}", data=offsets)
+
+            minima = centres.copy()
+            maxima = centres.copy()
+            for i in np.flatnonzero(counts):
+                in_cell = coordinates[order][offsets[i] : offsets[i] + counts[i]]
+                minima[i] = in_cell.min(axis=0)
+                maxima[i] = in_cell.max(axis=0)
+            cells.create_dataset(f"MinPositions/{particle_type}", data=minima)
+            cells.create_dataset(f"MaxPositions/{particle_type}", data=maxima)
+
+            group = snapshot.create_group(particle_type)
+            for name, (values, units) in data.items():
+                write_dataset(group, name, values[order], **units)
+
+    return
+
+
+def write_synthetic_run(
+    directory: str, number_of_haloes: int = 8, seed: int = 0
+) -> Tuple[str, str]:
+    """
+    Writes the snapshot and catalogue files of a synthetic run
+
+    Parameters
+    ----------
+    directory: str
+    Run directory; created if needed
+
+    number_of_haloes: int
+    Number of haloes selected with a minimum stellar mass of 1e8 Msun. The
+    catalogue also has a satellite and a central with a lower stellar mass
+
+    seed: int
+    Seed of the random numbers
+
+    Returns
+    -------
+    Output: Tuple[str, str]
+    Names of the snapshot and catalogue properties files
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    haloes = make_haloes(rng, number_of_haloes)
+
+    fields = {"gas": {}, "stars": {}}
+    for particle_type in fields:
+        fields[particle_type] = {"Coordinates": [], "Velocities": [], "Masses": []}
+
+    halo_particle_ids = []
+
+    for halo in haloes:
+        for particle_type, number, scale_length, dispersion in [
+            ("gas", halo["number_of_gas"], 4.0, 15.0),
+            ("stars", halo["number_of_stars"], 2.5, 40.0),
+        ]:
+            positions, velocities = disc(
+                rng, number, scale_length, dispersion, halo["rotation"]
+            )
+            fields[particle_type]["Coordinates"].append(
+                np.mod(halo["centre"] + positions, box_size * 1000.0) / 1000.0
+            )
+            fields[particle_type]["Velocities"].append(halo["velocity"] + velocities)
+            fields[particle_type]["Masses"].append(
+                np.full(
+                    number, halo["gas_mass" if particle_type == "gas" else "star_mass"]
+                )
+            )
+
+    # Particles outside the haloes
+    for particle_type, number in [("gas", 1500), ("stars", 500)]:
+        fields[particle_type]["Coordinates"].append(
+            rng.uniform(0.0, box_size, (number, 3))
+        )
+        fields[particle_type]["Velocities"].append(rng.normal(0.0, 100.0, (number, 3)))
+        fields[particle_type]["Masses"].append(np.full(number, 1e-4))
+
+    fields = {
+        particle_type: {name: np.concatenate(values) for name, values in data.items()}
+        for particle_type, data in fields.items()
+    }
+    number_of_gas = len(fields["gas"]["Masses"])
+    number_of_stars = len(fields["stars"]["Masses"])
+
+    # Unique particle ids, not in the order of the particles
+    ids = rng.permutation(np.arange(1, number_of_gas + number_of_stars + 1))
+    gas_ids, star_ids = ids[:number_of_gas], ids[number_of_gas:]
+
+    # Gas properties
+    densities = 10 ** rng.uniform(4.0, 7.5, number_of_gas)
+    star_forming = densities > 10 ** 6.5
+    gas_metals = 0.0134 * 10 ** rng.normal(0.0, 0.5, number_of_gas)
+    gas_metals[::97] = 0.0
+    elements = np.zeros((number_of_gas, len(element_names)))
+    elements[:, 0] = 0.75
+    elements[:, 1] = 0.25 - gas_metals
+    species = np.zeros((number_of_gas, len(species_names)))
+    species[:, 1] = rng.uniform(0.1, 0.9, number_of_gas)
+    species[:, 7] = np.where(
+        star_forming, rng.uniform(0.0, 0.5, number_of_gas) * (1.0 - species[:, 1]), 0.0
+    )
+
+    particles = {
+        "gas": {
+            "Coordinates": (fields["gas"]["Coordinates"], dict(length=1, a_exponent=1)),
+            "Velocities": (fields["gas"]["Velocities"], dict(length=1, time=-1)),
+            "Masses": (fields["gas"]["Masses"], dict(mass=1)),
+            "ParticleIDs": (gas_ids, {}),
+            "SmoothingLengths": (
+                rng.uniform(5e-4, 2e-3, number_of_gas),
+                dict(length=1, a_exponent=1),
+            ),
+            "StarFormationRates": (
+                np.where(star_forming, rng.uniform(1e-5, 1e-3, number_of_gas), 0.0),
+                dict(mass=1, time=-1),
+            ),
+            "Densities": (densities, dict(mass=1, length=-3, a_exponent=-3)),
+            "MetalMassFractions": (gas_metals, {}),
+            "ElementMassFractions": (elements, {}),
+            "SpeciesFractions": (species, {}),
+        },
+        "stars": {
+            "Coordinates": (
+                fields["stars"]["Coordinates"],
+                dict(length=1, a_exponent=1),
+            ),
+            "Velocities": (fields["stars"]["Velocities"], dict(length=1, time=-1)),
+            "Masses": (fields["stars"]["Masses"], dict(mass=1)),
+            "ParticleIDs": (star_ids, {}),
+            "BirthScaleFactors": (rng.uniform(0.2, 1.0, number_of_stars), {}),
+            "MetalMassFractions": (
+                0.0134 * 10 ** rng.normal(0.0, 0.3, number_of_stars),
+                {},
+            ),
+            "InitialMasses": (fields["stars"]["Masses"] * 1.5, dict(mass=1)),
+        },
+    }
+
+    write_snapshot(f"{directory}/{snapshot_name}", particles)
+
+    # The particles of each halo in the catalogue, in random order, with ids
+    # of particles that are not gas or stars (e.g. dark matter) in between
+    first_gas, first_star = 0, 0
+    for halo in haloes:
+        halo_ids = np.concatenate(
+            [
+                gas_ids[first_gas : first_gas + halo["number_of_gas"]],
+                star_ids[first_star : first_star + halo["number_of_stars"]],
+                number_of_gas
+                + number_of_stars
+                + 1
+                + len(halo_particle_ids) * 100
+                + np.arange(50),
+            ]
+        )
+        halo_particle_ids.append(rng.permutation(halo_ids))
+        first_gas += halo["number_of_gas"]
+        first_star += halo["number_of_stars"]
+
+    catalogue_base = f"{directory}/{os.path.splitext(catalogue_name)[0]}"
+    group_sizes = np.array([len(ids) for ids in halo_particle_ids])
+
+    with h5py.File(f"{catalogue_base}.catalog_groups", "w") as groups:
+        groups.create_dataset("Group_Size", data=group_sizes)
+        groups.create_dataset(
+            "Offset", data=np.concatenate([[0], np.cumsum(group_sizes)[:-1]])
+        )
+        groups.create_dataset("Offset_unbound", data=np.zeros(len(haloes), dtype=int))
+        groups.create_dataset("Num_of_groups", data=[len(haloes)])
+        groups.create_dataset("Total_num_of_groups", data=[len(haloes)])
+
+    with h5py.File(f"{catalogue_base}.catalog_particles", "w") as particles_file:
+        particles_file.create_dataset(
+            "Particle_IDs", data=np.concatenate(halo_particle_ids)
+        )
+        particles_file.create_dataset(
+            "Num_of_particles_in_groups", data=[group_sizes.sum()]
+        )
+
+    with h5py.File(f"{catalogue_base}.catalog_particles.unbound", "w") as unbound:
+        unbound.create_dataset("Particle_IDs", data=np.array([], dtype=np.int64))
+        unbound.create_dataset("Num_of_particles_in_groups", data=[0])
+
+    # Halo properties in the units of the catalogue: Mpc, 1e10 Msun and km/s
+    def halo_property(function):
+        return np.array([function(halo) for halo in haloes])
+
+    with h5py.File(f"{directory}/{catalogue_name}", "w") as properties:
+        properties.attrs["Length_unit_to_kpc"] = 1000.0
+        properties.attrs["Mass_unit_to_solarmass"] = 1e10
+        properties.attrs["Velocity_to_kms"] = 1.0
+        properties.attrs["Metallicity_unit_to_solar"] = 1.0
+        properties.attrs["Time"] = scale_factor
+        properties.attrs["Period"] = box_size * scale_factor
+        properties.attrs["Cosmological_Sim"] = 1
+        properties.attrs["Comoving_or_Physical"] = 0
+
+        for name, values in [
+            ("ID", np.arange(1, len(haloes) + 1)),
+            ("Structuretype", halo_property(lambda h: h["structure_type"])),
+            (
+                "Aperture_mass_star_30_kpc",
+                halo_property(lambda h: h["number_of_stars"] * h["star_mass"]),
+            ),
+            (
+                "Aperture_mass_gas_30_kpc",
+                halo_property(lambda h: h["number_of_gas"] * h["gas_mass"]),
+            ),
+            (
+                "Aperture_SFR_gas_30_kpc",
+                halo_property(lambda h: 1e-3 * h["number_of_gas"]),
+            ),
+            ("Aperture_Zmet_gas_sf_30_kpc", halo_property(lambda h: 0.0134)),
+            ("Aperture_Zmet_gas_30_kpc", halo_property(lambda h: 0.01)),
+            ("Mass_200crit", halo_property(lambda h: 100.0 * h["number_of_stars"])),
+            ("R_HalfMass_star", halo_property(lambda h: 3e-3)),
+            ("R_HalfMass_gas", halo_property(lambda h: 5e-3)),
+            ("Xcminpot", halo_property(lambda h: h["centre"][0] / 1000.0)),
+            ("Ycminpot", halo_property(lambda h: h["centre"][1] / 1000.0)),
+            ("Zcminpot", halo_property(lambda h: h["centre"][2] / 1000.0)),
+            ("VXcminpot", halo_property(lambda h: h["velocity"][0])),
+            ("VYcminpot", halo_property(lambda h: h["velocity"][1])),
+            ("VZcminpot", halo_property(lambda h: h["velocity"][2])),
+        ]:
+            properties.create_dataset(name, data=values)
+
+    return snapshot_name, catalogue_name
+
+
+if __name__ == "__main__":
+    write_synthetic_run(sys.argv[1])
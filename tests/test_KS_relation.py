@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from plotter.KS_relation import project_gas_quantities
+
+
+def gas_disc(number_of_particles=3000, seed=0):
+    """
+    Gas particles in a disc, some of them with zero or negative star formation
+    rates, and a few far outside the grid
+    """
+
+    rng = np.random.default_rng(seed)
+    radii = rng.exponential(3.0, number_of_particles)
+    angles = rng.uniform(0.0, 2.0 * np.pi, number_of_particles)
+    x, y = radii * np.cos(angles), radii * np.sin(angles)
+    x[:20] = 100.0
+    y[20:40] = -100.0
+
+    masses = rng.uniform(0.5, 1.5, number_of_particles)
+    sfr = rng.normal(0.0, 1.0, number_of_particles)
+    data = SimpleNamespace(
+        H2_masses=0.3 * masses,
+        HI_masses=0.5 * masses,
+        neutral_masses=0.8 * masses,
+        star_formation_rates=sfr,
+        metallicities=rng.uniform(0.0, 0.03, number_of_particles),
+    )
+    return x, y, data
+
+
+def test_sparse_maps_match_dense_maps():
+    x, y, data = gas_disc()
+    res, region = 60, [-15.0, 15.0]
+
+    maps = project_gas_quantities(x, y, data, res, region)
+
+    # Dense maps: pixel [i, j] covers the i-th interval in x and the j-th in y
+    bins = np.linspace(*region, res + 1)
+    area = ((region[1] - region[0]) / res) ** 2
+
+    def dense(weights):
+        return np.histogram2d(x, y, [bins, bins], weights=weights)[0].ravel()
+
+    count = dense(None)
+    sfr = np.where(data.star_formation_rates > 0.0, data.star_formation_rates, 0.0)
+    expected = {
+        "H2": dense(data.H2_masses) / area,
+        "HI": dense(data.HI_masses) / area,
+        "HI+H2": dense(data.neutral_masses) / area,
+        "SFR": dense(sfr) / area,
+        "metals": dense(data.metallicities) / np.where(count == 0, 1, count),
+        "count": count,
+    }
+
+    # Only the occupied pixels are kept, in increasing order
+    assert maps.res == res
+    np.testing.assert_array_equal(maps.pixels, np.flatnonzero(count))
+    for name, values in expected.items():
+        np.testing.assert_allclose(maps[name], values[maps.pixels], rtol=1e-12)
+        assert np.all(np.delete(values, maps.pixels) == 0.0)
+
+    inside = (np.abs(x) < 15.0) & (np.abs(y) < 15.0)
+    assert maps["count"].sum() == np.count_nonzero(inside)
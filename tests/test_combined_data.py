@@ -0,0 +1,132 @@
+import os
+
+import numpy as np
+
+from object.simulation_data import CombinedData, CombinedHistograms
+
+
+def galaxy_data(number_of_galaxies=6, seed=0):
+    """
+    Spatially resolved data of a few galaxies, with realistic ranges of the
+    fields. One galaxy has no data
+    """
+
+    rng = np.random.default_rng(seed)
+    galaxies = []
+    for galaxy in range(number_of_galaxies):
+        pixels = 0 if galaxy == 2 else int(rng.integers(50, 400))
+        radii = 0 if galaxy == 2 else int(rng.integers(5, 40))
+        neutral = rng.uniform(-1.5, 3.5, pixels)
+        data = {
+            "neutral_gas_surface_density": neutral,
+            "molecular_gas_surface_density": neutral - rng.uniform(0.0, 3.0, pixels),
+            "SFR_surface_density": rng.uniform(-7.0, 1.5, pixels),
+            "depletion_time_molecular_gas": rng.uniform(6.5, 12.5, pixels),
+            "depletion_time_neutral_gas": rng.uniform(6.5, 12.5, pixels),
+            "H2_to_neutral_surface_density_ratio": rng.uniform(-9.0, 1.0, pixels),
+            "gas_metallicity": rng.choice([0.0, 0.1, 1.0, 8.0], pixels)
+            * rng.uniform(0.5, 2.0, pixels),
+            "radii_neutral_gas_surface_density": rng.uniform(-1.5, 3.5, radii),
+            "radii_H2_to_neutral_surface_density_ratio": rng.uniform(-9.0, 1.0, radii),
+        }
+        data["SFR_surface_density"][::17] = np.nan
+        galaxies.append(data)
+
+    return galaxies
+
+
+def fill(container, galaxies):
+    for data in galaxies:
+        for name, values in data.items():
+            # Appended in two parts, as make_KS_plots does for some fields
+            half = len(values) // 2
+            container.append(name, values[:half])
+            container.append(name, values[half:])
+        container.end_galaxy()
+    return container
+
+
+def test_spilled_data_matches_in_memory_data(tmp_path):
+    galaxies = galaxy_data()
+
+    in_memory = fill(CombinedData(), galaxies)
+    spilled = fill(CombinedData(spill_directory=str(tmp_path)), galaxies)
+    spill_path = spilled.spill_path
+    assert os.path.isdir(spill_path)
+
+    for name in CombinedData.fields:
+        expected = np.concatenate([data[name] for data in galaxies])
+        np.testing.assert_array_equal(getattr(in_memory, name), expected)
+        np.testing.assert_array_equal(getattr(spilled, name), expected)
+
+        # Accessing a field again gives the same data
+        np.testing.assert_array_equal(getattr(in_memory, name), expected)
+
+    # Containers of single galaxies, as returned by the workers, are appended in
+    # order in both modes
+    extended = CombinedData()
+    extended_spilled = CombinedData(spill_directory=str(tmp_path))
+    for data in galaxies:
+        galaxy = fill(CombinedData(), [data])
+        extended.extend(galaxy)
+        extended_spilled.extend(galaxy)
+    for name in CombinedData.fields:
+        np.testing.assert_array_equal(getattr(extended, name), getattr(in_memory, name))
+        np.testing.assert_array_equal(
+            getattr(extended_spilled, name), getattr(in_memory, name)
+        )
+
+    # Closing removes the spilled files
+    spilled.close()
+    extended_spilled.close()
+    assert not os.path.exists(spill_path)
+    assert os.listdir(tmp_path) == []
+
+
+def test_empty_containers(tmp_path):
+    for container in [CombinedData(), CombinedData(spill_directory=str(tmp_path))]:
+        container.end_galaxy()
+        for name in CombinedData.fields:
+            assert len(getattr(container, name)) == 0
+        container.close()
+
+
+def assert_histograms_equal(histograms, expected):
+    for panel in CombinedHistograms.panels:
+        # Counts are exact; sums of metallicities up to the order of addition
+        np.testing.assert_array_equal(
+            histograms.histograms[panel][-1], expected.histograms[panel][-1]
+        )
+        np.testing.assert_allclose(
+            histograms.histograms[panel], expected.histograms[panel], atol=1e-10
+        )
+
+    for panel, sketches in expected.sketches.items():
+        for selection, sketch in sketches.items():
+            merged = histograms.sketches[panel][selection]
+            for counts, expected_counts in zip(merged.counts, sketch.counts):
+                np.testing.assert_array_equal(counts, expected_counts)
+            np.testing.assert_array_equal(merged.minima, sketch.minima)
+            np.testing.assert_array_equal(merged.maxima, sketch.maxima)
+
+
+def test_merged_histograms_match_single_histogram():
+    galaxies = galaxy_data(number_of_galaxies=9, seed=1)
+
+    single = fill(CombinedHistograms(), galaxies)
+    assert single.histograms["gas"][-1].sum() > 0
+    for selection in CombinedHistograms.selections:
+        assert single.sketches["gas"][selection].number_of_values.sum() > 0
+
+    # Histograms of the galaxies of each rank, merged on rank 0
+    merged = CombinedHistograms()
+    for rank in range(4):
+        merged.extend(fill(CombinedHistograms(), galaxies[rank::4]))
+    assert_histograms_equal(merged, single)
+
+    # Data of single galaxies, as gathered from the ranks or returned by the
+    # workers, added galaxy by galaxy
+    gathered = CombinedHistograms()
+    for data in galaxies:
+        gathered.extend(fill(CombinedData(), [data]))
+    assert_histograms_equal(gathered, single)
@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pytest
+
+from object.galaxy_cutouts import GalaxyCutouts
+
+
+def write_cutouts(tmp_path):
+    sources = [str(tmp_path / "snapshot.hdf5"), str(tmp_path / "catalogue.properties")]
+    for path in sources:
+        with open(path, "w") as source:
+            source.write("data")
+
+    masses = {"gas": np.arange(10.0), "stars": np.arange(10.0, 20.0)}
+    path = str(tmp_path / "cutouts" / "cutouts.hdf5")
+    GalaxyCutouts.write(
+        path=path,
+        halo_ids=np.array([3, 7]),
+        rows={
+            "gas": [np.array([1, 2]), np.array([5])],
+            "stars": [np.array([], dtype=np.int64), np.array([0, 9])],
+        },
+        fields={"gas": ("masses",), "stars": ("masses",)},
+        read_field=lambda particle_type, name: masses[particle_type],
+        sources=sources,
+    )
+
+    return path, sources
+
+
+def test_cutouts_round_trip(tmp_path):
+    path, sources = write_cutouts(tmp_path)
+
+    cutouts = GalaxyCutouts(path)
+    cutouts.check_sources(sources)
+
+    gas_rows, star_rows = cutouts.halo_rows(7)
+    np.testing.assert_array_equal(cutouts.field("gas", "masses")[gas_rows], [5.0])
+    np.testing.assert_array_equal(
+        cutouts.field("stars", "masses")[star_rows], [10.0, 19.0]
+    )
+    assert len(cutouts.halo_rows(3)[1]) == 0
+
+    with pytest.raises(IOError):
+        cutouts.halo_rows(4)
+
+
+def test_cutouts_changed_sources(tmp_path):
+    path, sources = write_cutouts(tmp_path)
+
+    # Same size, later modification time
+    stat = os.stat(sources[0])
+    os.utime(sources[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    with pytest.raises(IOError):
+        GalaxyCutouts(path).check_sources(sources)
+
+
+def test_cutouts_other_sources(tmp_path):
+    path, sources = write_cutouts(tmp_path)
+
+    with pytest.raises(IOError):
+        GalaxyCutouts(path).check_sources(sources[::-1])
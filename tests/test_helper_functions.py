@@ -0,0 +1,182 @@
+import numpy as np
+import pytest
+from types import SimpleNamespace
+
+from object.particles import Particles
+from object.unitilies.helper_functions import (
+    AxialRatios,
+    calculate_kappa_co,
+    calculate_morphology_batched,
+)
+
+
+def six_pass_axial_ratios(rs, ms):
+    """
+    AxialRatios as it was written before the products were computed in one pass
+    """
+
+    radius = np.linalg.norm(rs[:, :3], axis=1)
+    rs = rs[radius > 0, :]
+    ms = ms[radius > 0]
+    rs2 = rs ** 2
+
+    I_xx = (
+        rs2[:, [1, 2]].sum(axis=-1) / abs((rs2[:, [1, 2]].sum(axis=-1)) ** 0.5)
+    ) * ms
+    I_xx = I_xx[np.isnan(I_xx) == False].sum()
+    I_yy = (
+        rs2[:, [0, 2]].sum(axis=-1) / abs((rs2[:, [0, 2]].sum(axis=-1)) ** 0.5)
+    ) * ms
+    I_yy = I_yy[np.isnan(I_yy) == False].sum()
+    I_zz = (
+        rs2[:, [0, 1]].sum(axis=-1) / abs((rs2[:, [0, 1]].sum(axis=-1)) ** 0.5)
+    ) * ms
+    I_zz = I_zz[np.isnan(I_zz) == False].sum()
+    I_xy = -((rs[:, 0] * rs[:, 1] / abs(rs[:, 0] * rs[:, 1]) ** 0.5) * ms)
+    I_xy = I_xy[np.isnan(I_xy) == False].sum()
+    I_xz = -((rs[:, 0] * rs[:, 2] / abs(rs[:, 0] * rs[:, 2]) ** 0.5) * ms)
+    I_xz = I_xz[np.isnan(I_xz) == False].sum()
+    I_yz = -((rs[:, 1] * rs[:, 2] / abs(rs[:, 1] * rs[:, 2]) ** 0.5) * ms)
+    I_yz = I_yz[np.isnan(I_yz) == False].sum()
+    I = np.array([[I_xx, I_xy, I_xz], [I_xy, I_yy, I_yz], [I_xz, I_yz, I_zz]])
+
+    W, V = np.linalg.eig(I)
+    W1, W2, W3 = np.sort(W)[::-1]
+
+    a = np.sqrt(np.abs(W1 + W2 - W3))
+    b = np.sqrt(np.abs(W1 + W3 - W2))
+    c = np.sqrt(np.abs(W2 + W3 - W1))
+
+    return c / a, c / b, b / a
+
+
+def ellipsoid(number_of_particles, axes, seed=0):
+    """
+    Particles distributed uniformly in a randomly oriented ellipsoid with the
+    given semi-axes
+    """
+
+    rng = np.random.default_rng(seed)
+    directions = rng.normal(size=(number_of_particles, 3))
+    directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
+    radii = rng.uniform(0.0, 1.0, number_of_particles) ** (1.0 / 3.0)
+    positions = directions * radii[:, np.newaxis] * np.array(axes)
+
+    rotation, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+    masses = rng.uniform(0.5, 1.5, number_of_particles)
+
+    return positions @ rotation.T, masses
+
+
+@pytest.mark.filterwarnings("ignore:invalid value:RuntimeWarning")
+def test_axial_ratios_match_six_pass_formula():
+    positions, masses = ellipsoid(500, [8.0, 5.0, 2.0])
+
+    # Particles at the centre and on the planes of the axes, whose products are
+    # zero and gave NaN in the six-pass formula
+    positions[:3] = 0.0
+    positions[3:10, 0] = 0.0
+    positions[10:15, 1:] = 0.0
+
+    np.testing.assert_allclose(
+        AxialRatios(positions, masses),
+        six_pass_axial_ratios(positions, masses),
+        rtol=1e-12,
+    )
+
+
+def test_iterative_axial_ratios_recover_ellipsoid():
+    positions, masses = ellipsoid(20000, [10.0, 6.0, 3.0])
+
+    c_a, c_b, b_a = AxialRatios(positions, masses, iterative=True)
+
+    assert c_a == pytest.approx(0.3, rel=0.02)
+    assert c_b == pytest.approx(0.5, rel=0.02)
+    assert b_a == pytest.approx(0.6, rel=0.02)
+
+
+def haloes_of_mixed_size(box_size, seed=0):
+    """
+    Rotating discs of different sizes, one across the box boundary, one without
+    particles and one with all its particles beyond the 30 kpc aperture
+    """
+
+    rng = np.random.default_rng(seed)
+    counts = np.array([400, 0, 35, 120, 60, 3])
+    centres = rng.uniform(100.0, box_size - 100.0, (len(counts), 3))
+    centres[3] = [box_size - 2.0, 1.0, 50.0]
+    centre_velocities = rng.normal(0.0, 100.0, (len(counts), 3))
+
+    coordinates, velocities = [], []
+    for halo, count in enumerate(counts):
+        radii = rng.exponential(4.0, count)
+        if halo == 4:
+            radii += 40.0
+        angles = rng.uniform(0.0, 2.0 * np.pi, count)
+        positions = np.stack(
+            [radii * np.cos(angles), radii * np.sin(angles), rng.normal(0, 1, count)],
+            axis=1,
+        )
+        disc_velocities = rng.normal(0.0, 20.0, (count, 3))
+        disc_velocities[:, 0] -= 150.0 * np.sin(angles)
+        disc_velocities[:, 1] += 150.0 * np.cos(angles)
+
+        coordinates.append((positions + centres[halo]) % box_size)
+        velocities.append(disc_velocities + centre_velocities[halo])
+
+    coordinates = np.concatenate(coordinates)
+    velocities = np.concatenate(velocities)
+    masses = rng.uniform(0.5, 1.5, len(coordinates))
+
+    return coordinates, velocities, masses, counts, centres, centre_velocities
+
+
+@pytest.mark.filterwarnings("ignore:invalid value:RuntimeWarning")
+@pytest.mark.filterwarnings("ignore:divide by zero:RuntimeWarning")
+@pytest.mark.filterwarnings("ignore:Mean of empty slice:RuntimeWarning")
+def test_calculate_morphology_batched_matches_per_halo():
+    box_size = 1000.0
+    (
+        coordinates,
+        velocities,
+        masses,
+        counts,
+        centres,
+        centre_velocities,
+    ) = haloes_of_mixed_size(box_size)
+
+    batched = calculate_morphology_batched(
+        coordinates, velocities, masses, counts, centres, centre_velocities, box_size
+    )
+
+    halo_data = SimpleNamespace(
+        xminpot=centres[:, 0],
+        yminpot=centres[:, 1],
+        zminpot=centres[:, 2],
+        vxminpot=centre_velocities[:, 0],
+        vyminpot=centre_velocities[:, 1],
+        vzminpot=centre_velocities[:, 2],
+    )
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    for halo, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+        particles = Particles(
+            coordinates=coordinates[start:end],
+            masses=masses[start:end],
+            velocities=velocities[start:end],
+            smoothing_lengths=np.ones(end - start),
+        )
+        kappa, specific_momentum, momentum, particles = calculate_kappa_co(
+            halo_data, particles, box_size, halo
+        )
+        axis_ratios = AxialRatios(particles.coordinates, particles.masses)
+
+        np.testing.assert_allclose(batched[0][halo], kappa, rtol=1e-10)
+        np.testing.assert_allclose(batched[1][halo], specific_momentum, rtol=1e-10)
+        np.testing.assert_allclose(batched[2][halo], momentum, rtol=1e-10, atol=1e-12)
+        np.testing.assert_allclose(batched[3][halo], axis_ratios, rtol=1e-10)
+
+    # The haloes without particles in the aperture have no morphology
+    for halo in [1, 4]:
+        assert np.isnan(batched[0][halo]) and np.all(np.isnan(batched[2][halo]))
+    assert np.all(np.isfinite(batched[0][[0, 2, 3]]))
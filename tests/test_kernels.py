@@ -0,0 +1,266 @@
+import numpy as np
+import pytest
+
+from object.unitilies import kernels
+from object.unitilies.kernels import (
+    BinnedStatistics,
+    bin_indices,
+    binned_mean,
+    binned_median,
+    binned_percentile,
+    deposit_on_cells,
+    group_into_bins,
+    kappa_sums,
+    sort_into_bins,
+)
+
+backends = [
+    "numpy",
+    pytest.param(
+        "numba",
+        marks=pytest.mark.skipif(
+            not kernels.numba_available, reason="numba is not installed"
+        ),
+    ),
+]
+
+edges = np.linspace(0.0, 10.0, 11)
+
+
+def synthetic_discs(number_of_haloes=5, particles_per_halo=400, seed=0):
+    """
+    Rotating exponential discs with velocity dispersion. Some particles lie on
+    the spin axis, and the last halo has all its particles on the axis
+    """
+
+    rng = np.random.default_rng(seed)
+    labels = np.repeat(np.arange(number_of_haloes), particles_per_halo)
+    rng.shuffle(labels)
+
+    radii = rng.exponential(3.0, len(labels))
+    angles = rng.uniform(0.0, 2.0 * np.pi, len(labels))
+    heights = rng.normal(0.0, 0.3, len(labels))
+    radii[::50] = 0.0
+    radii[labels == number_of_haloes - 1] = 0.0
+
+    circular_velocity = 200.0 * (1.0 - np.exp(-radii / 2.0))
+    velocities = rng.normal(0.0, 30.0, (len(labels), 3))
+    velocities[:, 0] -= circular_velocity * np.sin(angles)
+    velocities[:, 1] += circular_velocity * np.cos(angles)
+
+    positions = np.stack(
+        [radii * np.cos(angles), radii * np.sin(angles), heights], axis=1
+    )
+    masses = rng.uniform(0.5, 1.5, len(labels))
+
+    return labels, positions, velocities, masses
+
+
+def binned_data(seed=0):
+    """
+    Values in bins of x, with x on the bin edges, outside the bins and NaN, and
+    NaN values in one bin
+    """
+
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(-1.0, 11.0, 2000)
+    x[:33] = np.tile(edges, 3)
+    x[33:38] = np.nan
+    x[np.abs(x - 7.5) < 0.5] = 2.5
+
+    values = rng.normal(x, 1.0)
+    values[np.abs(x - 3.5) < 0.05] = np.nan
+    weights = rng.uniform(0.1, 1.0, len(x))
+
+    return x, values, weights
+
+
+def reference_bins(x, include_left_edges):
+    if include_left_edges:
+        return [(x >= low) & (x < high) for low, high in zip(edges[:-1], edges[1:])]
+    return [(x > low) & (x < high) for low, high in zip(edges[:-1], edges[1:])]
+
+
+@pytest.mark.parametrize("backend", backends)
+def test_deposit_on_cells(backend):
+    labels, positions, velocities, masses = synthetic_discs()
+
+    cells = np.clip(((positions[:, 0] + 10.0) * 2.0).astype(np.int64), 0, 39)
+    weights = np.array([masses, masses * velocities[:, 2]])
+
+    images = deposit_on_cells(cells, weights, 40, backend)
+
+    np.testing.assert_array_equal(images[0], np.bincount(cells, masses, 40))
+    np.testing.assert_array_equal(images[1], np.bincount(cells, weights[1], 40))
+    np.testing.assert_array_equal(images[2], np.bincount(cells, minlength=40))
+    np.testing.assert_array_equal(images, deposit_on_cells(cells, weights, 40, "numpy"))
+
+
+@pytest.mark.parametrize("backend", backends)
+def test_kappa_sums(backend):
+    labels, positions, velocities, masses = synthetic_discs()
+    number_of_haloes = labels.max() + 1
+
+    cyldistances = np.hypot(positions[:, 0], positions[:, 1])
+    smomentumz = np.cross(positions, velocities)[:, 2]
+    speeds2 = np.sum(velocities ** 2, axis=1)
+    cylmin = np.full(number_of_haloes, np.inf)
+    np.minimum.at(cylmin, labels[cyldistances > 0], cyldistances[cyldistances > 0])
+
+    Mvrot2, Mv2 = kappa_sums(
+        labels, masses, smomentumz, cyldistances, cylmin, speeds2, backend
+    )
+
+    for halo in range(number_of_haloes):
+        in_halo = labels == halo
+        distances = cyldistances[in_halo]
+        if np.isfinite(cylmin[halo]):
+            vrots = smomentumz[in_halo] / np.where(
+                distances == 0, cylmin[halo], distances
+            )
+        else:
+            vrots = smomentumz[in_halo]
+        rotating = vrots > 0
+
+        assert np.isclose(
+            Mvrot2[halo], np.sum(masses[in_halo][rotating] * vrots[rotating] ** 2)
+        )
+        assert np.isclose(Mv2[halo], np.sum(masses[in_halo] * speeds2[in_halo]))
+
+    numpy_sums = kappa_sums(
+        labels, masses, smomentumz, cyldistances, cylmin, speeds2, "numpy"
+    )
+    np.testing.assert_array_equal(Mvrot2, numpy_sums[0])
+    np.testing.assert_array_equal(Mv2, numpy_sums[1])
+
+
+@pytest.mark.parametrize("include_left_edges", [False, True])
+def test_bin_indices(include_left_edges):
+    x, _, _ = binned_data()
+
+    bins = bin_indices(x, edges, include_left_edges)
+
+    expected = np.full(len(x), -1)
+    for i, in_bin in enumerate(reference_bins(x, include_left_edges)):
+        expected[in_bin] = i
+    np.testing.assert_array_equal(bins, expected)
+
+    if include_left_edges:
+        # As np.digitize, apart from the values beyond the last edge and NaN
+        digitized = np.digitize(x, edges) - 1
+        digitized[digitized >= len(edges) - 1] = -1
+        np.testing.assert_array_equal(bins, digitized)
+
+
+@pytest.mark.parametrize("backend", backends)
+@pytest.mark.parametrize("include_left_edges", [False, True])
+def test_group_and_sort_into_bins(backend, include_left_edges):
+    x, values, weights = binned_data()
+
+    offsets, grouped_values = group_into_bins(
+        x, [values, weights], edges, include_left_edges, backend
+    )
+    sorted_offsets, sorted_values = sort_into_bins(
+        x, [values, weights], edges, include_left_edges, backend
+    )
+
+    np.testing.assert_array_equal(offsets, sorted_offsets)
+    for i, in_bin in enumerate(reference_bins(x, include_left_edges)):
+        start, end = offsets[i], offsets[i + 1]
+
+        # Order within the bins is kept, so the rows stay paired
+        np.testing.assert_array_equal(grouped_values[0, start:end], values[in_bin])
+        np.testing.assert_array_equal(grouped_values[1, start:end], weights[in_bin])
+
+        np.testing.assert_array_equal(
+            sorted_values[0, start:end], np.sort(values[in_bin])
+        )
+
+    numpy_offsets, numpy_values = group_into_bins(
+        x, [values, weights], edges, include_left_edges, "numpy"
+    )
+    np.testing.assert_array_equal(offsets, numpy_offsets)
+    np.testing.assert_array_equal(grouped_values, numpy_values)
+
+
+@pytest.mark.parametrize("backend", backends)
+def test_binned_statistics_functions(backend):
+    x, values, weights = binned_data()
+
+    offsets, grouped_values = group_into_bins(
+        x, [values, weights], edges, backend=backend
+    )
+    _, sorted_values = sort_into_bins(x, [values], edges, backend=backend)
+
+    medians = binned_median(sorted_values[0], offsets)
+    percentiles = binned_percentile(sorted_values[0], offsets, 16)
+    means = binned_mean(grouped_values[0], offsets, grouped_values[1])
+
+    for i, in_bin in enumerate(reference_bins(x, False)):
+        if not np.any(in_bin):
+            assert np.isnan(medians[i]) and np.isnan(percentiles[i])
+            assert np.isnan(means[i])
+            continue
+
+        np.testing.assert_array_equal(medians[i], np.median(values[in_bin]))
+        np.testing.assert_array_equal(percentiles[i], np.percentile(values[in_bin], 16))
+        np.testing.assert_allclose(
+            means[i], np.average(values[in_bin], weights=weights[in_bin])
+        )
+
+    # The bin of x = 3.5 has NaN values, and the bin of x = 7.5 is empty
+    assert np.isnan(medians[3]) and np.isnan(percentiles[3])
+    assert np.isnan(medians[7]) and np.isnan(means[7])
+
+
+def test_binned_mean_without_values():
+    offsets = np.zeros(4, dtype=np.int64)
+
+    assert np.all(np.isnan(binned_mean(np.array([]), offsets)))
+
+
+@pytest.mark.parametrize("backend", backends)
+@pytest.mark.parametrize("include_left_edges", [False, True])
+def test_binned_statistics(backend, include_left_edges):
+    x, values, weights = binned_data()
+    other_values = values ** 2
+
+    statistics = BinnedStatistics(
+        x, [values, other_values], edges, weights, include_left_edges, backend
+    )
+    numpy_statistics = BinnedStatistics(
+        x, [values, other_values], edges, weights, include_left_edges, "numpy"
+    )
+
+    for i, in_bin in enumerate(reference_bins(x, include_left_edges)):
+        assert statistics.counts[i] == np.sum(in_bin)
+
+    for row, value in enumerate([values, other_values]):
+        unweighted = BinnedStatistics(
+            x, [value], edges, include_left_edges=include_left_edges, backend=backend
+        )
+        for i, in_bin in enumerate(reference_bins(x, include_left_edges)):
+            if not np.any(in_bin):
+                continue
+            np.testing.assert_array_equal(
+                statistics.median(row)[i], np.median(value[in_bin])
+            )
+            np.testing.assert_array_equal(
+                statistics.percentile(row, 84)[i], np.percentile(value[in_bin], 84)
+            )
+            np.testing.assert_allclose(
+                statistics.mean(row)[i],
+                np.average(value[in_bin], weights=weights[in_bin]),
+            )
+            np.testing.assert_allclose(unweighted.mean(0)[i], np.mean(value[in_bin]))
+
+        np.testing.assert_array_equal(
+            statistics.median(row), numpy_statistics.median(row)
+        )
+        np.testing.assert_array_equal(
+            statistics.percentile(row, 16), numpy_statistics.percentile(row, 16)
+        )
+        np.testing.assert_array_equal(statistics.mean(row), numpy_statistics.mean(row))
+        np.testing.assert_array_equal(
+            statistics.sorted(row), numpy_statistics.sorted(row)
+        )
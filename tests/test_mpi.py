@@ -0,0 +1,124 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import h5py
+import numpy as np
+import pytest
+
+from object.unitilies.helper_functions import partition_by_cost
+
+tests_directory = os.path.dirname(os.path.abspath(__file__))
+
+
+def loads_of_parts(costs, parts):
+    return np.array([np.sum(costs[part]) for part in parts])
+
+
+@pytest.mark.parametrize("number_of_parts", [1, 3, 4, 16])
+def test_partition_by_cost_balance(number_of_parts):
+    rng = np.random.default_rng(0)
+    costs = rng.lognormal(8.0, 1.5, 500).astype(np.int64)
+
+    parts = partition_by_cost(costs, number_of_parts)
+
+    # Every item is assigned to exactly one part
+    assert len(parts) == number_of_parts
+    np.testing.assert_array_equal(np.sort(np.concatenate(parts)), np.arange(500))
+    for part in parts:
+        np.testing.assert_array_equal(part, np.sort(part))
+
+    # Each part got its last item while it had the lowest load, so the loads
+    # differ by at most the largest cost
+    loads = loads_of_parts(costs, parts)
+    assert loads.max() - loads.min() <= costs.max()
+    assert loads.max() <= costs.sum() / number_of_parts + costs.max()
+
+
+def test_partition_by_cost_example():
+    costs = np.array([5, 1, 4, 2, 3])
+
+    parts = partition_by_cost(costs, 2)
+
+    np.testing.assert_array_equal(parts[0], [0, 1, 3])
+    np.testing.assert_array_equal(parts[1], [2, 4])
+
+
+def test_partition_by_cost_more_parts_than_items():
+    parts = partition_by_cost(np.array([3, 7]), 4)
+
+    np.testing.assert_array_equal(parts[0], [1])
+    np.testing.assert_array_equal(parts[1], [0])
+    assert len(parts[2]) == 0 and len(parts[3]) == 0
+
+
+def test_partition_by_cost_is_deterministic():
+    # Many equal costs, so that the order of the ties decides the assignment
+    rng = np.random.default_rng(1)
+    costs = rng.integers(1, 5, 300)
+
+    parts = partition_by_cost(costs, 7)
+
+    for _ in range(3):
+        for part, other_part in zip(parts, partition_by_cost(costs.copy(), 7)):
+            np.testing.assert_array_equal(part, other_part)
+
+    # Lists of costs are assigned as arrays
+    for part, other_part in zip(parts, partition_by_cost(list(costs), 7)):
+        np.testing.assert_array_equal(part, other_part)
+
+
+def datasets_in_file(path):
+    datasets = {}
+    with h5py.File(path, "r") as file:
+        file.visititems(
+            lambda name, item: datasets.update({name: item[()]})
+            if isinstance(item, h5py.Dataset)
+            else None
+        )
+    return datasets
+
+
+def test_mpi_matches_serial(tmp_path):
+    pytest.importorskip("mpi4py")
+    pytest.importorskip("sphviewer")
+    pytest.importorskip("tqdm")
+    mpirun = shutil.which("mpirun")
+    if mpirun is None:
+        pytest.skip("mpirun is not available")
+
+    from synthetic_run import write_synthetic_run
+
+    run_directory = tmp_path / "run"
+    run_directory.mkdir()
+    write_synthetic_run(str(run_directory))
+
+    driver = os.path.join(tests_directory, "run_synthetic_analysis.py")
+    stores = {}
+    for mode in ["serial", "mpi"]:
+        output_directory = tmp_path / mode
+        output_directory.mkdir()
+
+        command = [sys.executable, driver, str(run_directory), str(output_directory)]
+        if mode == "mpi":
+            launcher = [mpirun, "-n", "4"]
+            version = subprocess.run(
+                [mpirun, "--version"], capture_output=True, text=True
+            )
+            if "Open MPI" in version.stdout:
+                launcher += ["--oversubscribe"]
+                if os.geteuid() == 0:
+                    launcher += ["--allow-run-as-root"]
+            command = launcher + command + ["--mpi"]
+
+        subprocess.run(command, check=True, timeout=600)
+        stores[mode] = datasets_in_file(
+            output_directory / "morpholopy_results_Synthetic.hdf5"
+        )
+
+    serial, mpi = stores["serial"], stores["mpi"]
+    assert sorted(serial) == sorted(mpi)
+    assert "run/galaxy_data" in serial and "galaxies/7/KS_relation_best_grid" in serial
+    for name in serial:
+        np.testing.assert_array_equal(serial[name], mpi[name], err_msg=name)
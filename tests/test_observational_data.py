@@ -0,0 +1,35 @@
+import numpy as np
+
+from plotter.loadObservationalData import bin_data_general
+
+
+def test_bin_data_general_random_data():
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0.0, 1.0, 1000)
+    y = rng.normal(x, 0.1)
+
+    # The last bin has no data
+    bins = np.linspace(0.0, 1.5, 16)
+    x_bin, median, error_up, error_down = bin_data_general(x, y, bins, -np.inf)
+
+    np.testing.assert_allclose(x_bin, (bins[1:] + bins[:-1]) / 2.0)
+    for i in range(10):
+        in_bin = y[(x > bins[i]) & (x < bins[i + 1])]
+        assert np.isclose(median[i], np.median(in_bin))
+        assert np.isclose(error_up[i], median[i] - np.percentile(in_bin, 16))
+        assert np.isclose(error_down[i], np.percentile(in_bin, 84) - median[i])
+
+    assert np.all(np.isnan(median[10:]))
+
+
+def test_bin_data_general_x_limit():
+    rng = np.random.default_rng(1)
+    x = rng.uniform(0.0, 1.0, 100)
+    y = rng.uniform(0.0, 1.0, 100)
+
+    x_bin, median, error_up, error_down = bin_data_general(
+        x, y, np.linspace(0.0, 1.0, 11), 0.5
+    )
+
+    assert np.all(x_bin > 0.5)
+    assert len(x_bin) == len(median) == len(error_up) == len(error_down) == 5
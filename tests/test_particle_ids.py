@@ -0,0 +1,181 @@
+import glob
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+from object.particle_ids import ParticleIds
+
+
+def write_ids(directory, gas_ids, star_ids, offsets, particle_ids, files=(0, 1, 2)):
+    """
+    Writes the groups, particles and snapshot files, or only the selected ones.
+    Returns the paths to the three files
+    """
+
+    paths = [
+        os.path.join(directory, name)
+        for name in ["halos.catalog_groups", "halos.catalog_particles", "snap.hdf5"]
+    ]
+
+    if 0 in files:
+        with h5py.File(paths[0], "w") as file:
+            file["Offset"] = offsets
+    if 1 in files:
+        with h5py.File(paths[1], "w") as file:
+            file["Particle_IDs"] = particle_ids
+    if 2 in files:
+        with h5py.File(paths[2], "w") as file:
+            file["PartType0/ParticleIDs"] = gas_ids
+            file["PartType4/ParticleIDs"] = star_ids
+
+    return paths
+
+
+def synthetic_ids(seed=0):
+    """
+    Unique gas and stellar ids in random order, and haloes holding some of them,
+    ids of other particle types, and no particles at all
+    """
+
+    rng = np.random.default_rng(seed)
+    ids = rng.permutation(np.arange(1, 3001, dtype=np.int64))
+    gas_ids, star_ids, other_ids = ids[:1500], ids[1500:2500], ids[2500:]
+
+    # Each particle belongs to at most one halo. The particles in the first rows
+    # of the snapshot belong to halo 3
+    shuffled = [rng.permutation(ids[1:]) for ids in [gas_ids, star_ids, other_ids]]
+    halo_particle_ids = []
+    for size in [200, 0, 57, 1, 400, 90]:
+        halo_ids = [shuffled[0][:size], shuffled[1][: size // 2]]
+        halo_ids.append(shuffled[2][: size // 3])
+        if size == 1:
+            halo_ids.append([gas_ids[0], star_ids[0]])
+        shuffled = [
+            shuffled[0][size:],
+            shuffled[1][size // 2 :],
+            shuffled[2][size // 3 :],
+        ]
+        halo_particle_ids.append(rng.permutation(np.concatenate(halo_ids)))
+
+    offsets = np.cumsum([0] + [len(ids) for ids in halo_particle_ids[:-1]])
+    particle_ids = np.concatenate(halo_particle_ids)
+
+    return gas_ids, star_ids, offsets, particle_ids
+
+
+def haloes(offsets, particle_ids):
+    return np.split(particle_ids, offsets[1:])
+
+
+def expected_rows(snapshot_ids, ids):
+    return np.flatnonzero(np.isin(snapshot_ids, ids))
+
+
+def test_find_rows():
+    rng = np.random.default_rng(1)
+    snapshot_ids = rng.permutation(np.arange(10, 1010, dtype=np.int64))
+    order = np.argsort(snapshot_ids, kind="stable")
+    sorted_ids = snapshot_ids[order]
+
+    # Ids in the snapshot, smaller and larger than all snapshot ids, and the id
+    # in row 0 of the snapshot
+    ids = np.concatenate(
+        [rng.choice(snapshot_ids, 100, replace=False), [1, 5, 2000, snapshot_ids[0]]]
+    )
+    rows = ParticleIds.find_rows(sorted_ids, order, ids)
+
+    np.testing.assert_array_equal(rows, expected_rows(snapshot_ids, ids))
+    assert rows[0] == 0
+
+    # The smallest and largest snapshot ids only
+    ids = np.array([sorted_ids[0], sorted_ids[-1]])
+    np.testing.assert_array_equal(
+        ParticleIds.find_rows(sorted_ids, order, ids), np.sort(order[[0, -1]])
+    )
+
+    assert len(ParticleIds.find_rows(sorted_ids, order, np.array([2000]))) == 0
+    assert len(ParticleIds.find_rows(sorted_ids, order, np.array([], int))) == 0
+    assert len(ParticleIds.find_rows(sorted_ids[:0], order[:0], ids)) == 0
+
+
+def test_bulk_matching_matches_per_halo(tmp_path):
+    gas_ids, star_ids, offsets, particle_ids = synthetic_ids()
+    paths = write_ids(tmp_path, gas_ids, star_ids, offsets, particle_ids)
+
+    per_halo = ParticleIds(*paths)
+    bulk = ParticleIds(*paths, bulk_id_matching=True, cache_halo_index=False)
+
+    for halo_id, ids in enumerate(haloes(offsets, particle_ids)):
+        gas_rows, star_rows = per_halo.make_masks_gas_and_stars(halo_id)
+        bulk_gas_rows, bulk_star_rows = bulk.make_masks_gas_and_stars(halo_id)
+
+        np.testing.assert_array_equal(gas_rows, expected_rows(gas_ids, ids))
+        np.testing.assert_array_equal(star_rows, expected_rows(star_ids, ids))
+        np.testing.assert_array_equal(bulk_gas_rows, gas_rows)
+        np.testing.assert_array_equal(bulk_star_rows, star_rows)
+
+    assert len(bulk.make_masks_gas_and_stars(1)[0]) == 0
+    assert 0 in bulk.make_masks_gas_and_stars(3)[0]
+    assert 0 in bulk.make_masks_gas_and_stars(3)[1]
+    assert not glob.glob(f"{tmp_path}/*.npy")
+
+
+def assert_index_matches(particle_ids, gas_ids, star_ids, halo_particle_ids):
+    for halo_id, ids in enumerate(halo_particle_ids):
+        gas_rows, star_rows = particle_ids.make_masks_gas_and_stars(halo_id)
+        np.testing.assert_array_equal(gas_rows, expected_rows(gas_ids, ids))
+        np.testing.assert_array_equal(star_rows, expected_rows(star_ids, ids))
+
+
+@pytest.mark.parametrize("changed_file", [0, 1, 2])
+@pytest.mark.parametrize("same_size", [False, True])
+def test_halo_index_cache(tmp_path, changed_file, same_size):
+    gas_ids, star_ids, offsets, particle_ids = synthetic_ids()
+    paths = write_ids(tmp_path, gas_ids, star_ids, offsets, particle_ids)
+
+    first = ParticleIds(*paths, bulk_id_matching=True)
+    cache_files = glob.glob(f"{tmp_path}/*.halo_index_*.npy")
+    assert len(cache_files) == len(ParticleIds.halo_index_arrays)
+    assert not isinstance(first.gas_rows_in_haloes, np.memmap)
+
+    # The unchanged files reuse the saved index
+    cached = ParticleIds(*paths, bulk_id_matching=True)
+    assert isinstance(cached.gas_rows_in_haloes, np.memmap)
+    assert_index_matches(cached, gas_ids, star_ids, haloes(offsets, particle_ids))
+
+    # Rewrite one of the files with other data. With the same size, only the
+    # modification time tells the old and new files apart
+    rng = np.random.default_rng(2)
+    if changed_file == 0:
+        offsets = np.sort(rng.choice(np.arange(1, len(particle_ids)), 5, False))
+        offsets = np.concatenate([[0], offsets])
+        if not same_size:
+            offsets = np.append(offsets, len(particle_ids) - 3)
+    elif changed_file == 1:
+        particle_ids = rng.permutation(np.concatenate([gas_ids, star_ids]))[
+            : len(particle_ids)
+        ]
+        if not same_size:
+            particle_ids = particle_ids[:-20]
+    else:
+        gas_ids = rng.permutation(gas_ids)
+        if not same_size:
+            star_ids = star_ids[:-100]
+
+    old_stat = os.stat(paths[changed_file])
+    write_ids(tmp_path, gas_ids, star_ids, offsets, particle_ids, [changed_file])
+    os.utime(
+        paths[changed_file], ns=(old_stat.st_atime_ns, old_stat.st_mtime_ns + 10 ** 9)
+    )
+    assert (os.path.getsize(paths[changed_file]) == old_stat.st_size) == same_size
+
+    rebuilt = ParticleIds(*paths, bulk_id_matching=True)
+    assert not isinstance(rebuilt.gas_rows_in_haloes, np.memmap)
+    assert_index_matches(rebuilt, gas_ids, star_ids, haloes(offsets, particle_ids))
+
+    # The cache of the old files is replaced by the cache of the new files
+    new_cache_files = glob.glob(f"{tmp_path}/*.halo_index_*.npy")
+    assert len(new_cache_files) == len(ParticleIds.halo_index_arrays)
+    assert not set(new_cache_files) & set(cache_files)
@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from object.unitilies.quantile_sketch import BinnedQuantileSketch
+
+edges = np.linspace(0.0, 5.0, 6)
+value_ranges = [(-2.0, 4.0), (0.0, 1.0)]
+percentiles = [0, 5, 16, 50, 84, 95, 100]
+
+
+def binned_values(number_of_values=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(-0.5, 4.0, number_of_values)
+    values = [rng.normal(0.2 * x, 0.7), rng.uniform(0.0, 1.0, number_of_values)]
+    values[0][::101] = np.nan
+    return x, values
+
+
+def exact_percentiles(x, value, percentile):
+    bins = [(x > low) & (x < high) for low, high in zip(edges[:-1], edges[1:])]
+    return np.array(
+        [
+            np.percentile(value[in_bin & ~np.isnan(value)], percentile)
+            if np.any(in_bin & ~np.isnan(value))
+            else np.nan
+            for in_bin in bins
+        ]
+    )
+
+
+def test_merged_sketch_within_resolution():
+    x, values = binned_values()
+    half = len(x) // 2
+
+    sketch = BinnedQuantileSketch(edges, value_ranges, resolution=0.01)
+    other_sketch = BinnedQuantileSketch(edges, value_ranges, resolution=0.01)
+    sketch.update(x[:half], [value[:half] for value in values])
+    other_sketch.update(x[half:], [value[half:] for value in values])
+    sketch.merge(other_sketch)
+
+    # Merging gives the same counts as one sketch of all values
+    single_sketch = BinnedQuantileSketch(edges, value_ranges, resolution=0.01)
+    single_sketch.update(x, values)
+    for counts, single_counts in zip(sketch.counts, single_sketch.counts):
+        np.testing.assert_array_equal(counts, single_counts)
+    np.testing.assert_array_equal(sketch.minima, single_sketch.minima)
+    np.testing.assert_array_equal(sketch.maxima, single_sketch.maxima)
+
+    for row, value in enumerate(values):
+        for percentile in percentiles:
+            exact = exact_percentiles(x, value, percentile)
+            estimate = sketch.percentile(row, percentile)
+
+            # The last bin of x is empty
+            assert np.isnan(estimate[-1]) and np.isnan(exact[-1])
+            np.testing.assert_array_less(
+                np.abs(estimate[:-1] - exact[:-1]), sketch.resolution
+            )
+
+        np.testing.assert_array_equal(sketch.median(row), sketch.percentile(row, 50))
+
+
+def test_values_beyond_range():
+    rng = np.random.default_rng(1)
+    x = rng.uniform(0.0, 3.0, 3000)
+    value = rng.normal(1.0, 0.5, len(x))
+
+    # A few values beyond the range in the first bin, and all values beyond the
+    # range in the third bin, on both sides
+    value[(x < 1.0) & (rng.uniform(size=len(x)) < 0.05)] = 7.0
+    in_third_bin = (x > 2.0) & (x < 3.0)
+    value[in_third_bin] = np.where(
+        rng.uniform(size=len(x)) < 0.3, rng.uniform(-9.0, -3.0), rng.uniform(5, 9)
+    )[in_third_bin]
+
+    sketch = BinnedQuantileSketch(edges, [(-2.0, 4.0)], resolution=0.01)
+    sketch.update(x, [value])
+
+    # Counted in the underflow and overflow bins
+    assert sketch.number_of_values[:3].sum() == len(x)
+
+    # The extreme percentiles are the exact extreme values
+    for percentile in [0, 100]:
+        np.testing.assert_array_equal(
+            sketch.percentile(0, percentile)[:3],
+            exact_percentiles(x, value, percentile)[:3],
+        )
+
+    # Percentiles within the range are still within the resolution
+    for percentile in [16, 50, 84]:
+        exact = exact_percentiles(x, value, percentile)
+        assert abs(sketch.percentile(0, percentile)[0] - exact[0]) < 0.01
+        assert abs(sketch.percentile(0, percentile)[1] - exact[1]) < 0.01
+
+    # Beyond the range, the percentiles lie between the range and the extremes
+    third_bin = value[in_third_bin]
+    for percentile in [5, 16, 50, 84, 95]:
+        estimate = sketch.percentile(0, percentile)[2]
+        if np.percentile(third_bin, percentile) < -2.0:
+            assert third_bin.min() <= estimate <= -2.0
+        else:
+            assert 4.0 <= estimate <= third_bin.max()
+
+
+@pytest.mark.parametrize("resolution", [0.1, 0.01])
+def test_resolution_bounds_error(resolution):
+    x, values = binned_values(5000, seed=2)
+
+    sketch = BinnedQuantileSketch(edges, value_ranges, resolution=resolution)
+    for start in range(0, len(x), 500):
+        sketch.update(
+            x[start : start + 500], [value[start : start + 500] for value in values]
+        )
+
+    for percentile in percentiles:
+        exact = exact_percentiles(x, values[0], percentile)[:-1]
+        estimate = sketch.percentile(0, percentile)[:-1]
+        np.testing.assert_array_less(np.abs(estimate - exact), resolution)
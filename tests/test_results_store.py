@@ -0,0 +1,38 @@
+import numpy as np
+
+from object.results_store import ResultsStore
+
+
+def test_read_keeps_one_open_file(tmp_path):
+    store = ResultsStore(str(tmp_path), "run")
+    store.create()
+    for index in range(20):
+        store.add("table", np.full((index, 2), index), index)
+    store.add("galaxy_data", np.arange(12.0).reshape(4, 3))
+    store.flush()
+
+    try:
+        for index in range(20):
+            data = ResultsStore.read(str(tmp_path), "run", "table", index)
+            np.testing.assert_array_equal(data, np.full((index, 2), index))
+        results_file = ResultsStore.open_files[store.path]
+        assert len(ResultsStore.open_files) == 1
+
+        data = ResultsStore.read(str(tmp_path), "run", "galaxy_data")
+        np.testing.assert_array_equal(data, np.arange(12.0).reshape(4, 3))
+        assert ResultsStore.open_files[store.path] is results_file
+
+        # Writing closes the open file, so the next read sees the new tables
+        store.add("galaxy_data", np.ones(3))
+        store.flush()
+        assert not results_file.id.valid
+        np.testing.assert_array_equal(
+            ResultsStore.read(str(tmp_path), "run", "galaxy_data"), np.ones(3)
+        )
+
+        store.create()
+        assert store.path not in ResultsStore.open_files
+    finally:
+        ResultsStore.close_files()
+
+    assert ResultsStore.open_files == {}